@@ -0,0 +1,11 @@
+# __main__.py
+"""Permite ejecutar la línea de comandos con: python -m crypto_project ..."""
+import sys
+from pathlib import Path
+
+# Los módulos del proyecto se importan entre sí por nombre, sin paquete
+sys.path.insert(0, str(Path(__file__).parent))
+
+from cli import main
+
+raise SystemExit(main())
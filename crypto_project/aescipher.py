@@ -1,9 +1,21 @@
 # aescipher.py
 from Crypto.Cipher import AES
 from Crypto.Random import get_random_bytes
-from Crypto.Protocol.KDF import PBKDF2
 from Crypto.Hash import HMAC, SHA256
+from contextlib import contextmanager
 import os
+import stat
+import tempfile
+import time
+
+import metrics
+from kdf import derive_key, pack_header, read_header, default_params, new_salt
+from metrics import instrumented
+
+# Tamaño de bloque para el cifrado por streaming (memoria constante)
+CHUNK_SIZE = 64 * 1024
+GCM_NONCE_SIZE = 12
+GCM_TAG_SIZE = 16
 
 # --- Utilidades ---
 def generate_aes_key(key_size_bits=256):
@@ -12,6 +24,7 @@ def generate_aes_key(key_size_bits=256):
     return get_random_bytes(key_size_bits // 8)
 
 # --- AES-GCM (recomendado: cifrado + integridad) ---
+@instrumented(bytes_arg="plaintext", rest="compute")
 def encrypt_gcm(plaintext: bytes, key: bytes):
     nonce = get_random_bytes(12)  # 96-bit recommended
     cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
@@ -19,6 +32,7 @@ def encrypt_gcm(plaintext: bytes, key: bytes):
     # devolver nonce, tag y ciphertext juntos
     return nonce, ciphertext, tag
 
+@instrumented(bytes_arg="ciphertext", rest="compute")
 def decrypt_gcm(nonce: bytes, ciphertext: bytes, tag: bytes, key: bytes):
     cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
     plaintext = cipher.decrypt_and_verify(ciphertext, tag)
@@ -26,23 +40,27 @@ def decrypt_gcm(nonce: bytes, ciphertext: bytes, tag: bytes, key: bytes):
 
 # --- AES-CBC (ejemplo). Requiere padding y HMAC para integridad ---
 from Crypto.Util.Padding import pad, unpad
+@instrumented(bytes_arg="plaintext", rest="compute")
 def encrypt_cbc(plaintext: bytes, key: bytes):
     iv = get_random_bytes(16)
     cipher = AES.new(key, AES.MODE_CBC, iv)
     ct = cipher.encrypt(pad(plaintext, AES.block_size))
     return iv, ct
 
+@instrumented(bytes_arg="ciphertext", rest="compute")
 def decrypt_cbc(iv: bytes, ciphertext: bytes, key: bytes):
     cipher = AES.new(key, AES.MODE_CBC, iv)
     pt = unpad(cipher.decrypt(ciphertext), AES.block_size)
     return pt
 
 # --- Ejemplo de HMAC (si usas CBC) ---
+@instrumented(bytes_arg="data", rest="compute")
 def compute_hmac(data: bytes, mac_key: bytes):
     h = HMAC.new(mac_key, digestmod=SHA256)
     h.update(data)
     return h.digest()
 
+@instrumented(bytes_arg="data", rest="compute")
 def verify_hmac(data: bytes, mac: bytes, mac_key: bytes):
     h = HMAC.new(mac_key, digestmod=SHA256)
     h.update(data)
@@ -61,9 +79,206 @@ def load_bytes(path):
     with open(path, "rb") as f:
         return f.read()
 
+# --- Streaming (memoria acotada) ---
+def transform_stream(transform, fin, fout, chunk_size: int = CHUNK_SIZE, length: int = None,
+                     progress=None):
+    """
+    Lee `fin` por bloques, aplica `transform` a cada bloque y escribe en `fout`.
+    
+    Args:
+        transform: Función bytes -> bytes (p. ej. cipher.encrypt)
+        fin: Objeto archivo de entrada (modo binario)
+        fout: Objeto archivo de salida (modo binario)
+        chunk_size: Tamaño de cada bloque leído
+        length: Número máximo de bytes a leer (None = hasta EOF)
+        progress: Callback opcional progress(bytes_leídos) tras cada bloque.
+            Si lanza una excepción, la operación se interrumpe
+    
+    Returns:
+        int: Bytes leídos de la entrada
+    """
+    op = metrics.current()
+    if op is not None:
+        return _transform_stream_timed(op, transform, fin, fout, chunk_size, length, progress)
+    total = 0
+    while length is None or total < length:
+        size = chunk_size if length is None else min(chunk_size, length - total)
+        chunk = fin.read(size)
+        if not chunk:
+            break
+        fout.write(transform(chunk))
+        total += len(chunk)
+        if progress:
+            progress(total)
+    return total
+
+def _transform_stream_timed(op, transform, fin, fout, chunk_size, length, progress):
+    # Igual que transform_stream, midiendo lectura, cifrado y escritura por separado
+    clock = time.perf_counter_ns
+    read_ns = compute_ns = write_ns = 0
+    total = 0
+    try:
+        while length is None or total < length:
+            size = chunk_size if length is None else min(chunk_size, length - total)
+            t0 = clock()
+            chunk = fin.read(size)
+            t1 = clock()
+            read_ns += t1 - t0
+            if not chunk:
+                break
+            data = transform(chunk)
+            t2 = clock()
+            fout.write(data)
+            t3 = clock()
+            compute_ns += t2 - t1
+            write_ns += t3 - t2
+            total += len(chunk)
+            if progress:
+                progress(total)
+    finally:
+        op.add_bytes(total)
+        op.add_phase("io_read", read_ns)
+        op.add_phase("compute", compute_ns)
+        op.add_phase("io_write", write_ns)
+    return total
+
+@contextmanager
+def atomic_output(output_file: str):
+    """
+    Abre un archivo temporal junto a `output_file` y solo lo renombra al
+    destino si el bloque termina sin excepciones. Así nunca queda en disco
+    texto plano sin autenticar ni un cifrado a medias. Todas las funciones
+    *_file_* escriben por aquí, cifren o descifren.
+    
+    Si el destino ya existe, el temporal toma sus permisos (mkstemp lo crea
+    con 0600); un archivo nuevo se queda con 0600.
+    """
+    directory = os.path.dirname(os.path.abspath(output_file))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        try:
+            os.chmod(tmp_path, stat.S_IMODE(os.stat(output_file).st_mode))
+        except FileNotFoundError:
+            pass
+        with os.fdopen(fd, "wb") as f:
+            yield f
+        os.replace(tmp_path, output_file)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+@instrumented(rest="compute")
+def encrypt_stream_gcm(fin, fout, key: bytes, chunk_size: int = CHUNK_SIZE, associated_data: bytes = None,
+                       progress=None):
+    """
+    Cifra un flujo con AES-GCM en una sola pasada.
+    
+    Formato de salida: nonce (12) + ciphertext + tag (16). El tag va al final
+    para no tener que volver atrás en la salida (sirve con pipes).
+    `associated_data` (p. ej. una cabecera ya escrita) se autentica sin cifrar.
+    
+    Returns:
+        tuple: (nonce, tag)
+    """
+    nonce = get_random_bytes(GCM_NONCE_SIZE)
+    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+    if associated_data:
+        cipher.update(associated_data)
+    fout.write(nonce)
+    transform_stream(cipher.encrypt, fin, fout, chunk_size, progress=progress)
+    tag = cipher.digest()
+    fout.write(tag)
+    return nonce, tag
+
+@instrumented(rest="compute")
+def decrypt_stream_gcm(fin, fout, key: bytes, chunk_size: int = CHUNK_SIZE, associated_data: bytes = None,
+                       progress=None):
+    """
+    Descifra un flujo producido por `encrypt_stream_gcm`.
+    
+    Se retienen siempre los últimos 16 bytes leídos, que al llegar a EOF son
+    el tag. El texto plano se escribe en `fout` antes de verificar el tag:
+    quien llama debe descartarlo si se lanza la excepción (ver
+    `decrypt_file_gcm_stream`).
+    
+    Raises:
+        ValueError: Si el flujo está truncado o la autenticación falla
+    """
+    nonce = fin.read(GCM_NONCE_SIZE)
+    if len(nonce) != GCM_NONCE_SIZE:
+        raise ValueError("Flujo cifrado incompleto")
+    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+    if associated_data:
+        cipher.update(associated_data)
+    
+    fin, fout = metrics.timed_io(fin, fout)
+    pending = b""
+    done = 0
+    while chunk := fin.read(chunk_size):
+        data = pending + chunk if pending else chunk
+        pending = data[-GCM_TAG_SIZE:]
+        body = memoryview(data)[:-GCM_TAG_SIZE]
+        if body:
+            fout.write(cipher.decrypt(body))
+        done += len(chunk)
+        if progress:
+            progress(done)
+    
+    if len(pending) != GCM_TAG_SIZE:
+        raise ValueError("Flujo cifrado incompleto")
+    cipher.verify(pending)
+
+@instrumented(rest="compute")
+def encrypt_stream_gcm_legacy(fin, fout, key: bytes, chunk_size: int = CHUNK_SIZE, progress=None):
+    """
+    Cifra un flujo en el formato de `encrypt_file_gcm`: nonce (12) + tag (16)
+    + ciphertext. El tag se conoce al final: se reserva su hueco y se rellena
+    después, por eso `fout` debe admitir seek().
+    
+    Returns:
+        tuple: (nonce, tag)
+    """
+    nonce = get_random_bytes(GCM_NONCE_SIZE)
+    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+    
+    start = fout.tell()
+    fout.write(nonce)
+    fout.write(bytes(GCM_TAG_SIZE))
+    transform_stream(cipher.encrypt, fin, fout, chunk_size, progress=progress)
+    tag = cipher.digest()
+    end = fout.tell()
+    fout.seek(start + GCM_NONCE_SIZE)
+    fout.write(tag)
+    fout.seek(end)
+    return nonce, tag
+
+@instrumented(rest="compute")
+def decrypt_stream_gcm_legacy(fin, fout, key: bytes, chunk_size: int = CHUNK_SIZE, progress=None):
+    """
+    Descifra un flujo en el formato de `encrypt_file_gcm`.
+    
+    El texto plano se escribe en `fout` antes de verificar el tag: quien
+    llama debe descartarlo si se lanza la excepción.
+    
+    Raises:
+        ValueError: Si el flujo está truncado o la autenticación falla
+    """
+    nonce = fin.read(GCM_NONCE_SIZE)
+    tag = fin.read(GCM_TAG_SIZE)
+    if len(nonce) != GCM_NONCE_SIZE or len(tag) != GCM_TAG_SIZE:
+        raise ValueError("Flujo cifrado incompleto")
+    cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+    transform_stream(cipher.decrypt, fin, fout, chunk_size, progress=progress)
+    cipher.verify(tag)
+
 # ========== CIFRADO/DESCIFRADO DE ARCHIVOS ==========
 
-def encrypt_file_gcm(input_file: str, output_file: str, key: bytes):
+@instrumented
+def encrypt_file_gcm(input_file: str, output_file: str, key: bytes, progress=None,
+                     chunk_size: int = CHUNK_SIZE):
     """
     Cifra un archivo completo usando AES-GCM.
     
@@ -71,26 +286,19 @@ def encrypt_file_gcm(input_file: str, output_file: str, key: bytes):
         input_file: Ruta del archivo a cifrar
         output_file: Ruta donde guardar el archivo cifrado
         key: Clave AES (16, 24 o 32 bytes)
+        progress: Callback opcional progress(bytes_procesados). Si lanza una
+            excepción, el cifrado se interrumpe sin dejar salida
+        chunk_size: Tamaño de cada bloque leído
     
     Returns:
         tuple: (nonce, tag) necesarios para descifrar
     """
-    # Leer archivo
-    with open(input_file, 'rb') as f:
-        plaintext = f.read()
-    
-    # Cifrar
-    nonce, ciphertext, tag = encrypt_gcm(plaintext, key)
-    
     # Guardar: nonce (12) + tag (16) + ciphertext
-    with open(output_file, 'wb') as f:
-        f.write(nonce)
-        f.write(tag)
-        f.write(ciphertext)
-    
-    return nonce, tag
+    with open(input_file, 'rb') as fin, atomic_output(output_file) as fout:
+        return encrypt_stream_gcm_legacy(fin, fout, key, chunk_size, progress)
 
-def decrypt_file_gcm(input_file: str, output_file: str, key: bytes):
+@instrumented(failure_on_false=True)
+def decrypt_file_gcm(input_file: str, output_file: str, key: bytes, progress=None):
     """
     Descifra un archivo cifrado con AES-GCM.
     
@@ -98,32 +306,241 @@ def decrypt_file_gcm(input_file: str, output_file: str, key: bytes):
         input_file: Ruta del archivo cifrado
         output_file: Ruta donde guardar el archivo descifrado
         key: Clave AES usada para cifrar
+        progress: Callback opcional progress(bytes_procesados)
     
     Returns:
         bool: True si el descifrado fue exitoso
     """
-    # Leer archivo cifrado
-    with open(input_file, 'rb') as f:
-        nonce = f.read(12)
-        tag = f.read(16)
-        ciphertext = f.read()
-    
-    # Descifrar
+    # Descifrar por bloques a un temporal; solo se publica si el tag es válido
     try:
-        plaintext = decrypt_gcm(nonce, ciphertext, tag, key)
-        
-        # Guardar
-        with open(output_file, 'wb') as f:
-            f.write(plaintext)
+        with open(input_file, 'rb') as fin, atomic_output(output_file) as fout:
+            decrypt_stream_gcm_legacy(fin, fout, key, progress=progress)
         
         return True
     except ValueError:
         print("Error: Autenticación fallida. El archivo fue modificado o la clave es incorrecta.")
         return False
 
+@instrumented
+def encrypt_file_gcm_stream(input_file: str, output_file: str, key: bytes, chunk_size: int = CHUNK_SIZE):
+    """
+    Cifra un archivo con AES-GCM por bloques, con memoria constante.
+    
+    Formato: nonce (12) + ciphertext + tag (16). A diferencia de
+    `encrypt_file_gcm`, el tag va al final (trailer).
+    
+    Args:
+        input_file: Ruta del archivo a cifrar
+        output_file: Ruta donde guardar el archivo cifrado
+        key: Clave AES (16, 24 o 32 bytes)
+        chunk_size: Tamaño de bloque de lectura
+    
+    Returns:
+        tuple: (nonce, tag)
+    """
+    with open(input_file, 'rb') as fin, atomic_output(output_file) as fout:
+        return encrypt_stream_gcm(fin, fout, key, chunk_size)
+
+@instrumented(failure_on_false=True)
+def decrypt_file_gcm_stream(input_file: str, output_file: str, key: bytes, chunk_size: int = CHUNK_SIZE):
+    """
+    Descifra un archivo producido por `encrypt_file_gcm_stream`.
+    
+    El texto plano se escribe en un temporal que solo se renombra a
+    `output_file` si el tag es válido.
+    
+    Returns:
+        bool: True si el descifrado fue exitoso
+    """
+    try:
+        with open(input_file, 'rb') as fin, atomic_output(output_file) as fout:
+            decrypt_stream_gcm(fin, fout, key, chunk_size)
+        return True
+    except ValueError:
+        print("Error: Autenticación fallida. El archivo fue modificado o la clave es incorrecta.")
+        return False
+
+# --- Cifrado con contraseña ---
+# Formato: cabecera de kdf.pack_header (KDF, parámetros y salt) + flujo de
+# encrypt_stream_gcm con la cabecera como datos asociados: alterar los
+# parámetros o el salt hace fallar la autenticación.
+
+@instrumented(rest="compute")
+def encrypt_stream_password(fin, fout, password, params: dict = None, salt: bytes = None,
+                            chunk_size: int = CHUNK_SIZE, progress=None):
+    """
+    Cifra un flujo con una clave derivada de `password`.
+    
+    Args:
+        params: Parámetros de la KDF (por defecto kdf.default_params(); ver kdf.calibrate)
+        salt: Salt a usar. Por defecto uno nuevo; para un lote se puede
+            reutilizar uno solo, así la clave se deriva una vez al cifrar y
+            otra al descifrar todo el lote (cada archivo lleva su propio nonce)
+    
+    Returns:
+        tuple: (params, salt)
+    """
+    params = params or default_params()
+    salt = salt or new_salt()
+    header = pack_header(params, salt)
+    key = derive_key(password, salt, params)
+    fout.write(header)
+    encrypt_stream_gcm(fin, fout, key, chunk_size, associated_data=header, progress=progress)
+    return params, salt
+
+@instrumented(rest="compute")
+def decrypt_stream_password(fin, fout, password, chunk_size: int = CHUNK_SIZE, progress=None):
+    """
+    Descifra un flujo de `encrypt_stream_password`. Como en
+    `decrypt_stream_gcm`, si se lanza la excepción hay que descartar la salida.
+    
+    Raises:
+        ValueError: Si no es un archivo con contraseña, la contraseña es
+            incorrecta o el contenido fue alterado
+    """
+    header, params, salt = read_header(fin)
+    key = derive_key(password, salt, params)
+    try:
+        decrypt_stream_gcm(fin, fout, key, chunk_size, associated_data=header, progress=progress)
+    except ValueError:
+        raise ValueError("Contraseña incorrecta o archivo modificado")
+
+@instrumented
+def encrypt_file_password(input_file: str, output_file: str, password, params: dict = None,
+                          salt: bytes = None, progress=None):
+    """
+    Cifra un archivo con contraseña (PBKDF2-HMAC-SHA256 o scrypt + AES-256-GCM).
+    
+    Returns:
+        tuple: (params, salt)
+    """
+    with open(input_file, 'rb') as fin, atomic_output(output_file) as fout:
+        return encrypt_stream_password(fin, fout, password, params, salt, progress=progress)
+
+@instrumented(failure_on_false=True)
+def decrypt_file_password(input_file: str, output_file: str, password, progress=None):
+    """
+    Descifra un archivo cifrado con `encrypt_file_password`.
+    
+    Returns:
+        bool: True si el descifrado fue exitoso
+    """
+    try:
+        with open(input_file, 'rb') as fin, atomic_output(output_file) as fout:
+            decrypt_stream_password(fin, fout, password, progress=progress)
+        return True
+    except ValueError as e:
+        print(f"Error al descifrar: {e}")
+        return False
+
+# --- AES-CBC + HMAC por streaming ---
+# Formato: iv (16) + mac (32) + ciphertext, con mac = HMAC-SHA256(iv + ciphertext)
+# (encrypt-then-MAC). El HMAC se actualiza con cada bloque cifrado y el
+# relleno solo afecta al último bloque, así que la memoria es constante.
+
+CBC_IV_SIZE = 16
+CBC_MAC_SIZE = 32
+
+@instrumented(rest="compute")
+def encrypt_stream_cbc(fin, fout, key: bytes, mac_key: bytes, chunk_size: int = CHUNK_SIZE, progress=None):
+    """
+    Cifra un flujo con AES-CBC + HMAC en una sola pasada.
+    
+    El HMAC se conoce al final: se reserva su hueco y se rellena después,
+    por eso `fout` debe admitir seek().
+    
+    Returns:
+        tuple: (iv, mac)
+    """
+    iv = get_random_bytes(CBC_IV_SIZE)
+    cipher = AES.new(key, AES.MODE_CBC, iv)
+    h = HMAC.new(mac_key, digestmod=SHA256)
+    h.update(iv)
+    
+    start = fout.tell()
+    fout.write(iv)
+    fout.write(bytes(CBC_MAC_SIZE))
+    
+    pending = b""
+    
+    def encrypt_blocks(chunk):
+        # Se cifran los bloques completos; el resto espera al siguiente trozo
+        nonlocal pending
+        data = pending + chunk if pending else chunk
+        cut = len(data) - len(data) % AES.block_size
+        pending = bytes(data[cut:])
+        ciphertext = cipher.encrypt(memoryview(data)[:cut]) if cut else b""
+        h.update(ciphertext)
+        return ciphertext
+    
+    transform_stream(encrypt_blocks, fin, fout, chunk_size, progress=progress)
+    last = cipher.encrypt(pad(pending, AES.block_size))
+    h.update(last)
+    fout.write(last)
+    
+    mac = h.digest()
+    end = fout.tell()
+    fout.seek(start + CBC_IV_SIZE)
+    fout.write(mac)
+    fout.seek(end)
+    return iv, mac
+
+@instrumented(rest="compute")
+def decrypt_stream_cbc(fin, fout, key: bytes, mac_key: bytes, chunk_size: int = CHUNK_SIZE,
+                       progress=None) -> int:
+    """
+    Descifra un flujo de `encrypt_stream_cbc` en una sola pasada.
+    
+    El HMAC se calcula mientras se descifra y se comprueba antes de quitar
+    el relleno del último bloque: un relleno incorrecto solo se puede
+    observar con datos ya autenticados (sin oráculo de relleno). El texto
+    plano anterior al último bloque se escribe en `fout` antes de verificar:
+    si se lanza la excepción, quien llama debe descartarlo (ver `decrypt_file_cbc`).
+    
+    Raises:
+        ValueError: Si el flujo está truncado, el HMAC no coincide o el
+            relleno es inválido
+    
+    Returns:
+        int: Bytes de texto plano escritos
+    """
+    iv = fin.read(CBC_IV_SIZE)
+    mac = fin.read(CBC_MAC_SIZE)
+    if len(iv) != CBC_IV_SIZE or len(mac) != CBC_MAC_SIZE:
+        raise ValueError("Flujo cifrado incompleto")
+    cipher = AES.new(key, AES.MODE_CBC, iv)
+    h = HMAC.new(mac_key, digestmod=SHA256)
+    h.update(iv)
+    
+    pending = b""
+    written = 0
+    
+    def decrypt_blocks(chunk):
+        # Siempre se retiene el último bloque (1-16 bytes): lleva el relleno
+        nonlocal pending, written
+        h.update(chunk)
+        data = pending + chunk if pending else chunk
+        cut = (len(data) - 1) // AES.block_size * AES.block_size
+        pending = bytes(data[cut:])
+        written += cut
+        return cipher.decrypt(memoryview(data)[:cut]) if cut else b""
+    
+    transform_stream(decrypt_blocks, fin, fout, chunk_size, progress=progress)
+    if len(pending) != AES.block_size:
+        raise ValueError("Flujo cifrado incompleto o de longitud inválida")
+    try:
+        h.verify(mac)
+    except ValueError:
+        raise ValueError("HMAC inválido. El archivo fue modificado.")
+    last = unpad(cipher.decrypt(pending), AES.block_size)
+    fout.write(last)
+    return written + len(last)
+
+@instrumented
 def encrypt_file_cbc(input_file: str, output_file: str, key: bytes, mac_key: bytes = None):
     """
-    Cifra un archivo usando AES-CBC con HMAC para integridad.
+    Cifra un archivo usando AES-CBC con HMAC para integridad (por streaming,
+    con memoria constante).
     
     Args:
         input_file: Ruta del archivo a cifrar
@@ -137,28 +554,20 @@ def encrypt_file_cbc(input_file: str, output_file: str, key: bytes, mac_key: byt
     if mac_key is None:
         mac_key = get_random_bytes(32)
     
-    # Leer archivo
-    with open(input_file, 'rb') as f:
-        plaintext = f.read()
-    
-    # Cifrar
-    iv, ciphertext = encrypt_cbc(plaintext, key)
-    
-    # Calcular HMAC
-    mac = compute_hmac(iv + ciphertext, mac_key)
-    
     # Guardar: iv (16) + mac (32) + ciphertext
-    with open(output_file, 'wb') as f:
-        f.write(iv)
-        f.write(mac)
-        f.write(ciphertext)
+    with open(input_file, 'rb') as fin, atomic_output(output_file) as fout:
+        iv, mac = encrypt_stream_cbc(fin, fout, key, mac_key)
     
     return iv, mac, mac_key
 
+@instrumented(failure_on_false=True)
 def decrypt_file_cbc(input_file: str, output_file: str, key: bytes, mac_key: bytes):
     """
     Descifra un archivo cifrado con AES-CBC y verifica HMAC.
     
+    Se descifra por bloques a un temporal que solo se renombra a
+    `output_file` si el HMAC es válido.
+    
     Args:
         input_file: Ruta del archivo cifrado
         output_file: Ruta donde guardar el archivo descifrado
@@ -168,25 +577,9 @@ def decrypt_file_cbc(input_file: str, output_file: str, key: bytes, mac_key: byt
     Returns:
         bool: True si el descifrado fue exitoso
     """
-    # Leer archivo cifrado
-    with open(input_file, 'rb') as f:
-        iv = f.read(16)
-        mac = f.read(32)
-        ciphertext = f.read()
-    
-    # Verificar HMAC
-    if not verify_hmac(iv + ciphertext, mac, mac_key):
-        print("Error: HMAC inválido. El archivo fue modificado.")
-        return False
-    
-    # Descifrar
     try:
-        plaintext = decrypt_cbc(iv, ciphertext, key)
-        
-        # Guardar
-        with open(output_file, 'wb') as f:
-            f.write(plaintext)
-        
+        with open(input_file, 'rb') as fin, atomic_output(output_file) as fout:
+            decrypt_stream_cbc(fin, fout, key, mac_key)
         return True
     except ValueError as e:
         print(f"Error al descifrar: {e}")
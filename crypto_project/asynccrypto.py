@@ -0,0 +1,250 @@
+# asynccrypto.py
+"""
+Fachada asyncio sobre aescipher, rsautils, hashutils e hybrid.
+
+Ninguna operación bloquea el bucle de eventos: el trabajo de CPU y de disco
+se delega a un executor configurable. Cada tipo de operación ("aes",
+"hash", "rsa", "keygen") tiene su propio semáforo, así que un lote de
+generaciones de claves no deja sin hueco a los hasheos.
+
+Las operaciones sobre archivos leen por bloques y comprueban entre bloque y
+bloque si la tarea se canceló: al cancelarla se detiene de verdad (no solo
+deja de esperarse) y no queda ningún archivo de salida a medias. Si el
+trabajo ya había terminado cuando llega la cancelación, se devuelve su
+resultado (la salida completa ya está en disco) en lugar de CancelledError.
+
+Uso:
+    crypto = AsyncCrypto(limits={"hash": 8})
+    digest = await crypto.calculate_file_hash("datos.bin")
+    await crypto.encrypt_file_gcm("datos.bin", "datos.enc", key)
+"""
+import asyncio
+import threading
+
+from Crypto.Cipher import AES
+from Crypto.PublicKey import RSA
+from Crypto.Random import get_random_bytes
+
+import aescipher
+import hybrid
+from aescipher import (
+    atomic_output, decrypt_stream_gcm_legacy, CHUNK_SIZE, GCM_NONCE_SIZE, GCM_TAG_SIZE
+)
+from hashutils import new_hash, hash_file, DEFAULT_ALGORITHM
+from hybrid import decrypt_file_hybrid
+from rsautils import generate_rsa_keypair, sign_file, verify_file, RsaKeyContext
+
+DEFAULT_LIMITS = {"aes": 4, "hash": 4, "rsa": 4, "keygen": 2}
+
+# Bloques menores se cifran en el propio bucle: delegarlos cuesta más que cifrarlos
+INLINE_LIMIT = 16 * 1024
+
+class OperationCancelled(Exception):
+    """Se lanza dentro del hilo de trabajo cuando la tarea asyncio se canceló."""
+
+def _cancellation_check(cancelled: threading.Event):
+    """Callback de progreso que aborta la operación en cuanto se pide cancelar."""
+    def check(done):
+        if cancelled.is_set():
+            raise OperationCancelled()
+    return check
+
+def _portable_key(key):
+    # Los RsaKey no se pueden serializar para un ProcessPoolExecutor: viajan
+    # como PEM y el proceso de trabajo los carga con la caché de rsautils
+    return key.export_key() if isinstance(key, RSA.RsaKey) else key
+
+def _rsa_encrypt(public_key, message: bytes) -> bytes:
+    return RsaKeyContext(public_key).encrypt(message)
+
+def _rsa_decrypt(private_key, ciphertext: bytes) -> bytes:
+    return RsaKeyContext(private_key).decrypt(ciphertext)
+
+class AsyncCrypto:
+    """
+    Args:
+        executor: Executor para E/S y cifrado simétrico (None = el del bucle)
+        cpu_executor: Executor para RSA (generación y firmas). Puede ser un
+            ProcessPoolExecutor; None = el mismo que `executor`
+        limits: Concurrencia máxima por tipo de operación (se combina con DEFAULT_LIMITS)
+        chunk_size: Tamaño de bloque de lectura
+    """
+
+    def __init__(self, executor=None, cpu_executor=None, limits: dict = None,
+                 chunk_size: int = CHUNK_SIZE):
+        self.executor = executor
+        self.cpu_executor = cpu_executor or executor
+        self.chunk_size = chunk_size
+        self.limits = {**DEFAULT_LIMITS, **(limits or {})}
+        self._semaphores = {op: asyncio.Semaphore(n) for op, n in self.limits.items()}
+
+    # --- Delegación al executor ---
+    async def _offload(self, op: str, func, *args, executor=None):
+        loop = asyncio.get_running_loop()
+        async with self._semaphores[op]:
+            return await loop.run_in_executor(executor or self.executor, func, *args)
+
+    async def _offload_cancellable(self, op: str, job):
+        """
+        Ejecuta job(cancelled) en el executor. Si la tarea se cancela, se
+        avisa al hilo con `cancelled` y se espera a que suelte sus recursos
+        (temporales incluidos) antes de propagar la cancelación. Si el hilo
+        terminó sin llegar a ver el aviso, se devuelve su resultado: decir
+        "cancelada" con la salida ya escrita engañaría a quien llama.
+        """
+        loop = asyncio.get_running_loop()
+        cancelled = threading.Event()
+        async with self._semaphores[op]:
+            future = loop.run_in_executor(self.executor, job, cancelled)
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                cancelled.set()
+                try:
+                    result = await future
+                except Exception:
+                    raise asyncio.CancelledError()  # OperationCancelled o un error ya irrelevante
+                return result
+
+    # --- AES-GCM sobre archivos ---
+    async def encrypt_file_gcm(self, input_file: str, output_file: str, key: bytes):
+        """Como aescipher.encrypt_file_gcm (mismo formato). Returns: (nonce, tag)"""
+        def job(cancelled):
+            return aescipher.encrypt_file_gcm(input_file, output_file, key,
+                                              _cancellation_check(cancelled), self.chunk_size)
+        return await self._offload_cancellable("aes", job)
+
+    async def decrypt_file_gcm(self, input_file: str, output_file: str, key: bytes):
+        """
+        Como aescipher.decrypt_file_gcm, pero lanza ValueError en lugar de
+        devolver False si la autenticación falla.
+        """
+        # No se delega en aescipher.decrypt_file_gcm: ese captura el ValueError
+        def job(cancelled):
+            with open(input_file, 'rb') as fin, atomic_output(output_file) as fout:
+                decrypt_stream_gcm_legacy(fin, fout, key, self.chunk_size,
+                                          _cancellation_check(cancelled))
+        await self._offload_cancellable("aes", job)
+
+    # --- AES-GCM sobre flujos asyncio ---
+    async def _transform(self, transform, chunk: bytes) -> bytes:
+        if len(chunk) <= INLINE_LIMIT:
+            return transform(chunk)
+        return await self._offload("aes", transform, chunk)
+
+    async def encrypt_stream_gcm(self, reader, writer, key: bytes, associated_data: bytes = None):
+        """
+        Cifra de un asyncio.StreamReader a un StreamWriter, con el formato de
+        aescipher.encrypt_stream_gcm (nonce + ciphertext + tag).
+
+        Tras cada bloque se espera a writer.drain(): si el consumidor es más
+        lento, se deja de leer (contrapresión) en vez de acumular en memoria.
+
+        Returns:
+            tuple: (nonce, tag)
+        """
+        nonce = get_random_bytes(GCM_NONCE_SIZE)
+        cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+        if associated_data:
+            cipher.update(associated_data)
+        writer.write(nonce)
+        while chunk := await reader.read(self.chunk_size):
+            writer.write(await self._transform(cipher.encrypt, chunk))
+            await writer.drain()
+        tag = cipher.digest()
+        writer.write(tag)
+        await writer.drain()
+        return nonce, tag
+
+    async def decrypt_stream_gcm(self, reader, writer, key: bytes, associated_data: bytes = None):
+        """
+        Descifra un flujo de encrypt_stream_gcm. Como en la versión síncrona,
+        el texto plano sale antes de verificar el tag: si se lanza ValueError
+        el receptor debe descartar lo recibido.
+
+        Raises:
+            ValueError: Si el flujo está truncado o la autenticación falla
+        """
+        try:
+            nonce = await reader.readexactly(GCM_NONCE_SIZE)
+        except asyncio.IncompleteReadError:
+            raise ValueError("Flujo cifrado incompleto")
+        cipher = AES.new(key, AES.MODE_GCM, nonce=nonce)
+        if associated_data:
+            cipher.update(associated_data)
+        pending = b""
+        while chunk := await reader.read(self.chunk_size):
+            data = pending + chunk if pending else chunk
+            pending = data[-GCM_TAG_SIZE:]
+            body = data[:-GCM_TAG_SIZE]
+            if body:
+                writer.write(await self._transform(cipher.decrypt, body))
+                await writer.drain()
+        if len(pending) != GCM_TAG_SIZE:
+            raise ValueError("Flujo cifrado incompleto")
+        cipher.verify(pending)
+
+    # --- Hash ---
+    async def calculate_file_hash(self, filepath: str, algorithm: str = DEFAULT_ALGORITHM) -> str:
+        """Como hashutils.calculate_file_hash, cancelable entre bloques."""
+        def job(cancelled):
+            return hash_file(filepath, new_hash(algorithm),
+                             progress=_cancellation_check(cancelled)).hexdigest()
+        return await self._offload_cancellable("hash", job)
+
+    async def hash_stream(self, reader, algorithm: str = DEFAULT_ALGORITHM) -> str:
+        """Hash de todo lo que llegue por un asyncio.StreamReader."""
+        h = new_hash(algorithm)
+        while chunk := await reader.read(self.chunk_size):
+            if len(chunk) <= INLINE_LIMIT:
+                h.update(chunk)
+            else:
+                await self._offload("hash", h.update, chunk)
+        return h.hexdigest()
+
+    # --- RSA ---
+    async def generate_rsa_keypair(self, bits: int = 2048):
+        """Returns: (private_pem, public_pem)"""
+        return await self._offload("keygen", generate_rsa_keypair, bits, executor=self.cpu_executor)
+
+    async def sign_file(self, path: str, private_key) -> bytes:
+        return await self._offload("rsa", sign_file, path, _portable_key(private_key),
+                                   executor=self.cpu_executor)
+
+    async def verify_file(self, path: str, signature: bytes, public_key) -> bool:
+        return await self._offload("rsa", verify_file, path, signature, _portable_key(public_key),
+                                   executor=self.cpu_executor)
+
+    async def rsa_encrypt(self, message: bytes, public_key) -> bytes:
+        return await self._offload("rsa", _rsa_encrypt, _portable_key(public_key), message,
+                                   executor=self.cpu_executor)
+
+    async def rsa_decrypt(self, ciphertext: bytes, private_key) -> bytes:
+        return await self._offload("rsa", _rsa_decrypt, _portable_key(private_key), ciphertext,
+                                   executor=self.cpu_executor)
+
+    # --- Híbrido ---
+    async def encrypt_path_hybrid(self, input_file: str, output_file: str, rsa_pub_pem: bytes):
+        """Como hybrid.encrypt_path_hybrid. Returns: (enc_key, nonce, tag)"""
+        def job(cancelled):
+            return hybrid.encrypt_path_hybrid(input_file, output_file, rsa_pub_pem,
+                                              self.chunk_size, _cancellation_check(cancelled))
+        return await self._offload_cancellable("aes", job)
+
+    async def decrypt_path_hybrid(self, input_file: str, output_file: str, rsa_priv_pem: bytes) -> int:
+        """
+        Como hybrid.decrypt_path_hybrid.
+
+        Raises:
+            ValueError: Si el paquete está dañado o la clave no corresponde
+        """
+        def job(cancelled):
+            return hybrid.decrypt_path_hybrid(input_file, output_file, rsa_priv_pem,
+                                              self.chunk_size, _cancellation_check(cancelled))
+        return await self._offload_cancellable("aes", job)
+
+    async def decrypt_file_hybrid(self, enc_key: bytes, nonce: bytes, tag: bytes,
+                                  ciphertext: bytes, rsa_priv_pem: bytes) -> bytes:
+        """Como hybrid.decrypt_file_hybrid (en memoria)."""
+        return await self._offload("rsa", decrypt_file_hybrid, enc_key, nonce, tag,
+                                   ciphertext, rsa_priv_pem, executor=self.cpu_executor)
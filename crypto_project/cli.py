@@ -0,0 +1,642 @@
+# cli.py
+"""
+Línea de comandos del proyecto.
+
+    python -m crypto_project <comando> [opciones]
+
+Comandos:
+    keygen aes|rsa          Generar claves
+    aes encrypt|decrypt     AES-GCM sobre archivos o tuberías
+    hybrid encrypt|decrypt  Esquema híbrido AES + RSA
+    sign / verify-sig       Firma RSA-PSS de archivos
+    hash                    Hash de archivos
+    register / verify       Base de datos de integridad
+    duplicates              Buscar archivos duplicados
+    migrate                 Migrar una base JSON de hashes a SQLite
+    watch                   Vigilar la base de integridad y rehashear lo que cambie
+
+"-" como entrada o salida es stdin/stdout, para usarlo en tuberías:
+
+    tar c datos/ | python -m crypto_project aes encrypt - --key clave.bin > datos.tar.enc
+
+En lugar de una clave, aes acepta una contraseña (--password la pide por
+terminal, --password-file la lee de un archivo). Un lote cifrado con
+contraseña comparte el salt, así que la clave se deriva una sola vez.
+
+Con varias entradas (o globs entre comillas, o --from-file) se trabaja por
+lotes con --workers hilos. --json imprime un resultado legible por máquina
+con los tiempos de cada operación; --metrics guarda además el desglose por
+fases (lectura, cálculo, escritura) de metrics.py. Código de salida: 0 si todo fue bien, 1
+si alguna operación falló, 2 si hay un error de uso.
+"""
+import argparse
+import getpass
+import glob
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from aescipher import (
+    generate_aes_key, atomic_output, encrypt_stream_gcm, decrypt_stream_gcm,
+    encrypt_stream_gcm_legacy, decrypt_stream_gcm_legacy,
+    encrypt_stream_password, decrypt_stream_password
+)
+from hashdb import migrate_json_to_sqlite
+from hashutils import (
+    hash_file, new_hash, register_files, iter_verify_files, find_duplicates,
+    HASH_ALGORITHMS, DEFAULT_ALGORITHM, MERKLE_LEAF_SIZE
+)
+from hybrid import encrypt_stream_hybrid, decrypt_stream_hybrid
+import kdf
+import metrics
+from rsautils import generate_rsa_keypair, sign_file, verify_file, sign_stream, verify_stream
+from watcher import IntegrityMonitor, DEBOUNCE_SECONDS, MAX_REHASH_PER_SECOND
+
+STDIO = "-"
+COPY_CHUNK_SIZE = 1024 * 1024
+
+class CliError(Exception):
+    """Error de uso: se informa sin traza y se sale con código 2."""
+
+# ========== ENTRADAS Y SALIDAS ==========
+
+class _CountingReader:
+    """Envoltorio que cuenta los bytes leídos (para las estadísticas)."""
+
+    def __init__(self, f):
+        self._f = f
+        self.count = 0
+
+    def read(self, size: int = -1) -> bytes:
+        data = self._f.read(size)
+        self.count += len(data)
+        return data
+
+@contextmanager
+def open_input(path: str):
+    if path == STDIO:
+        yield sys.stdin.buffer
+    else:
+        with open(path, 'rb') as f:
+            yield f
+
+@contextmanager
+def open_output(path: str, buffered: bool = False):
+    """
+    Archivos: temporal + renombrado, así nunca queda una salida a medias.
+    stdout: directo o, si `buffered`, a través de un temporal que se vuelca
+    al terminar sin errores (formatos que necesitan seek y descifrados, para
+    que solo salga texto plano ya autenticado).
+    """
+    if path != STDIO:
+        with atomic_output(path) as f:
+            yield f
+    elif not buffered:
+        yield sys.stdout.buffer
+        sys.stdout.buffer.flush()
+    else:
+        with tempfile.TemporaryFile() as tmp:
+            yield tmp
+            tmp.seek(0)
+            shutil.copyfileobj(tmp, sys.stdout.buffer, COPY_CHUNK_SIZE)
+            sys.stdout.buffer.flush()
+
+def expand_inputs(patterns, from_file: str = None) -> list:
+    """Expande globs (también **) y añade las rutas de --from-file (una por línea)."""
+    paths = []
+    for pattern in patterns:
+        if pattern != STDIO and any(c in pattern for c in "*?["):
+            matches = sorted(p for p in glob.glob(pattern, recursive=True) if os.path.isfile(p))
+            if not matches:
+                raise CliError(f"Ningún archivo coincide con {pattern}")
+            paths.extend(matches)
+        else:
+            paths.append(pattern)
+    if from_file:
+        with open_input(from_file) as f:
+            paths.extend(line.strip() for line in f.read().decode().splitlines() if line.strip())
+    if not paths:
+        raise CliError("No se indicó ninguna entrada")
+    if paths.count(STDIO) > 1 or (STDIO in paths and len(paths) > 1 and from_file == STDIO):
+        raise CliError("stdin solo se puede usar una vez")
+    return paths
+
+def plan_outputs(inputs: list, args, suffix: str, strip: str = None) -> list:
+    """Empareja cada entrada con su salida: -o para una sola, --output-dir o sufijo para lotes."""
+    if args.output and len(inputs) > 1:
+        raise CliError("-o solo admite una entrada; para lotes usa --output-dir")
+    items = []
+    for src in inputs:
+        if args.output:
+            dst = args.output
+        elif src == STDIO:
+            dst = STDIO
+        else:
+            dst = src[:-len(strip)] if strip and src.endswith(strip) else src + suffix
+            if args.output_dir:
+                dst = os.path.join(args.output_dir, os.path.basename(dst))
+        items.append((src, dst))
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+    return items
+
+# ========== CLAVES ==========
+
+def read_aes_key(args) -> bytes:
+    """Clave AES de --key-hex o de --key (archivo binario de 16/24/32 bytes o texto hexadecimal)."""
+    if args.key_hex:
+        data = args.key_hex.encode()
+    elif args.key:
+        with open(args.key, 'rb') as f:
+            data = f.read()
+    else:
+        raise CliError("Falta la clave AES (--key o --key-hex)")
+    # Primero como texto hexadecimal; si no lo es, como clave binaria
+    try:
+        key = bytes.fromhex(data.decode().strip())
+    except ValueError:
+        key = data if args.key else b""
+    if len(key) not in (16, 24, 32):
+        raise CliError("La clave AES debe tener 16, 24 o 32 bytes (binaria o en hexadecimal)")
+    return key
+
+def read_password(args):
+    """Contraseña de --password-file (primera línea) o pedida por terminal con --password; None si no hay."""
+    if args.password_file:
+        with open(args.password_file, encoding='utf-8') as f:
+            password = f.readline().rstrip("\r\n")
+    elif args.password:
+        password = getpass.getpass("Contraseña: ")
+        if args.action == "encrypt" and getpass.getpass("Repite la contraseña: ") != password:
+            raise CliError("Las contraseñas no coinciden")
+    else:
+        return None
+    if args.key or args.key_hex:
+        raise CliError("Usa una clave o una contraseña, no ambas")
+    if not password:
+        raise CliError("La contraseña está vacía")
+    return password
+
+def read_pem(path: str, what: str) -> bytes:
+    if not path:
+        raise CliError(f"Falta la clave {what} (PEM)")
+    with open(path, 'rb') as f:
+        return f.read()
+
+# ========== EJECUCIÓN POR LOTES ==========
+
+def run_batch(items, func, workers: int = 1) -> list:
+    """
+    Ejecuta func(entrada, salida) para cada par, en paralelo si workers > 1.
+
+    Returns:
+        list: Un dict por operación, en el orden de `items`: input, output,
+            ok, seconds, y lo que devuelva func (p. ej. bytes → mb_per_s).
+            Una excepción se registra como ok=False con su mensaje.
+    """
+    def run_one(item):
+        src, dst = item
+        result = {"input": src, "output": dst, "ok": True}
+        start = time.perf_counter()
+        try:
+            result.update(func(src, dst) or {})
+        except Exception as e:
+            result.update(ok=False, error=str(e) or type(e).__name__)
+        seconds = time.perf_counter() - start
+        result["seconds"] = round(seconds, 6)
+        if result.get("bytes") and seconds > 0:
+            result["mb_per_s"] = round(result["bytes"] / (1024 * 1024) / seconds, 2)
+        return result
+
+    if workers <= 1 or len(items) <= 1:
+        return [run_one(item) for item in items]
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(run_one, items))
+
+def _default_line(r: dict) -> str:
+    if not r["ok"]:
+        return f"✗ {r['input']}: {r.get('error', 'falló')}"
+    line = f"✓ {r['input']}"
+    if r.get("output") and r["output"] != r["input"]:
+        line += f" -> {r['output']}"
+    if "bytes" in r:
+        line += f" ({r['bytes']} bytes, {r['seconds']:.3f} s"
+        line += f", {r['mb_per_s']:.1f} MB/s)" if "mb_per_s" in r else ")"
+    return line
+
+def report(command: str, results: list, args, started: float, line=_default_line) -> int:
+    """Imprime los resultados (texto o JSON) y devuelve el código de salida."""
+    failed = sum(1 for r in results if not r["ok"])
+    # Si stdout lleva datos, los mensajes van a stderr para no mezclarlos
+    stream = sys.stderr if any(r.get("output") == STDIO for r in results) else sys.stdout
+    if args.json:
+        json.dump({
+            "command": command,
+            "ok": failed == 0,
+            "count": len(results),
+            "failed": failed,
+            "seconds": round(time.perf_counter() - started, 6),
+            "results": results
+        }, stream, indent=2, ensure_ascii=False)
+        stream.write("\n")
+    else:
+        for r in results:
+            print(line(r), file=stream)
+        if len(results) > 1:
+            print(f"{len(results) - failed}/{len(results)} correctos en "
+                  f"{time.perf_counter() - started:.2f} s", file=stream)
+    return 1 if failed else 0
+
+# ========== COMANDOS ==========
+
+def cmd_keygen(args, started):
+    if args.kind == "aes":
+        key = generate_aes_key(args.bits or 256)
+        if args.output:
+            with atomic_output(args.output) as f:
+                f.write(key)
+            result = {"input": None, "output": args.output, "ok": True, "bits": len(key) * 8}
+        else:
+            result = {"input": None, "output": None, "ok": True, "bits": len(key) * 8, "key_hex": key.hex()}
+        return report("keygen", [result], args, started,
+                      lambda r: r.get("key_hex") or f"✓ Clave AES-{r['bits']} guardada en {r['output']}")
+
+    if not args.private or not args.public:
+        raise CliError("keygen rsa necesita --private y --public")
+    priv, pub = generate_rsa_keypair(args.bits or 2048)
+    with atomic_output(args.private) as f:
+        f.write(priv)
+    with open(args.public, 'wb') as f:
+        f.write(pub)
+    result = {"input": None, "output": args.private, "public": args.public, "ok": True,
+              "bits": args.bits or 2048}
+    return report("keygen", [result], args, started,
+                  lambda r: f"✓ Claves RSA-{r['bits']}: {r['output']} (privada), {r['public']} (pública)")
+
+def cmd_aes_password(args, started, password):
+    inputs = expand_inputs(args.inputs, args.from_file)
+    if args.action == "encrypt":
+        if args.calibrate:
+            params = kdf.calibrate(args.calibrate, args.kdf)
+        else:
+            params = kdf.default_params(args.kdf)
+        salt = kdf.new_salt()  # uno por lote: descifrarlo entero deriva la clave una vez
+
+        def work(src, dst):
+            with open_input(src) as fin, open_output(dst, buffered=False) as fout:
+                reader = _CountingReader(fin)
+                encrypt_stream_password(reader, fout, password, params, salt)
+            return {"bytes": reader.count}
+        items = plan_outputs(inputs, args, ".enc")
+    else:
+        def work(src, dst):
+            with open_input(src) as fin, open_output(dst, buffered=True) as fout:
+                reader = _CountingReader(fin)
+                decrypt_stream_password(reader, fout, password)
+            return {"bytes": reader.count}
+        items = plan_outputs(inputs, args, ".dec", strip=".enc")
+    return report(f"aes {args.action}", run_batch(items, work, args.workers), args, started)
+
+def cmd_aes(args, started):
+    password = read_password(args)
+    if password is not None:
+        return cmd_aes_password(args, started, password)
+    key = read_aes_key(args)
+    legacy = args.format == "gcm"
+    inputs = expand_inputs(args.inputs, args.from_file)
+
+    if args.action == "encrypt":
+        def work(src, dst):
+            with open_input(src) as fin, open_output(dst, buffered=legacy) as fout:
+                reader = _CountingReader(fin)
+                if legacy:
+                    encrypt_stream_gcm_legacy(reader, fout, key)
+                else:
+                    encrypt_stream_gcm(reader, fout, key)
+            return {"bytes": reader.count}
+        items = plan_outputs(inputs, args, ".enc")
+    else:
+        def work(src, dst):
+            with open_input(src) as fin, open_output(dst, buffered=True) as fout:
+                reader = _CountingReader(fin)
+                try:
+                    if legacy:
+                        decrypt_stream_gcm_legacy(reader, fout, key)
+                    else:
+                        decrypt_stream_gcm(reader, fout, key)
+                except ValueError:
+                    raise ValueError("Autenticación fallida: archivo modificado o clave incorrecta")
+            return {"bytes": reader.count}
+        items = plan_outputs(inputs, args, ".dec", strip=".enc")
+    return report(f"aes {args.action}", run_batch(items, work, args.workers), args, started)
+
+def cmd_hybrid(args, started):
+    inputs = expand_inputs(args.inputs, args.from_file)
+    if args.action == "encrypt":
+        public_pem = read_pem(args.public, "pública")
+
+        def work(src, dst):
+            with open_input(src) as fin, open_output(dst, buffered=True) as fout:
+                reader = _CountingReader(fin)
+                encrypt_stream_hybrid(reader, fout, public_pem)
+            return {"bytes": reader.count}
+        items = plan_outputs(inputs, args, ".hybrid")
+    else:
+        private_pem = read_pem(args.private, "privada")
+
+        def work(src, dst):
+            with open_input(src) as fin, open_output(dst, buffered=True) as fout:
+                reader = _CountingReader(fin)
+                decrypt_stream_hybrid(reader, fout, private_pem)
+            return {"bytes": reader.count}
+        items = plan_outputs(inputs, args, ".dec", strip=".hybrid")
+    return report(f"hybrid {args.action}", run_batch(items, work, args.workers), args, started)
+
+def cmd_sign(args, started):
+    private_pem = read_pem(args.private, "privada")
+    inputs = expand_inputs(args.inputs, args.from_file)
+
+    def work(src, dst):
+        if src == STDIO:
+            signature = sign_stream(sys.stdin.buffer, private_pem)
+        else:
+            signature = sign_file(src, private_pem)
+        if dst != STDIO:
+            with atomic_output(dst) as f:
+                f.write(signature)
+        return {"signature_hex": signature.hex()}
+
+    items = plan_outputs(inputs, args, ".sig")
+    results = run_batch(items, work, args.workers)
+    # La firma de stdin va en hexadecimal a stdout; no es un archivo de salida
+    stream_results = [dict(r, output=None) if r["output"] == STDIO else r for r in results]
+    return report("sign", stream_results, args, started,
+                  lambda r: r["signature_hex"] if r["ok"] and r["input"] == STDIO else _default_line(r))
+
+def cmd_verify_sig(args, started):
+    public_pem = read_pem(args.public, "pública")
+    inputs = expand_inputs(args.inputs, args.from_file)
+    if args.signature and len(inputs) > 1:
+        raise CliError("--signature solo admite una entrada")
+
+    def work(src, _):
+        sig_path = args.signature or (None if src == STDIO else src + ".sig")
+        if sig_path is None:
+            raise CliError("Con stdin hay que indicar --signature")
+        with open(sig_path, 'rb') as f:
+            signature = f.read()
+        if src == STDIO:
+            valid = verify_stream(sys.stdin.buffer, signature, public_pem)
+        else:
+            valid = verify_file(src, signature, public_pem)
+        if not valid:
+            raise ValueError("Firma inválida")
+        return {"signature": sig_path}
+
+    results = run_batch([(src, None) for src in inputs], work, args.workers)
+    return report("verify-sig", results, args, started,
+                  lambda r: f"✓ {r['input']}: firma válida" if r["ok"] else _default_line(r))
+
+def cmd_hash(args, started):
+    inputs = expand_inputs(args.inputs, args.from_file)
+
+    def work(src, _):
+        if src == STDIO:
+            h = new_hash(args.algorithm)
+            size = 0
+            while chunk := sys.stdin.buffer.read(COPY_CHUNK_SIZE):
+                h.update(chunk)
+                size += len(chunk)
+        else:
+            h = hash_file(src, new_hash(args.algorithm))
+            size = os.path.getsize(src)
+        return {"hash": h.hexdigest(), "algorithm": args.algorithm, "bytes": size}
+
+    results = run_batch([(src, None) for src in inputs], work, args.workers)
+    # Mismo formato que sha256sum: "<hash>  <archivo>"
+    return report("hash", results, args, started,
+                  lambda r: f"{r['hash']}  {r['input']}" if r["ok"] else _default_line(r))
+
+def cmd_register(args, started):
+    inputs = expand_inputs(args.inputs, args.from_file)
+
+    def show_progress(count, size, filepath):
+        if count % 1000 == 0 and not args.json:
+            print(f"  {count} archivos, {size / (1024 * 1024):.1f} MB...", file=sys.stderr)
+
+    summary = register_files(inputs, args.db, recursive=not args.no_recursive, workers=args.workers,
+                             progress=show_progress, algorithm=args.algorithm, merkle=args.merkle,
+                             leaf_size=args.leaf_size)
+    results = [{"input": path, "output": args.db, "ok": False, "error": error, "seconds": 0.0}
+               for path, error in summary["errors"].items()]
+    results.insert(0, {"input": ", ".join(inputs), "output": args.db, "ok": True,
+                       "files": summary["files"], "bytes": summary["bytes"],
+                       "seconds": round(summary["seconds"], 6),
+                       "mb_per_s": round(summary["mb_per_s"], 2),
+                       "files_per_s": round(summary["files_per_s"], 1)})
+    return report("register", results, args, started,
+                  lambda r: f"✓ {r['files']} archivos registrados en {r['output']} "
+                            f"({r['mb_per_s']:.1f} MB/s, {r['files_per_s']:.0f} archivos/s)"
+                  if r["ok"] else _default_line(r))
+
+def cmd_verify(args, started):
+    results = []
+    for res in iter_verify_files(args.db, workers=args.workers, incremental=args.incremental,
+                                 paranoid=args.paranoid, sample_rate=args.sample, ordered=True):
+        results.append({
+            "input": res["filepath"], "output": None, "ok": res["valid"],
+            "skipped": res["skipped"], "message": res["message"],
+            "changed_ranges": res.get("changed_ranges"),
+            **({} if res["valid"] else {"error": res["message"]})
+        })
+    # En modo texto solo se listan los problemas
+    code = report("verify", [r for r in results if not r["ok"]] if not args.json else results,
+                  args, started)
+    if not args.json:
+        print(f"Total: {len(results)} | Modificados: {sum(not r['ok'] for r in results)} | "
+              f"Sin rehashear: {sum(r['skipped'] for r in results)}")
+    return code
+
+def cmd_duplicates(args, started):
+    inputs = expand_inputs(args.inputs, args.from_file)
+    groups = find_duplicates(inputs, args.db if args.use_db else None, workers=args.workers)
+    results = [{"input": paths[0], "output": None, "ok": True,
+                "bytes": os.path.getsize(paths[0]), "duplicates": paths} for paths in groups]
+    code = report("duplicates", results, args, started,
+                  lambda r: "\n".join([f"{r['bytes']} bytes x {len(r['duplicates'])}:"] +
+                                      [f"  {path}" for path in r["duplicates"]]))
+    if not args.json:
+        print(f"Grupos de duplicados: {len(groups)}")
+    return code
+
+def cmd_migrate(args, started):
+    count = migrate_json_to_sqlite(args.json_file, args.sqlite_file)
+    return report("migrate", [{"input": args.json_file, "output": args.sqlite_file, "ok": True,
+                               "entries": count}], args, started,
+                  lambda r: f"✓ {r['entries']} entradas migradas a {r['output']}")
+
+def _watch_line(event: dict) -> str:
+    if event["event"] == "changed":
+        mark = "✅" if event["result"]["valid"] else "❌"
+        return f"{mark} {event['path']}: {event['result']['message']}"
+    if event["event"] == "moved":
+        return f"↪️  {event['path']} -> {event['dest']}: {event['result']['message']}"
+    if event["event"] == "deleted":
+        return f"🗑️  {event['path']}: eliminado"
+    return "⚠️ Se perdieron eventos del sistema; revisando todos los archivos"
+
+def cmd_watch(args, started):
+    # Los eventos se imprimen según llegan; con --json, uno por línea
+    def show(event):
+        print(json.dumps(event, ensure_ascii=False, default=str) if args.json else _watch_line(event),
+              flush=True)
+
+    monitor = IntegrityMonitor(args.db, on_event=show, debounce=args.debounce,
+                               max_rehash_per_s=args.rate, backend=args.backend)
+    if not args.json:
+        print(f"Vigilando {args.db} (Ctrl+C para salir)", flush=True)
+    monitor.run_forever()
+    return 0
+
+# ========== ANALIZADOR DE ARGUMENTOS ==========
+
+def positive_float(value: str) -> float:
+    """Tipo argparse para números estrictamente positivos (p. ej. --rate)."""
+    try:
+        number = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"no es un número: {value}")
+    if not number > 0:
+        raise argparse.ArgumentTypeError(f"debe ser mayor que 0: {value}")
+    return number
+
+def build_parser() -> argparse.ArgumentParser:
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument("--json", action="store_true", help="Salida JSON con tiempos")
+    common.add_argument("--workers", type=int, default=1, help="Operaciones en paralelo (lotes)")
+    common.add_argument("--metrics", metavar="ARCHIVO",
+                        help="Guardar métricas por operación y fase (.prom = Prometheus, si no JSON)")
+
+    batch = argparse.ArgumentParser(add_help=False)
+    batch.add_argument("inputs", nargs="*", default=[], help="Archivos, globs o - (stdin)")
+    batch.add_argument("--from-file", help="Lista de archivos, uno por línea (- = stdin)")
+
+    outputs = argparse.ArgumentParser(add_help=False)
+    outputs.add_argument("-o", "--output", help="Salida (una sola entrada; - = stdout)")
+    outputs.add_argument("--output-dir", help="Directorio de salida para lotes")
+
+    parser = argparse.ArgumentParser(prog="python -m crypto_project",
+                                     description="Herramientas criptográficas del proyecto")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    keygen = sub.add_parser("keygen", parents=[common], help="Generar claves")
+    keygen.add_argument("kind", choices=("aes", "rsa"))
+    keygen.add_argument("--bits", type=int, help="AES: 128/192/256 (256). RSA: 2048 por defecto")
+    keygen.add_argument("-o", "--output", help="AES: archivo de clave (sin -o, hex por stdout)")
+    keygen.add_argument("--private", help="RSA: archivo de la clave privada")
+    keygen.add_argument("--public", help="RSA: archivo de la clave pública")
+    keygen.set_defaults(func=cmd_keygen)
+
+    aes = sub.add_parser("aes", help="Cifrado AES-GCM")
+    aes_sub = aes.add_subparsers(dest="action", required=True)
+    for action in ("encrypt", "decrypt"):
+        p = aes_sub.add_parser(action, parents=[common, batch, outputs])
+        p.add_argument("--key", help="Archivo de clave (binaria o hex)")
+        p.add_argument("--key-hex", help="Clave en hexadecimal")
+        p.add_argument("--format", choices=("gcm", "stream"), default="gcm",
+                       help="gcm: nonce+tag+datos (el de la GUI); stream: tag al final")
+        p.add_argument("--password", action="store_true", help="Pedir una contraseña en lugar de la clave")
+        p.add_argument("--password-file", help="Archivo con la contraseña (primera línea)")
+        if action == "encrypt":
+            p.add_argument("--kdf", choices=(kdf.KDF_PBKDF2, kdf.KDF_SCRYPT), default=kdf.KDF_PBKDF2,
+                           help="Derivación de la clave a partir de la contraseña")
+            p.add_argument("--calibrate", type=float, metavar="SEGUNDOS",
+                           help="Ajustar el coste de la KDF para que tarde SEGUNDOS en esta máquina")
+        p.set_defaults(func=cmd_aes)
+
+    hybrid = sub.add_parser("hybrid", help="Esquema híbrido AES + RSA")
+    hybrid_sub = hybrid.add_subparsers(dest="action", required=True)
+    enc = hybrid_sub.add_parser("encrypt", parents=[common, batch, outputs])
+    enc.add_argument("--public", help="Clave pública del destinatario (PEM)")
+    enc.set_defaults(func=cmd_hybrid)
+    dec = hybrid_sub.add_parser("decrypt", parents=[common, batch, outputs])
+    dec.add_argument("--private", help="Clave privada (PEM)")
+    dec.set_defaults(func=cmd_hybrid)
+
+    sign = sub.add_parser("sign", parents=[common, batch, outputs], help="Firmar archivos (RSA-PSS)")
+    sign.add_argument("--private", help="Clave privada (PEM)")
+    sign.set_defaults(func=cmd_sign)
+
+    verify_sig = sub.add_parser("verify-sig", parents=[common, batch], help="Verificar firmas")
+    verify_sig.add_argument("--public", help="Clave pública (PEM)")
+    verify_sig.add_argument("--signature", help="Archivo de firma (por defecto <archivo>.sig)")
+    verify_sig.set_defaults(func=cmd_verify_sig)
+
+    hash_cmd = sub.add_parser("hash", parents=[common, batch], help="Hash de archivos")
+    hash_cmd.add_argument("--algorithm", default=DEFAULT_ALGORITHM, choices=sorted(HASH_ALGORITHMS))
+    hash_cmd.set_defaults(func=cmd_hash)
+
+    register = sub.add_parser("register", parents=[common, batch],
+                              help="Registrar archivos o directorios en la base de integridad")
+    register.add_argument("--db", default="hash_database.json", help="Base de datos de hashes")
+    register.add_argument("--no-recursive", action="store_true", help="No entrar en subdirectorios")
+    register.add_argument("--algorithm", default=DEFAULT_ALGORITHM, choices=sorted(HASH_ALGORITHMS))
+    register.add_argument("--merkle", action="store_true", help="Hash en árbol (localiza cambios)")
+    register.add_argument("--leaf-size", type=int, default=MERKLE_LEAF_SIZE)
+    # Los comandos de integridad hashean muchos archivos: 4 hilos por defecto
+    register.set_defaults(func=cmd_register, workers=4)
+
+    verify = sub.add_parser("verify", parents=[common], help="Verificar la base de integridad")
+    verify.add_argument("--db", default="hash_database.json", help="Base de datos de hashes")
+    verify.add_argument("--incremental", action="store_true", help="Saltar archivos sin cambios de stat")
+    verify.add_argument("--paranoid", action="store_true", help="Rehashear todo")
+    verify.add_argument("--sample", type=float, default=0.0,
+                        help="Fracción de archivos sin cambios que se rehashean igualmente")
+    verify.set_defaults(func=cmd_verify, workers=4)
+
+    duplicates = sub.add_parser("duplicates", parents=[common, batch], help="Buscar archivos duplicados")
+    duplicates.add_argument("--db", default="hash_database.json", help="Base de datos de hashes")
+    duplicates.add_argument("--use-db", action="store_true",
+                            help="Reutilizar los hashes de --db de los archivos sin cambios")
+    duplicates.set_defaults(func=cmd_duplicates, workers=4)
+
+    migrate = sub.add_parser("migrate", parents=[common], help="Migrar una base JSON a SQLite")
+    migrate.add_argument("json_file")
+    migrate.add_argument("sqlite_file")
+    migrate.set_defaults(func=cmd_migrate)
+
+    watch = sub.add_parser("watch", parents=[common], help="Vigilar la base de integridad")
+    watch.add_argument("--db", default="hash_database.json", help="Base de datos de hashes")
+    watch.add_argument("--backend", default="auto", choices=("auto", "inotify", "polling"))
+    watch.add_argument("--debounce", type=float, default=DEBOUNCE_SECONDS,
+                       help="Segundos sin actividad antes de rehashear un archivo")
+    watch.add_argument("--rate", type=positive_float, default=MAX_REHASH_PER_SECOND,
+                       help="Máximo de rehasheos por segundo")
+    watch.set_defaults(func=cmd_watch)
+    return parser
+
+def main(argv=None) -> int:
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if args.metrics:
+        metrics.enable()
+    started = time.perf_counter()
+    try:
+        return args.func(args, started)
+    except CliError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 2
+    except (OSError, ValueError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if args.metrics:
+            metrics.dump(args.metrics)
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -5,23 +5,212 @@ Proporciona una GUI moderna con pestañas para todas las funcionalidades
 
 import tkinter as tk
 from tkinter import ttk, filedialog, scrolledtext, messagebox
+from concurrent.futures import ProcessPoolExecutor
 import os
+import queue
 import sys
+import threading
+import time
 from pathlib import Path
 
 # Agregar el directorio al path
 sys.path.insert(0, str(Path(__file__).parent))
 
-from aescipher import generate_aes_key, encrypt_file_gcm, decrypt_file_gcm, encrypt_gcm, decrypt_gcm
+from aescipher import (
+    generate_aes_key, decrypt_file_gcm, encrypt_gcm, decrypt_gcm, atomic_output,
+    encrypt_stream_gcm_legacy, encrypt_file_password, decrypt_file_password
+)
 from rsautils import (
     generate_rsa_keypair, load_private_key, load_public_key,
     sign_message, verify_signature
 )
 from hashutils import (
-    calculate_file_hash, register_file, verify_file_integrity,
-    verify_all_files
+    hash_file, register_file, verify_file_integrity,
+    iter_verify_files
 )
-from hybrid import encrypt_file_hybrid, decrypt_file_hybrid
+from hashdb import open_hash_database
+from hybrid import encrypt_stream_hybrid, decrypt_path_hybrid
+
+
+# ==================== TAREAS EN SEGUNDO PLANO ====================
+
+class TaskCancelled(Exception):
+    """La tarea se canceló desde la interfaz."""
+
+
+class TaskProgress:
+    """
+    Objeto que recibe la función de trabajo. Se llama con el avance
+    acumulado (progress(hechos)) y lanza TaskCancelled si el usuario canceló.
+    Los avisos a la interfaz se limitan a uno cada UPDATE_INTERVAL segundos.
+    """
+    UPDATE_INTERVAL = 0.1
+
+    def __init__(self, runner, total):
+        self._runner = runner
+        self.total = total
+        self.start = time.monotonic()
+        self._last_post = 0.0
+
+    def __call__(self, done):
+        if self._runner.cancel_event.is_set():
+            raise TaskCancelled()
+        now = time.monotonic()
+        if now - self._last_post >= self.UPDATE_INTERVAL:
+            self._last_post = now
+            self._runner.queue.put(("progress", done, now - self.start))
+
+    def post(self, callback, *args):
+        """Ejecuta callback(*args) en el hilo de Tk (p. ej. para mostrar resultados parciales)."""
+        self._runner.queue.put(("call", callback, args))
+
+
+class TaskRunner:
+    """
+    Ejecuta operaciones largas fuera del hilo de Tk.
+
+    Las funciones de trabajo corren en un hilo (o en un proceso, para la
+    generación de claves RSA, que retiene el GIL) y se comunican con la
+    interfaz por una cola que el hilo de Tk consulta con root.after. Tk no
+    se toca nunca desde otro hilo.
+    """
+    POLL_MS = 50
+
+    def __init__(self, root, progressbar, info_label, cancel_button, set_status):
+        self.root = root
+        self.progressbar = progressbar
+        self.info_label = info_label
+        self.cancel_button = cancel_button
+        self.set_status = set_status
+        self.queue = queue.Queue()
+        self.cancel_event = threading.Event()
+        self._process_pool = None
+        self._task = None
+
+    @property
+    def busy(self):
+        return self._task is not None
+
+    def run(self, description, work, on_done, error_title="Error", total=None,
+            unit="bytes", in_process=False, args=()):
+        """
+        Lanza una tarea.
+
+        Args:
+            description: Texto para la barra de estado
+            work: work(progress) en un hilo, o work(*args) en un proceso si
+                in_process (debe ser una función de módulo)
+            on_done: Callback on_done(resultado) en el hilo de Tk
+            error_title: Prefijo del mensaje de error
+            total: Tamaño total (barra determinada) o None (indeterminada)
+            unit: "bytes" (muestra MB/s) o el nombre de la unidad contada
+        """
+        if self.busy:
+            messagebox.showwarning("Advertencia", "Ya hay una operación en curso")
+            return
+        self.cancel_event.clear()
+        self._task = {"description": description, "on_done": on_done, "error_title": error_title,
+                      "total": total, "unit": unit, "future": None}
+        self._show_start(description, total)
+
+        if in_process:
+            if self._process_pool is None:
+                self._process_pool = ProcessPoolExecutor(max_workers=1)
+            self._task["future"] = self._process_pool.submit(work, *args)
+        else:
+            progress = TaskProgress(self, total)
+            threading.Thread(target=self._worker, args=(work, progress), daemon=True).start()
+        self.root.after(self.POLL_MS, self._poll)
+
+    def cancel(self):
+        if not self.busy:
+            return
+        self.cancel_event.set()
+        self.info_label.config(text="Cancelando...")
+        future = self._task["future"]
+        if future is not None:
+            # Un proceso no se puede interrumpir: su resultado se descartará
+            self.queue.put(("cancelled",))
+
+    def shutdown(self):
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=False, cancel_futures=True)
+
+    def _worker(self, work, progress):
+        try:
+            self.queue.put(("done", work(progress)))
+        except TaskCancelled:
+            self.queue.put(("cancelled",))
+        except Exception as e:
+            self.queue.put(("error", e))
+
+    def _poll(self):
+        task = self._task
+        if task is None:
+            return
+        future = task["future"]
+        if future is not None and future.done() and not self.cancel_event.is_set():
+            try:
+                self.queue.put(("done", future.result()))
+            except Exception as e:
+                self.queue.put(("error", e))
+            task["future"] = None
+
+        while True:
+            try:
+                message = self.queue.get_nowait()
+            except queue.Empty:
+                break
+            kind = message[0]
+            if kind == "progress":
+                self._show_progress(*message[1:])
+            elif kind == "call":
+                message[1](*message[2])
+            else:
+                self._finish(task, message)
+                return
+        self.root.after(self.POLL_MS, self._poll)
+
+    def _finish(self, task, message):
+        self._task = None
+        self.progressbar.stop()
+        self.progressbar.config(mode="determinate", value=0)
+        self.cancel_button.config(state="disabled")
+        self.info_label.config(text="")
+        kind = message[0]
+        if kind == "done":
+            task["on_done"](message[1])
+        elif kind == "cancelled":
+            self.set_status(f"{task['description']}: cancelado")
+        else:
+            self.set_status(f"{task['description']}: error")
+            messagebox.showerror("Error", f"{task['error_title']}: {message[1]}")
+
+    def _show_start(self, description, total):
+        self.set_status(description + "...")
+        self.cancel_button.config(state="normal")
+        if total:
+            self.progressbar.config(mode="determinate", maximum=total, value=0)
+        else:
+            self.progressbar.config(mode="indeterminate")
+            self.progressbar.start(15)
+        self.info_label.config(text="")
+
+    def _show_progress(self, done, elapsed):
+        task = self._task
+        total = task["total"]
+        if not total or self.cancel_event.is_set():
+            return
+        self.progressbar.config(value=done)
+        rate = done / elapsed if elapsed > 0 else 0.0
+        if task["unit"] == "bytes":
+            speed = f"{rate / (1024 * 1024):.1f} MB/s"
+        else:
+            speed = f"{rate:.0f} {task['unit']}/s"
+        if rate > 0:
+            eta = int((total - done) / rate)
+            speed += f" · ETA {eta // 60}:{eta % 60:02d}"
+        self.info_label.config(text=f"{done * 100 // total}% · {speed}")
 
 
 class CryptoApp:
@@ -93,6 +282,19 @@ class CryptoApp:
                                    anchor=tk.W, bg='#34495e', fg='#ecf0f1')
         self.status_bar.pack(side=tk.BOTTOM, fill=tk.X)
         
+        # Progreso de las operaciones en segundo plano
+        progress_frame = tk.Frame(self.root, bg='#2c3e50')
+        progress_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=10, pady=(0, 5))
+        progressbar = ttk.Progressbar(progress_frame, mode='determinate')
+        progressbar.pack(side='left', fill='x', expand=True)
+        progress_info = tk.Label(progress_frame, text="", width=30, anchor=tk.W,
+                                 bg='#2c3e50', fg='#ecf0f1')
+        progress_info.pack(side='left', padx=10)
+        cancel_button = ttk.Button(progress_frame, text="Cancelar", state="disabled")
+        cancel_button.pack(side='left')
+        self.tasks = TaskRunner(self.root, progressbar, progress_info, cancel_button, self.update_status)
+        cancel_button.config(command=self.tasks.cancel)
+        
     def create_aes_tab(self):
         """Pestaña de cifrado AES"""
         tab = ttk.Frame(self.notebook)
@@ -135,6 +337,10 @@ class CryptoApp:
                   command=self.generate_aes_key).pack(side='left', padx=5)
         ttk.Button(key_gen_frame, text=" Copiar Clave", 
                   command=self.copy_aes_key).pack(side='left', padx=5)
+        ttk.Label(key_gen_frame, text="o contraseña (archivos):").pack(side='left', padx=5)
+        self.aes_password = tk.StringVar()
+        ttk.Entry(key_gen_frame, textvariable=self.aes_password, show='•',
+                 width=20).pack(side='left', padx=5)
         
         self.aes_key_label = ttk.Label(scrollable_frame, text="No hay clave generada", 
                                        foreground='#e74c3c')
@@ -481,9 +687,10 @@ class CryptoApp:
             messagebox.showerror("Error", f"Error al copiar: {e}")
             
     def encrypt_aes(self):
-        """Cifrar archivo con AES"""
-        if not self.aes_key:
-            messagebox.showwarning("Advertencia", "Primero genera una clave AES")
+        """Cifrar archivo con AES (con la clave generada o, si se escribió, con la contraseña)"""
+        password = self.aes_password.get()
+        if not self.aes_key and not password:
+            messagebox.showwarning("Advertencia", "Primero genera una clave AES o escribe una contraseña")
             return
             
         input_file = self.aes_input_file.get()
@@ -491,10 +698,17 @@ class CryptoApp:
             messagebox.showwarning("Advertencia", "Selecciona un archivo válido")
             return
             
-        try:
-            output_file = input_file + ".enc"
-            nonce, tag = encrypt_file_gcm(input_file, output_file, self.aes_key)
-            
+        output_file = input_file + ".enc"
+        key = self.aes_key
+        
+        def work(progress):
+            if password:
+                return encrypt_file_password(input_file, output_file, password, progress=progress)
+            # Temporal + renombrado: si falla o se cancela, el destino queda como estaba
+            with open(input_file, 'rb') as fin, atomic_output(output_file) as fout:
+                return encrypt_stream_gcm_legacy(fin, fout, key, progress=progress)
+        
+        def done(result):
             self.log_message(self.aes_log, f"\n✓ Archivo cifrado exitosamente")
             self.log_message(self.aes_log, f"  Entrada: {input_file}")
             self.log_message(self.aes_log, f"  Salida: {output_file}")
@@ -503,13 +717,15 @@ class CryptoApp:
             
             self.update_status("Archivo cifrado exitosamente")
             messagebox.showinfo("Éxito", f"Archivo cifrado guardado en:\n{output_file}")
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al cifrar: {e}")
+        
+        self.tasks.run("Cifrando con AES-GCM", work, done, "Error al cifrar",
+                       total=os.path.getsize(input_file))
             
     def decrypt_aes(self):
-        """Descifrar archivo con AES"""
-        if not self.aes_key:
-            messagebox.showwarning("Advertencia", "Primero genera o carga una clave AES")
+        """Descifrar archivo con AES (con la clave generada o, si se escribió, con la contraseña)"""
+        password = self.aes_password.get()
+        if not self.aes_key and not password:
+            messagebox.showwarning("Advertencia", "Primero genera o carga una clave AES o escribe la contraseña")
             return
             
         encrypted_file = self.aes_encrypted_file.get()
@@ -517,10 +733,15 @@ class CryptoApp:
             messagebox.showwarning("Advertencia", "Selecciona un archivo válido")
             return
             
-        try:
-            output_file = encrypted_file.replace(".enc", "_decrypted.txt")
-            success = decrypt_file_gcm(encrypted_file, output_file, self.aes_key)
-            
+        output_file = encrypted_file.replace(".enc", "_decrypted.txt")
+        key = self.aes_key
+        
+        def work(progress):
+            if password:
+                return decrypt_file_password(encrypted_file, output_file, password, progress=progress)
+            return decrypt_file_gcm(encrypted_file, output_file, key, progress=progress)
+        
+        def done(success):
             if success:
                 self.log_message(self.aes_log, f"\n✓ Archivo descifrado exitosamente")
                 self.log_message(self.aes_log, f"  Entrada: {encrypted_file}")
@@ -528,9 +749,10 @@ class CryptoApp:
                 self.update_status("Archivo descifrado exitosamente")
                 messagebox.showinfo("Éxito", f"Archivo descifrado guardado en:\n{output_file}")
             else:
-                messagebox.showerror("Error", "Error en el descifrado. Verifica la clave.")
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al descifrar: {e}")
+                messagebox.showerror("Error", "Error en el descifrado. Verifica la clave o la contraseña.")
+        
+        self.tasks.run("Descifrando con AES-GCM", work, done, "Error al descifrar",
+                       total=os.path.getsize(encrypted_file))
     
     def encrypt_aes_text(self):
         """Cifrar texto directo con AES"""
@@ -609,9 +831,8 @@ class CryptoApp:
     # --- RSA ---
     def generate_rsa_keys(self):
         """Generar par de claves RSA"""
-        try:
-            self.update_status("Generando claves RSA-2048...")
-            priv, pub = generate_rsa_keypair(2048)
+        def done(keypair):
+            priv, pub = keypair
             self.rsa_private_key = priv
             self.rsa_public_key = pub
             
@@ -627,8 +848,10 @@ class CryptoApp:
             self.log_message(self.rsa_log, "\n⚠️ Guarda la clave privada de forma segura")
             
             self.update_status("Claves RSA generadas")
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al generar claves: {e}")
+        
+        # En un proceso aparte: la generación retiene el GIL y congelaría la ventana
+        self.tasks.run("Generando claves RSA-2048", generate_rsa_keypair, done,
+                       "Error al generar claves", in_process=True, args=(2048,))
             
     def save_private_key(self):
         """Guardar clave privada"""
@@ -747,16 +970,19 @@ class CryptoApp:
             messagebox.showwarning("Advertencia", "Selecciona un archivo válido")
             return
             
-        try:
-            file_hash = calculate_file_hash(file_path)
+        def work(progress):
+            return hash_file(file_path, progress=progress).hexdigest()
+        
+        def done(file_hash):
             self.hash_log.delete(1.0, tk.END)
             self.log_message(self.hash_log, f"✓ Hash calculado exitosamente")
             self.log_message(self.hash_log, f"\nArchivo: {file_path}")
             self.log_message(self.hash_log, f"Tamaño: {os.path.getsize(file_path)} bytes")
             self.log_message(self.hash_log, f"\nSHA-256:\n{file_hash}")
             self.update_status("Hash calculado")
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al calcular hash: {e}")
+        
+        self.tasks.run("Calculando hash", work, done, "Error al calcular hash",
+                       total=os.path.getsize(file_path))
             
     def register_file_gui(self):
         """Registrar archivo en base de datos de integridad"""
@@ -765,15 +991,18 @@ class CryptoApp:
             messagebox.showwarning("Advertencia", "Selecciona un archivo válido")
             return
             
-        try:
-            file_hash = register_file(file_path, "integrity_db.json")
+        def work(progress):
+            return register_file(file_path, "integrity_db.json", progress=progress)
+        
+        def done(file_hash):
             self.log_message(self.hash_log, f"\n✓ Archivo registrado en base de datos")
             self.log_message(self.hash_log, f"  Archivo: {file_path}")
             self.log_message(self.hash_log, f"  Hash: {file_hash}")
             self.update_status("Archivo registrado")
             messagebox.showinfo("Éxito", "Archivo registrado en la base de datos de integridad")
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al registrar: {e}")
+        
+        self.tasks.run("Registrando archivo", work, done, "Error al registrar",
+                       total=os.path.getsize(file_path))
             
     def verify_integrity(self):
         """Verificar integridad de archivo"""
@@ -782,8 +1011,10 @@ class CryptoApp:
             messagebox.showwarning("Advertencia", "Selecciona un archivo válido")
             return
             
-        try:
-            result = verify_file_integrity(file_path, "integrity_db.json")
+        def work(progress):
+            return verify_file_integrity(file_path, "integrity_db.json", progress=progress)
+        
+        def done(result):
             self.hash_log.delete(1.0, tk.END)
             
             if result['valid']:
@@ -804,36 +1035,50 @@ class CryptoApp:
                 messagebox.showinfo("Verificación", "✅ Integridad Verificada\n\nEl archivo NO ha sido modificado.")
             else:
                 messagebox.showwarning("Verificación", "❌ Integridad Comprometida\n\nEl archivo fue modificado.")
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al verificar: {e}")
+        
+        self.tasks.run("Verificando integridad", work, done, "Error al verificar",
+                       total=os.path.getsize(file_path))
             
     def verify_all(self):
         """Verificar todos los archivos registrados"""
+        db_file = "integrity_db.json"
         try:
-            results = verify_all_files("integrity_db.json")
-            self.hash_log.delete(1.0, tk.END)
-            self.log_message(self.hash_log, "📊 VERIFICACIÓN DE TODOS LOS ARCHIVOS\n")
-            
-            valid_count = 0
-            invalid_count = 0
-            
-            for res in results:
-                if res['valid']:
-                    self.log_message(self.hash_log, f"✅ {res['filepath']}")
-                    valid_count += 1
-                else:
-                    self.log_message(self.hash_log, f"❌ {res['filepath']}", '#e74c3c')
-                    invalid_count += 1
-                self.log_message(self.hash_log, f"   {res['message']}\n")
-            
+            with open_hash_database(db_file) as db:
+                total = len(db)
+        except Exception as e:
+            messagebox.showerror("Error", f"Error al verificar: {e}")
+            return
+        
+        self.hash_log.delete(1.0, tk.END)
+        self.log_message(self.hash_log, "📊 VERIFICACIÓN DE TODOS LOS ARCHIVOS\n")
+        counts = {"valid": 0, "invalid": 0}
+        
+        def show(res):
+            if res['valid']:
+                self.log_message(self.hash_log, f"✅ {res['filepath']}")
+                counts["valid"] += 1
+            else:
+                self.log_message(self.hash_log, f"❌ {res['filepath']}", '#e74c3c')
+                counts["invalid"] += 1
+            self.log_message(self.hash_log, f"   {res['message']}\n")
+        
+        def work(progress):
+            # Los resultados llegan según terminan; se muestran sobre la marcha
+            for count, res in enumerate(iter_verify_files(db_file), 1):
+                progress.post(show, res)
+                progress(count)
+        
+        def done(_):
+            valid_count, invalid_count = counts["valid"], counts["invalid"]
             self.log_message(self.hash_log, f"\n═══════════════════════════")
-            self.log_message(self.hash_log, f"Total verificados: {len(results)}")
+            self.log_message(self.hash_log, f"Total verificados: {valid_count + invalid_count}")
             self.log_message(self.hash_log, f"Válidos: {valid_count}")
             self.log_message(self.hash_log, f"Modificados: {invalid_count}")
             
             self.update_status(f"Verificados: {valid_count} OK, {invalid_count} modificados")
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al verificar: {e}")
+        
+        self.tasks.run("Verificando todos los archivos", work, done, "Error al verificar",
+                       total=total, unit="archivos")
     
     # --- Híbrido ---
     def encrypt_hybrid(self):
@@ -847,36 +1092,29 @@ class CryptoApp:
             messagebox.showwarning("Advertencia", "Selecciona un archivo válido")
             return
             
-        try:
-            # Leer archivo
-            with open(input_file, "rb") as f:
-                plaintext = f.read()
-            
-            # Cifrar con esquema híbrido
-            enc_key, nonce, tag, ciphertext = encrypt_file_hybrid(plaintext, self.rsa_public_key)
-            
-            # Guardar paquete completo
-            output_file = input_file + ".hybrid"
-            with open(output_file, "wb") as f:
-                # Formato: [len_enc_key][enc_key][nonce][tag][ciphertext]
-                f.write(len(enc_key).to_bytes(4, 'big'))
-                f.write(enc_key)
-                f.write(nonce)
-                f.write(tag)
-                f.write(ciphertext)
-            
+        # Cifrar con esquema híbrido por bloques
+        # Formato: [len_enc_key][enc_key][nonce][tag][ciphertext]
+        output_file = input_file + ".hybrid"
+        public_key = self.rsa_public_key
+        
+        def work(progress):
+            with open(input_file, 'rb') as fin, atomic_output(output_file) as fout:
+                return encrypt_stream_hybrid(fin, fout, public_key, progress=progress)
+        
+        def done(result):
+            enc_key, nonce, tag = result
             self.log_message(self.hybrid_log, "✓ Archivo cifrado con esquema híbrido")
             self.log_message(self.hybrid_log, f"\n  Archivo original: {input_file}")
-            self.log_message(self.hybrid_log, f"  Tamaño original: {len(plaintext)} bytes")
+            self.log_message(self.hybrid_log, f"  Tamaño original: {os.path.getsize(input_file)} bytes")
             self.log_message(self.hybrid_log, f"  Archivo cifrado: {output_file}")
             self.log_message(self.hybrid_log, f"  Tamaño cifrado: {os.path.getsize(output_file)} bytes")
             self.log_message(self.hybrid_log, f"\n  Clave AES cifrada: {len(enc_key)} bytes")
-            self.log_message(self.hybrid_log, f"  Datos cifrados: {len(ciphertext)} bytes")
             
             self.update_status("Cifrado híbrido completado")
             messagebox.showinfo("Éxito", f"Archivo cifrado guardado en:\n{output_file}")
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al cifrar: {e}")
+        
+        self.tasks.run("Cifrando (híbrido)", work, done, "Error al cifrar",
+                       total=os.path.getsize(input_file))
             
     def decrypt_hybrid(self):
         """Descifrar con esquema híbrido"""
@@ -889,38 +1127,31 @@ class CryptoApp:
             messagebox.showwarning("Advertencia", "Selecciona un archivo válido")
             return
             
-        try:
-            # Leer paquete
-            with open(encrypted_file, "rb") as f:
-                enc_key_len = int.from_bytes(f.read(4), 'big')
-                enc_key = f.read(enc_key_len)
-                nonce = f.read(12)
-                tag = f.read(16)
-                ciphertext = f.read()
-            
-            # Descifrar
-            plaintext = decrypt_file_hybrid(enc_key, nonce, tag, ciphertext, self.rsa_private_key)
-            
-            # Guardar archivo descifrado
-            output_file = encrypted_file.replace(".hybrid", "_decrypted.txt")
-            with open(output_file, "wb") as f:
-                f.write(plaintext)
-            
+        # Descifrar paquete por bloques
+        output_file = encrypted_file.replace(".hybrid", "_decrypted.txt")
+        private_key = self.rsa_private_key
+        
+        def work(progress):
+            return decrypt_path_hybrid(encrypted_file, output_file, private_key, progress=progress)
+        
+        def done(size):
             self.log_message(self.hybrid_log, "\n✓ Archivo descifrado con esquema híbrido")
             self.log_message(self.hybrid_log, f"\n  Archivo cifrado: {encrypted_file}")
             self.log_message(self.hybrid_log, f"  Archivo descifrado: {output_file}")
-            self.log_message(self.hybrid_log, f"  Tamaño recuperado: {len(plaintext)} bytes")
+            self.log_message(self.hybrid_log, f"  Tamaño recuperado: {size} bytes")
             
             self.update_status("Descifrado híbrido completado")
             messagebox.showinfo("Éxito", f"Archivo descifrado guardado en:\n{output_file}")
-        except Exception as e:
-            messagebox.showerror("Error", f"Error al descifrar: {e}")
+        
+        self.tasks.run("Descifrando (híbrido)", work, done, "Error al descifrar",
+                       total=os.path.getsize(encrypted_file))
 
 
 def main():
     root = tk.Tk()
     app = CryptoApp(root)
     root.mainloop()
+    app.tasks.shutdown()
 
 
 if __name__ == "__main__":
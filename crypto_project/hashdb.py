@@ -0,0 +1,265 @@
+# hashdb.py
+"""
+Backends de la base de datos de hashes de integridad.
+
+- JsonHashDatabase: el formato JSON de siempre ({ruta: {hash, timestamp, ...}}).
+  Cómodo para pocos archivos; cada escritura reescribe el archivo completo
+  (de forma atómica, vía temporal + renombrado).
+- SqliteHashDatabase: SQLite (biblioteca estándar) con índice por ruta y por
+  hash (y por tamaño), modo WAL y escrituras por lotes en una sola transacción.
+
+`open_hash_database` elige el backend por la extensión del archivo.
+"""
+import json
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+
+from aescipher import atomic_output
+
+SQLITE_EXTENSIONS = (".db", ".sqlite", ".sqlite3")
+
+class HashDatabase(ABC):
+    """
+    Interfaz común de los backends. Las entradas son dicts con al menos "hash".
+
+    Un backend que no implemente todos los métodos abstractos falla al
+    crearse, no a mitad de una verificación.
+    """
+
+    @abstractmethod
+    def get(self, filepath: str):
+        ...
+
+    @abstractmethod
+    def put_many(self, entries):
+        """Inserta o actualiza varias entradas ({ruta: entrada} o pares) de una vez."""
+
+    @abstractmethod
+    def delete(self, filepath: str):
+        ...
+
+    @abstractmethod
+    def items(self):
+        """Itera (ruta, entrada) sin cargar necesariamente todo en memoria."""
+
+    @abstractmethod
+    def replace_all(self, hash_db: dict):
+        """Sustituye todo el contenido por `hash_db`."""
+
+    @abstractmethod
+    def __len__(self):
+        ...
+
+    @abstractmethod
+    def find_by_hash(self, file_hash: str) -> list:
+        """Rutas registradas con ese hash (índice inverso hash → rutas)."""
+
+    @abstractmethod
+    def duplicate_groups(self):
+        """Itera (hash, [rutas]) para cada hash registrado en más de una ruta."""
+
+    def put(self, filepath: str, entry: dict):
+        self.put_many([(filepath, entry)])
+
+    def __contains__(self, filepath):
+        return self.get(filepath) is not None
+
+    def to_dict(self) -> dict:
+        return dict(self.items())
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+# ========== BACKEND JSON ==========
+
+class JsonHashDatabase(HashDatabase):
+
+    def __init__(self, path: str):
+        self.path = path
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                self._data = json.load(f)
+        else:
+            self._data = {}
+        self._by_hash = None
+
+    def _flush(self):
+        self._by_hash = None
+        with atomic_output(self.path) as f:
+            f.write(json.dumps(self._data, indent=2).encode())
+
+    def get(self, filepath: str):
+        return self._data.get(filepath)
+
+    def put_many(self, entries):
+        items = entries.items() if isinstance(entries, dict) else entries
+        for filepath, entry in items:
+            self._data[filepath] = entry
+        self._flush()
+
+    def delete(self, filepath: str):
+        if self._data.pop(filepath, None) is not None:
+            self._flush()
+
+    def items(self):
+        return iter(list(self._data.items()))
+
+    def replace_all(self, hash_db: dict):
+        self._data = dict(hash_db)
+        self._flush()
+
+    def to_dict(self) -> dict:
+        return dict(self._data)
+
+    def _hash_index(self) -> dict:
+        # Índice inverso construido al primer uso; cualquier escritura lo invalida
+        if self._by_hash is None:
+            self._by_hash = {}
+            for filepath, entry in self._data.items():
+                self._by_hash.setdefault(entry["hash"], []).append(filepath)
+        return self._by_hash
+
+    def find_by_hash(self, file_hash: str) -> list:
+        return sorted(self._hash_index().get(file_hash, []))
+
+    def duplicate_groups(self):
+        for file_hash, paths in self._hash_index().items():
+            if len(paths) > 1:
+                yield file_hash, sorted(paths)
+
+    def __len__(self):
+        return len(self._data)
+
+# ========== BACKEND SQLITE ==========
+
+class SqliteHashDatabase(HashDatabase):
+    """
+    Base de datos de hashes en SQLite.
+
+    Columnas indexadas: path (clave primaria) y hash. El resto de campos de
+    la entrada se guardan como JSON en `data`, así que admite campos nuevos
+    sin migrar el esquema.
+    """
+
+    _SCHEMA = (
+        "CREATE TABLE IF NOT EXISTS files ("
+        " path TEXT PRIMARY KEY,"
+        " hash TEXT NOT NULL,"
+        " size INTEGER,"
+        " data TEXT NOT NULL)",
+        "CREATE INDEX IF NOT EXISTS idx_files_hash ON files(hash)",
+        "CREATE INDEX IF NOT EXISTS idx_files_size ON files(size)",
+    )
+    PAGE_SIZE = 1000
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        with self._conn:
+            for statement in self._SCHEMA:
+                self._conn.execute(statement)
+
+    @staticmethod
+    def _row(filepath: str, entry: dict):
+        return (filepath, entry["hash"], entry.get("size"), json.dumps(entry))
+
+    def get(self, filepath: str):
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM files WHERE path = ?", (filepath,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put_many(self, entries):
+        items = entries.items() if isinstance(entries, dict) else entries
+        rows = (self._row(filepath, entry) for filepath, entry in items)
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO files (path, hash, size, data) VALUES (?, ?, ?, ?)", rows)
+
+    def delete(self, filepath: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM files WHERE path = ?", (filepath,))
+
+    def items(self):
+        # Paginación por clave: cada lote es una consulta corta, sin cursores abiertos
+        last = ""
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT path, data FROM files WHERE path > ? ORDER BY path LIMIT ?",
+                    (last, self.PAGE_SIZE)).fetchall()
+            if not rows:
+                return
+            for filepath, data in rows:
+                yield filepath, json.loads(data)
+            last = rows[-1][0]
+
+    def replace_all(self, hash_db: dict):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM files")
+            self._conn.executemany(
+                "INSERT INTO files (path, hash, size, data) VALUES (?, ?, ?, ?)",
+                (self._row(filepath, entry) for filepath, entry in hash_db.items()))
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def find_by_hash(self, file_hash: str) -> list:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT path FROM files WHERE hash = ? ORDER BY path", (file_hash,)).fetchall()
+        return [row[0] for row in rows]
+
+    def duplicate_groups(self):
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT hash, path FROM files WHERE hash IN"
+                " (SELECT hash FROM files GROUP BY hash HAVING COUNT(*) > 1)"
+                " ORDER BY hash, path").fetchall()
+        group_hash, paths = None, []
+        for file_hash, filepath in rows:
+            if file_hash != group_hash and paths:
+                yield group_hash, paths
+                paths = []
+            group_hash = file_hash
+            paths.append(filepath)
+        if paths:
+            yield group_hash, paths
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+# ========== SELECCIÓN Y MIGRACIÓN ==========
+
+def open_hash_database(db_file: str) -> HashDatabase:
+    """
+    Abre la base de datos con el backend que corresponde a su extensión
+    (.db, .sqlite, .sqlite3 → SQLite; cualquier otra → JSON).
+    """
+    if db_file.lower().endswith(SQLITE_EXTENSIONS):
+        return SqliteHashDatabase(db_file)
+    return JsonHashDatabase(db_file)
+
+def migrate_json_to_sqlite(json_file: str, sqlite_file: str) -> int:
+    """
+    Copia todas las entradas de una base JSON a una base SQLite en una sola transacción.
+
+    Returns:
+        int: Número de entradas migradas
+    """
+    source = JsonHashDatabase(json_file)
+    with SqliteHashDatabase(sqlite_file) as target:
+        target.put_many(source.items())
+    return len(source)
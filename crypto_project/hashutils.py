@@ -1,9 +1,18 @@
 # hashutils.py
-from Crypto.Hash import SHA256
-import json
+from Crypto.Hash import SHA256, SHA512, SHA3_256, BLAKE2b
+import mmap
 import os
+import random
+import sys
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from datetime import datetime
 
+import metrics
+from hashdb import open_hash_database
+from metrics import instrumented
+
 def sha256_bytes(data: bytes) -> bytes:
     h = SHA256.new(data=data)
     return h.digest()
@@ -12,45 +21,342 @@ def sha256_hex(data: bytes) -> str:
     h = SHA256.new(data=data)
     return h.hexdigest()
 
+# ========== ALGORITMOS DE HASH ==========
+# Cada entrada de la base de datos guarda el nombre del algoritmo con que se
+# registró ("algorithm"); las entradas antiguas sin ese campo son SHA-256.
+
+DEFAULT_ALGORITHM = "sha256"
+
+HASH_ALGORITHMS = {
+    "sha256": SHA256.new,
+    "sha512": SHA512.new,
+    "blake2b": lambda: BLAKE2b.new(digest_bits=512),
+    "sha3_256": SHA3_256.new,
+}
+
+def new_hash(algorithm: str = DEFAULT_ALGORITHM):
+    """
+    Crea un objeto hash vacío del algoritmo indicado.
+    
+    Raises:
+        ValueError: Si el algoritmo no está registrado
+    """
+    try:
+        return HASH_ALGORITHMS[algorithm]()
+    except KeyError:
+        raise ValueError(f"Algoritmo de hash no soportado: {algorithm} "
+                         f"(disponibles: {', '.join(sorted(HASH_ALGORITHMS))})")
+
+def register_hash_algorithm(name: str, factory):
+    """Añade un algoritmo al registro. `factory()` debe devolver un objeto con update() y hexdigest()."""
+    HASH_ALGORITHMS[name] = factory
+
+def hash_hex(data: bytes, algorithm: str = DEFAULT_ALGORITHM) -> str:
+    h = new_hash(algorithm)
+    h.update(data)
+    return h.hexdigest()
+
+# ========== MOTOR DE HASHEO DE ARCHIVOS ==========
+
+MIN_BLOCK_SIZE = 64 * 1024
+MAX_BLOCK_SIZE = 4 * 1024 * 1024
+
+def block_size_for(size: int) -> int:
+    """
+    Tamaño de bloque adaptativo: ~1/16 del archivo, potencia de dos entre
+    MIN_BLOCK_SIZE y MAX_BLOCK_SIZE. Los archivos pequeños se leen en una o
+    dos llamadas y los grandes no reservan más de 4 MiB.
+    """
+    block = MIN_BLOCK_SIZE
+    while block < MAX_BLOCK_SIZE and block * 16 < size:
+        block *= 2
+    return block
+
+def _advise_sequential(fd: int, size: int):
+    # Pista al kernel para que aumente la lectura anticipada (solo POSIX)
+    if hasattr(os, "posix_fadvise") and size:
+        try:
+            os.posix_fadvise(fd, 0, size, os.POSIX_FADV_SEQUENTIAL)
+        except OSError:
+            pass
+
+@instrumented
+def hash_file(filepath: str, hash_obj=None, use_mmap: bool = False, block_size: int = None,
+              progress=None):
+    """
+    Alimenta un objeto hash con el contenido de un archivo sin copias intermedias.
+    
+    Lee con readinto sobre un único buffer reutilizado (no se crea un bytes
+    nuevo por bloque). Con use_mmap=True se hashea desde un mmap; solo para
+    archivos que no van a cambiar: si se truncan durante la lectura, el
+    acceso al mmap mata el proceso con SIGBUS.
+    
+    Args:
+        filepath: Ruta del archivo
+        hash_obj: Objeto con update() (por defecto SHA256.new())
+        use_mmap: Hashear desde un mmap en lugar de leer por bloques
+        block_size: Tamaño de bloque; None = adaptativo según el tamaño
+        progress: Callback opcional progress(bytes_hasheados) tras cada bloque
+    
+    Returns:
+        El mismo objeto hash, ya actualizado
+    """
+    h = SHA256.new() if hash_obj is None else hash_obj
+    op = metrics.current()
+    with open(filepath, 'rb', buffering=0) as f:
+        fd = f.fileno()
+        size = os.fstat(fd).st_size
+        block = block_size or block_size_for(size)
+        
+        if use_mmap and size > 0:
+            # Con mmap la lectura ocurre en los fallos de página dentro de update():
+            # para las métricas todo cuenta como cálculo
+            with metrics.phase("compute"), mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mapped:
+                if hasattr(mapped, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+                    mapped.madvise(mmap.MADV_SEQUENTIAL)
+                view = memoryview(mapped)
+                try:
+                    for start in range(0, len(view), block):
+                        h.update(view[start:start + block])
+                        if progress:
+                            progress(min(start + block, size))
+                finally:
+                    view.release()
+            metrics.add_bytes(size)
+        elif op is not None:
+            _advise_sequential(fd, size)
+            _hash_readinto_timed(op, f, h, bytearray(block), progress)
+        else:
+            _advise_sequential(fd, size)
+            buffer = bytearray(block)
+            view = memoryview(buffer)
+            done = 0
+            while n := f.readinto(buffer):
+                h.update(view[:n])
+                done += n
+                if progress:
+                    progress(done)
+    return h
+
+def _hash_readinto_timed(op, f, h, buffer: bytearray, progress):
+    # Igual que el bucle readinto de hash_file, midiendo lectura y hash por separado
+    clock = time.perf_counter_ns
+    view = memoryview(buffer)
+    read_ns = compute_ns = done = 0
+    try:
+        while True:
+            t0 = clock()
+            n = f.readinto(buffer)
+            t1 = clock()
+            read_ns += t1 - t0
+            if not n:
+                break
+            h.update(view[:n])
+            compute_ns += clock() - t1
+            done += n
+            if progress:
+                progress(done)
+    finally:
+        op.add_bytes(done)
+        op.add_phase("io_read", read_ns)
+        op.add_phase("compute", compute_ns)
+
+# ========== HASH EN ÁRBOL (MERKLE) ==========
+# El archivo se divide en hojas de `leaf_size` bytes que se hashean por
+# separado (en paralelo) y se combinan por pares hasta la raíz. Con prefijos
+# distintos para hojas (0x00) y nodos (0x01) no se puede hacer pasar un nodo
+# interno por una hoja. Guardar las hojas permite saber qué rangos cambiaron.
+
+MERKLE_LEAF_SIZE = 1024 * 1024
+
+def _hash_leaf(view, algorithm: str) -> str:
+    h = new_hash(algorithm)
+    h.update(b"\x00")
+    h.update(view)
+    return h.hexdigest()
+
+def _read_leaf(f, start: int, leaf_size: int) -> bytes:
+    # pread no mueve la posición compartida: varios hilos leen del mismo descriptor
+    if hasattr(os, "pread"):
+        return os.pread(f.fileno(), leaf_size, start)
+    with open(f.name, 'rb', buffering=0) as g:
+        g.seek(start)
+        return g.read(leaf_size)
+
+@instrumented(rest="compute")
+def merkle_leaves(filepath: str, algorithm: str = DEFAULT_ALGORITHM,
+                  leaf_size: int = MERKLE_LEAF_SIZE, workers: int = None,
+                  use_mmap: bool = False) -> list:
+    """
+    Hashes de las hojas de un archivo, calculados en paralelo.
+    
+    Cada hoja se lee con pread; si el archivo se trunca mientras tanto, las
+    hojas afectadas salen cortas (y no coincidirán) en lugar de matar el
+    proceso. Con use_mmap=True se hashea desde un mmap, igual que en
+    `hash_file` y con la misma advertencia (SIGBUS si se trunca).
+    
+    Args:
+        filepath: Ruta del archivo
+        algorithm: Algoritmo del registro
+        leaf_size: Bytes por hoja
+        workers: Hilos de hasheo (por defecto, uno por núcleo)
+        use_mmap: Hashear desde un mmap en lugar de leer cada hoja
+    
+    Returns:
+        list: Hashes hexadecimales de las hojas, en orden (vacía si el archivo está vacío)
+    """
+    new_hash(algorithm)  # valida el nombre antes de abrir el archivo
+    with open(filepath, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return []
+        starts = range(0, size, leaf_size)
+        workers = min(workers or os.cpu_count() or 1, len(starts))
+        
+        def run(hash_one, items):
+            if workers > 1:
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    return list(pool.map(hash_one, items))
+            return [hash_one(item) for item in items]
+        
+        if use_mmap:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    slices = [view[start:start + leaf_size] for start in starts]
+                    leaves = run(lambda leaf: _hash_leaf(leaf, algorithm), slices)
+                    for leaf in slices:
+                        leaf.release()
+                finally:
+                    view.release()
+        else:
+            leaves = run(lambda start: _hash_leaf(_read_leaf(f, start, leaf_size), algorithm), starts)
+    metrics.add_bytes(size)
+    return leaves
+
+def merkle_root(leaves: list, algorithm: str = DEFAULT_ALGORITHM) -> str:
+    """
+    Raíz del árbol a partir de los hashes de las hojas. Un nodo sin pareja
+    sube tal cual al nivel siguiente. Sin hojas, la raíz es el hash de una
+    hoja vacía.
+    """
+    if not leaves:
+        return _hash_leaf(b"", algorithm)
+    level = [bytes.fromhex(leaf) for leaf in leaves]
+    while len(level) > 1:
+        parents = []
+        for i in range(0, len(level) - 1, 2):
+            h = new_hash(algorithm)
+            h.update(b"\x01" + level[i] + level[i + 1])
+            parents.append(h.digest())
+        if len(level) % 2:
+            parents.append(level[-1])
+        level = parents
+    return level[0].hex()
+
+def changed_ranges(old_leaves: list, new_leaves: list, leaf_size: int, size: int,
+                   old_size: int = None) -> list:
+    """
+    Rangos de bytes [inicio, fin) cuyo contenido cambió, comparando hojas.
+    Las hojas contiguas se fusionan en un solo rango. Si el archivo creció o
+    se truncó, la parte añadida o desaparecida también cuenta como cambiada.
+    
+    Args:
+        old_leaves, new_leaves: Hojas registradas y actuales
+        leaf_size: Bytes por hoja
+        size: Tamaño actual del archivo
+        old_size: Tamaño registrado (si se omite, se supone la última hoja llena)
+    
+    Returns:
+        list: [(inicio, fin), ...]
+    """
+    if old_size is None:
+        old_size = len(old_leaves) * leaf_size
+    limit = max(size, old_size)
+    ranges = []
+    for i in range(max(len(old_leaves), len(new_leaves))):
+        old = old_leaves[i] if i < len(old_leaves) else None
+        new = new_leaves[i] if i < len(new_leaves) else None
+        if old == new:
+            continue
+        start = i * leaf_size
+        end = min((i + 1) * leaf_size, limit)
+        if ranges and ranges[-1][1] == start:
+            ranges[-1] = (ranges[-1][0], end)
+        else:
+            ranges.append((start, end))
+    return ranges
+
+def hash_fields(filepath: str, algorithm: str = DEFAULT_ALGORITHM, merkle: bool = False,
+                leaf_size: int = MERKLE_LEAF_SIZE, workers: int = None, progress=None) -> dict:
+    """
+    Campos de hash de una entrada de la base de datos.
+    
+    `progress` (como en hash_file) solo se usa en el modo simple.
+    
+    Returns:
+        dict: {"hash", "algorithm"} y, en modo árbol, también
+            {"mode": "merkle", "leaf_size", "leaves"}
+    """
+    if not merkle:
+        return {"hash": hash_file(filepath, new_hash(algorithm), progress=progress).hexdigest(),
+                "algorithm": algorithm}
+    leaves = merkle_leaves(filepath, algorithm, leaf_size, workers)
+    return {
+        "hash": merkle_root(leaves, algorithm),
+        "algorithm": algorithm,
+        "mode": "merkle",
+        "leaf_size": leaf_size,
+        "leaves": leaves
+    }
+
+def _entry_hash_fields(filepath: str, entry: dict, progress=None) -> dict:
+    """Recalcula el hash de un archivo con el algoritmo y modo de su entrada."""
+    return hash_fields(filepath, entry.get("algorithm", DEFAULT_ALGORITHM),
+                       merkle=entry.get("mode") == "merkle",
+                       leaf_size=entry.get("leaf_size", MERKLE_LEAF_SIZE), progress=progress)
+
 # ========== VERIFICACIÓN DE INTEGRIDAD DE ARCHIVOS ==========
 
-def calculate_file_hash(filepath: str) -> str:
+@instrumented
+def calculate_file_hash(filepath: str, algorithm: str = DEFAULT_ALGORITHM) -> str:
     """
-    Calcula el hash SHA-256 de un archivo.
+    Calcula el hash de un archivo.
     
     Args:
         filepath: Ruta del archivo
+        algorithm: Algoritmo del registro (SHA-256 por defecto)
     
     Returns:
         str: Hash hexadecimal del archivo
-    """
-    sha256 = SHA256.new()
     
+    Raises:
+        ValueError: Si el algoritmo no está soportado
+        OSError: Si el archivo no se puede leer (FileNotFoundError si no existe)
+    """
     try:
-        with open(filepath, 'rb') as f:
-            # Leer en bloques para archivos grandes
-            while chunk := f.read(8192):
-                sha256.update(chunk)
-        return sha256.hexdigest()
-    except FileNotFoundError:
-        raise FileNotFoundError(f"Archivo no encontrado: {filepath}")
-    except Exception as e:
-        raise Exception(f"Error al calcular hash: {e}")
+        return hash_file(filepath, new_hash(algorithm)).hexdigest()
+    except FileNotFoundError as e:
+        raise FileNotFoundError(e.errno, "Archivo no encontrado", filepath) from e
 
 def save_hash_database(db_file: str, hash_db: dict):
     """
-    Guarda la base de datos de hashes en formato JSON.
+    Guarda la base de datos de hashes completa.
+    
+    El backend se elige por la extensión (JSON por defecto, SQLite para
+    .db/.sqlite/.sqlite3). Para cambios puntuales es preferible
+    `open_hash_database(db_file).put(...)`, que no reescribe todo.
     
     Args:
         db_file: Ruta del archivo de base de datos
         hash_db: Diccionario con hashes {filepath: {hash, timestamp}}
     """
-    with open(db_file, 'w') as f:
-        json.dump(hash_db, f, indent=2)
+    with open_hash_database(db_file) as db:
+        db.replace_all(hash_db)
 
 def load_hash_database(db_file: str) -> dict:
     """
-    Carga la base de datos de hashes desde un archivo JSON.
+    Carga la base de datos de hashes completa en un diccionario.
     
     Args:
         db_file: Ruta del archivo de base de datos
@@ -61,39 +367,183 @@ def load_hash_database(db_file: str) -> dict:
     if not os.path.exists(db_file):
         return {}
     
-    with open(db_file, 'r') as f:
-        return json.load(f)
+    with open_hash_database(db_file) as db:
+        return db.to_dict()
+
+def stat_fields(st: os.stat_result) -> dict:
+    """
+    Metadatos que se guardan al registrar un archivo para la verificación
+    incremental: si no cambian, se asume que el contenido tampoco.
+    """
+    return {
+        "size": st.st_size,
+        "mtime_ns": st.st_mtime_ns,
+        "inode": st.st_ino,
+        "device": st.st_dev
+    }
 
-def register_file(filepath: str, db_file: str = "hash_database.json"):
+def stat_unchanged(entry: dict, st: os.stat_result) -> bool:
+    """True si el stat actual coincide con el registrado (entradas antiguas sin stat: False)."""
+    if "mtime_ns" not in entry:
+        return False
+    return stat_fields(st) == {k: entry.get(k) for k in ("size", "mtime_ns", "inode", "device")}
+
+@instrumented
+def register_file(filepath: str, db_file: str = "hash_database.json",
+                  algorithm: str = DEFAULT_ALGORITHM, merkle: bool = False,
+                  leaf_size: int = MERKLE_LEAF_SIZE, progress=None):
     """
     Registra un archivo en la base de datos de hashes.
     
     Args:
         filepath: Ruta del archivo a registrar
         db_file: Ruta de la base de datos
+        algorithm: Algoritmo del registro (se guarda en la entrada)
+        merkle: Hash en árbol; guarda las hojas para localizar cambios
+        leaf_size: Bytes por hoja en modo árbol
+        progress: Callback opcional progress(bytes_hasheados) (modo simple)
     
     Returns:
-        str: Hash del archivo registrado
+        str: Hash del archivo registrado (la raíz en modo árbol)
+    """
+    entry = _registration_entry(filepath, algorithm, merkle, leaf_size, progress=progress)
+    with open_hash_database(db_file) as db:
+        db.put(filepath, entry)
+    return entry["hash"]
+
+# ========== REGISTRO MASIVO ==========
+
+def iter_files(root: str, recursive: bool = True):
     """
-    file_hash = calculate_file_hash(filepath)
-    hash_db = load_hash_database(db_file)
+    Recorre un directorio de forma perezosa con os.scandir.
+    
+    No sigue enlaces simbólicos a directorios. Los directorios sin permiso
+    de lectura se omiten.
     
-    hash_db[filepath] = {
-        "hash": file_hash,
+    Yields:
+        str: Ruta de cada archivo regular
+    """
+    stack = [root]
+    while stack:
+        directory = stack.pop()
+        try:
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            stack.append(entry.path)
+                    elif entry.is_file():
+                        yield entry.path
+        except (PermissionError, FileNotFoundError, NotADirectoryError):
+            continue
+
+def _expand_paths(paths, recursive: bool):
+    if isinstance(paths, (str, os.PathLike)):
+        paths = [paths]
+    for path in paths:
+        path = os.fspath(path)
+        if os.path.isdir(path):
+            yield from iter_files(path, recursive)
+        else:
+            yield path
+
+def _registration_entry(filepath: str, algorithm: str = DEFAULT_ALGORITHM, merkle: bool = False,
+                        leaf_size: int = MERKLE_LEAF_SIZE, leaf_workers: int = None, progress=None):
+    st = os.stat(filepath)
+    return {
+        **hash_fields(filepath, algorithm, merkle, leaf_size, leaf_workers, progress),
         "timestamp": datetime.now().isoformat(),
-        "size": os.path.getsize(filepath)
+        **stat_fields(st)
     }
+
+def register_files(paths, db_file: str = "hash_database.json", recursive: bool = True,
+                   workers: int = 4, progress=None, algorithm: str = DEFAULT_ALGORITHM,
+                   merkle: bool = False, leaf_size: int = MERKLE_LEAF_SIZE) -> dict:
+    """
+    Registra muchos archivos hasheándolos en paralelo y guardando una sola vez.
     
-    save_hash_database(db_file, hash_db)
-    return file_hash
+    Args:
+        paths: Ruta (archivo o directorio) o lista de rutas
+        db_file: Ruta de la base de datos
+        recursive: Recorrer subdirectorios
+        workers: Hilos de hasheo (SHA-256 libera el GIL en bloques grandes)
+        progress: Callback opcional progress(archivos, bytes, ruta) tras cada archivo
+        algorithm, merkle, leaf_size: Como en register_file
+    
+    Returns:
+        dict: {
+            "files": int, "bytes": int, "errors": {ruta: mensaje},
+            "seconds": float, "files_per_s": float, "mb_per_s": float
+        }
+    """
+    new_hash(algorithm)
+    start = time.perf_counter()
+    entries = {}
+    errors = {}
+    total_bytes = 0
+    
+    def collect(done):
+        nonlocal total_bytes
+        for future in done:
+            filepath = pending.pop(future)
+            try:
+                entry = future.result()
+            except Exception as e:
+                errors[filepath] = str(e)
+                continue
+            entries[filepath] = entry
+            total_bytes += entry["size"]
+            if progress:
+                progress(len(entries), total_bytes, filepath)
+    
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for filepath in _expand_paths(paths, recursive):
+            # Los archivos ya se reparten entre hilos: las hojas de cada uno, en serie
+            future = pool.submit(_registration_entry, filepath, algorithm, merkle, leaf_size, 1)
+            pending[future] = filepath
+            # Número acotado de tareas en vuelo: el recorrido sigue siendo perezoso
+            if len(pending) >= workers * 4:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+        collect(list(pending))
+    
+    with open_hash_database(db_file) as db:
+        db.put_many(entries)
+    
+    seconds = time.perf_counter() - start
+    return {
+        "files": len(entries),
+        "bytes": total_bytes,
+        "errors": errors,
+        "seconds": seconds,
+        "files_per_s": len(entries) / seconds if seconds else 0.0,
+        "mb_per_s": total_bytes / (1024 * 1024) / seconds if seconds else 0.0
+    }
 
-def verify_file_integrity(filepath: str, db_file: str = "hash_database.json") -> dict:
+def _compare_entry(entry: dict, current: dict, size: int) -> dict:
+    is_valid = entry["hash"] == current["hash"]
+    result = {
+        "valid": is_valid,
+        "message": "Integridad verificada ✓" if is_valid else "⚠️ ARCHIVO MODIFICADO - Integridad comprometida",
+        "original_hash": entry["hash"],
+        "current_hash": current["hash"],
+        "registered_date": entry["timestamp"]
+    }
+    if not is_valid and "leaves" in entry:
+        result["changed_ranges"] = changed_ranges(entry["leaves"], current["leaves"],
+                                                  entry["leaf_size"], size, entry.get("size"))
+    return result
+
+@instrumented
+def verify_file_integrity(filepath: str, db_file: str = "hash_database.json", progress=None) -> dict:
     """
     Verifica si un archivo ha sido modificado comparando con el hash registrado.
     
     Args:
         filepath: Ruta del archivo a verificar
         db_file: Ruta de la base de datos
+        progress: Callback opcional progress(bytes_hasheados) (modo simple)
     
     Returns:
         dict: {
@@ -103,10 +553,13 @@ def verify_file_integrity(filepath: str, db_file: str = "hash_database.json") ->
             "current_hash": str,
             "registered_date": str
         }
+        En entradas en modo árbol modificadas, además
+        "changed_ranges": [(inicio, fin), ...]
     """
-    hash_db = load_hash_database(db_file)
+    with open_hash_database(db_file) as db:
+        original_data = db.get(filepath)
     
-    if filepath not in hash_db:
+    if original_data is None:
         return {
             "valid": False,
             "message": "Archivo no registrado en la base de datos",
@@ -115,54 +568,131 @@ def verify_file_integrity(filepath: str, db_file: str = "hash_database.json") ->
             "registered_date": None
         }
     
-    original_data = hash_db[filepath]
-    original_hash = original_data["hash"]
-    current_hash = calculate_file_hash(filepath)
+    return _compare_entry(original_data, _entry_hash_fields(filepath, original_data, progress),
+                          os.path.getsize(filepath))
+
+def verify_entry(filepath: str, entry: dict, incremental: bool = False, sample_rate: float = 0.0) -> dict:
+    """
+    Verifica un archivo contra una entrada ya cargada, sin tocar la base de datos.
     
-    is_valid = original_hash == current_hash
+    Args:
+        filepath: Ruta del archivo
+        entry: Entrada registrada ({hash, timestamp, size, ...})
+        incremental: Saltar el rehash si el stat no ha cambiado
+        sample_rate: Fracción de archivos sin cambios que se rehashean igualmente
     
-    return {
-        "valid": is_valid,
-        "message": "Integridad verificada ✓" if is_valid else "⚠️ ARCHIVO MODIFICADO - Integridad comprometida",
-        "original_hash": original_hash,
-        "current_hash": current_hash,
-        "registered_date": original_data["timestamp"]
+    Returns:
+        dict: Resultado como verify_file_integrity más "filepath" y "skipped"
+    """
+    base = {
+        "filepath": filepath,
+        "original_hash": entry["hash"],
+        "current_hash": None,
+        "registered_date": entry["timestamp"],
+        "skipped": False
     }
+    try:
+        st = os.stat(filepath)
+    except FileNotFoundError:
+        return {**base, "valid": False, "message": "⚠️ Archivo no encontrado (eliminado o movido)"}
+    
+    if incremental and stat_unchanged(entry, st) and random.random() >= sample_rate:
+        return {**base, "valid": True, "message": "Sin cambios de metadatos (no se rehasheó)", "skipped": True}
+    
+    try:
+        current = _entry_hash_fields(filepath, entry)
+    except Exception as e:
+        return {**base, "valid": False, "message": f"⚠️ No se pudo leer el archivo: {e}"}
+    return {**base, **_compare_entry(entry, current, st.st_size)}
+
+# ========== VERIFICACIÓN EN PARALELO ==========
+
+MAX_INFLIGHT_BYTES = 256 * 1024 * 1024
 
-def verify_all_files(db_file: str = "hash_database.json") -> list:
+def iter_verify_files(db_file: str = "hash_database.json", workers: int = 4, max_in_flight: int = None,
+                      max_inflight_bytes: int = MAX_INFLIGHT_BYTES, incremental: bool = False,
+                      paranoid: bool = False, sample_rate: float = 0.0, ordered: bool = False):
     """
-    Verifica la integridad de todos los archivos registrados.
+    Verifica todos los archivos registrados en paralelo, entregando los
+    resultados a medida que terminan.
+    
+    La base de datos se recorre una sola vez. Para no saturar el disco se
+    limitan tanto las tareas en vuelo (`max_in_flight`) como los bytes que
+    suman los archivos en vuelo (`max_inflight_bytes`, según el tamaño
+    registrado); siempre se admite al menos un archivo.
     
     Args:
         db_file: Ruta de la base de datos
+        workers: Hilos de hasheo
+        max_in_flight: Máximo de archivos en vuelo (por defecto workers * 4)
+        max_inflight_bytes: Máximo de bytes en vuelo
+        incremental, paranoid, sample_rate: Como en verify_all_files
+        ordered: Entregar en el orden de la base de datos en lugar de al terminar
     
-    Returns:
-        list: Lista de resultados de verificación
+    Yields:
+        dict: Resultado de cada archivo (ver verify_entry)
     """
-    hash_db = load_hash_database(db_file)
-    results = []
+    fast_path = incremental and not paranoid
+    max_in_flight = max_in_flight or workers * 4
+    pending = {}
+    order = deque()
+    inflight_bytes = 0
     
-    for filepath in hash_db.keys():
-        if os.path.exists(filepath):
-            result = verify_file_integrity(filepath, db_file)
-            result["filepath"] = filepath
-            results.append(result)
+    def finished():
+        nonlocal inflight_bytes
+        if ordered:
+            done = [order.popleft()]
         else:
-            results.append({
-                "filepath": filepath,
-                "valid": False,
-                "message": "⚠️ Archivo no encontrado (eliminado o movido)",
-                "original_hash": hash_db[filepath]["hash"],
-                "current_hash": None,
-                "registered_date": hash_db[filepath]["timestamp"]
-            })
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            inflight_bytes -= pending.pop(future)
+            yield future.result()
+    
+    pool = ThreadPoolExecutor(max_workers=workers)
+    try:
+        with open_hash_database(db_file) as db:
+            for filepath, entry in db.items():
+                size = entry.get("size") or 0
+                while pending and (len(pending) >= max_in_flight or
+                                   inflight_bytes + size > max_inflight_bytes):
+                    yield from finished()
+                future = pool.submit(verify_entry, filepath, entry, fast_path, sample_rate)
+                pending[future] = size
+                inflight_bytes += size
+                if ordered:
+                    order.append(future)
+        while pending:
+            yield from finished()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def verify_all_files(db_file: str = "hash_database.json", incremental: bool = False,
+                     paranoid: bool = False, sample_rate: float = 0.0, workers: int = 4) -> list:
+    """
+    Verifica la integridad de todos los archivos registrados.
     
-    return results
+    Args:
+        db_file: Ruta de la base de datos
+        incremental: No rehashear archivos cuyo stat (mtime_ns, tamaño,
+            inodo, dispositivo) coincide con el registrado
+        paranoid: Fuerza el rehash completo aunque incremental sea True
+        sample_rate: En modo incremental, fracción (0-1) de archivos sin
+            cambios de stat que se rehashean igualmente como muestreo
+        workers: Hilos de hasheo
+    
+    Returns:
+        list: Lista de resultados de verificación, en el orden de la base de
+            datos (con "skipped" = True en los archivos que no se rehashearon)
+    """
+    return list(iter_verify_files(db_file, workers=workers, incremental=incremental,
+                                  paranoid=paranoid, sample_rate=sample_rate, ordered=True))
 
 def compare_files(file1: str, file2: str) -> bool:
     """
     Compara dos archivos usando sus hashes SHA-256.
     
+    Si los tamaños difieren no se hashea nada.
+    
     Args:
         file1: Ruta del primer archivo
         file2: Ruta del segundo archivo
@@ -170,6 +700,130 @@ def compare_files(file1: str, file2: str) -> bool:
     Returns:
         bool: True si los archivos son idénticos
     """
+    if os.path.getsize(file1) != os.path.getsize(file2):
+        return False
+    if os.path.samefile(file1, file2):
+        return True
     hash1 = calculate_file_hash(file1)
     hash2 = calculate_file_hash(file2)
     return hash1 == hash2
+
+# ========== BÚSQUEDA DE DUPLICADOS ==========
+# Criba por etapas, de la más barata a la más cara:
+#   1. Tamaño (solo stat): un archivo con tamaño único no tiene duplicados.
+#   2. Hash parcial: primeros y últimos PARTIAL_HASH_SIZE bytes.
+#   3. Hash completo, solo de los que siguen empatados. Si se pasa una base
+#      de datos, se reutiliza el hash registrado de los archivos cuyo stat
+#      no ha cambiado.
+
+PARTIAL_HASH_SIZE = 64 * 1024
+
+def partial_hash(filepath: str, size: int = None, sample: int = PARTIAL_HASH_SIZE) -> str:
+    """
+    Hash SHA-256 de la cabecera y la cola de un archivo (más su tamaño).
+    
+    Si el archivo mide 2 * sample o menos, cubre todo el contenido y
+    equivale a comparar el archivo completo.
+    """
+    h = SHA256.new()
+    with open(filepath, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size if size is None else size
+        h.update(size.to_bytes(8, "big"))
+        if size <= 2 * sample:
+            h.update(f.read())
+        else:
+            h.update(f.read(sample))
+            f.seek(-sample, os.SEEK_END)
+            h.update(f.read(sample))
+    return h.hexdigest()
+
+def _group_by(keyfunc, paths, workers: int) -> dict:
+    """Agrupa rutas por keyfunc(ruta) calculado en paralelo; las que fallan se descartan."""
+    def safe_key(filepath):
+        try:
+            return keyfunc(filepath)
+        except OSError:
+            return None
+    
+    groups = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        for filepath, key in zip(paths, pool.map(safe_key, paths)):
+            if key is not None:
+                groups.setdefault(key, []).append(filepath)
+    return groups
+
+def find_duplicates(root, db_file: str = None, recursive: bool = True, workers: int = 4) -> list:
+    """
+    Busca archivos con contenido idéntico hasheando lo mínimo posible.
+    
+    Los archivos vacíos se ignoran.
+    
+    Args:
+        root: Directorio (o lista de rutas) a examinar
+        db_file: Base de datos de integridad cuyos hashes SHA-256 se reutilizan
+            para archivos sin cambios de stat (opcional)
+        recursive: Recorrer subdirectorios
+        workers: Hilos de hasheo
+    
+    Returns:
+        list: Grupos de rutas duplicadas (cada grupo ordenado), de mayor a
+            menor espacio desperdiciado
+    """
+    stats = {}
+    by_size = {}
+    for filepath in _expand_paths(root, recursive):
+        try:
+            st = os.stat(filepath)
+        except OSError:
+            continue
+        if st.st_size:
+            stats[filepath] = st
+            by_size.setdefault(st.st_size, []).append(filepath)
+    
+    candidates = [p for paths in by_size.values() if len(paths) > 1 for p in paths]
+    by_partial = _group_by(lambda p: (stats[p].st_size, partial_hash(p, stats[p].st_size)),
+                           candidates, workers)
+    
+    small, large = [], []
+    for (size, _), paths in by_partial.items():
+        if len(paths) > 1:
+            # El hash parcial ya cubre todo el archivo: el grupo es definitivo
+            (small if size <= 2 * PARTIAL_HASH_SIZE else large).append(paths)
+    
+    db = open_hash_database(db_file) if db_file and os.path.exists(db_file) else None
+    try:
+        def full_hash(filepath):
+            entry = db.get(filepath) if db is not None else None
+            if (entry and entry.get("algorithm", DEFAULT_ALGORITHM) == "sha256"
+                    and entry.get("mode") != "merkle" and stat_unchanged(entry, stats[filepath])):
+                return entry["hash"]
+            return hash_file(filepath).hexdigest()
+        
+        by_full = _group_by(full_hash, [p for paths in large for p in paths], workers)
+    finally:
+        if db is not None:
+            db.close()
+    
+    groups = small + [paths for paths in by_full.values() if len(paths) > 1]
+    groups = [sorted(paths) for paths in groups]
+    groups.sort(key=lambda paths: stats[paths[0]].st_size * (len(paths) - 1), reverse=True)
+    return groups
+
+# ========== LÍNEA DE COMANDOS ==========
+
+def main(argv=None):
+    """
+    Comandos de integridad (register, verify, duplicates, migrate). Delega en
+    cli, la única interfaz de línea de comandos; se acepta también --db antes
+    del subcomando, como en `python hashutils.py --db base.db verify`.
+    """
+    from cli import main as cli_main
+    argv = list(sys.argv[1:] if argv is None else argv)
+    if argv[:1] == ["--db"] and len(argv) >= 3:
+        argv = [argv[2], "--db", argv[1]] + argv[3:]
+    elif argv[:1] and argv[0].startswith("--db=") and len(argv) >= 2:
+        argv = [argv[1], argv[0]] + argv[2:]
+    return cli_main(argv)
+
+if __name__ == "__main__":
+    raise SystemExit(main())
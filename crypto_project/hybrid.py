@@ -1,7 +1,19 @@
 # hybrid.py
-from aescipher import generate_aes_key, encrypt_gcm, decrypt_gcm
-from rsautils import rsa_encrypt, rsa_decrypt, load_public_key, load_private_key
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+from aescipher import (
+    generate_aes_key, encrypt_gcm, decrypt_gcm, transform_stream, atomic_output,
+    encrypt_stream_gcm, decrypt_stream_gcm, CHUNK_SIZE, GCM_NONCE_SIZE, GCM_TAG_SIZE
+)
+from rsautils import rsa_encrypt, rsa_decrypt, load_public_key, load_private_key, key_fingerprint
+import struct
 
+from metrics import instrumented
+
+# Tamaño máximo aceptado para la clave AES cifrada (RSA de hasta 8192 bits)
+MAX_ENC_KEY_SIZE = 1024
+
+@instrumented(bytes_arg="plaintext_bytes", rest="compute")
 def encrypt_file_hybrid(plaintext_bytes: bytes, rsa_pub_pem: bytes):
     # 1) generar clave AES
     aes_key = generate_aes_key(256)
@@ -13,8 +25,258 @@ def encrypt_file_hybrid(plaintext_bytes: bytes, rsa_pub_pem: bytes):
     # devolver estructura
     return enc_key, nonce, tag, ciphertext
 
+@instrumented(bytes_arg="ciphertext", rest="compute")
 def decrypt_file_hybrid(enc_key: bytes, nonce: bytes, tag: bytes, ciphertext: bytes, rsa_priv_pem: bytes):
     priv = load_private_key(rsa_priv_pem)
     aes_key = rsa_decrypt(enc_key, priv)
     plaintext = decrypt_gcm(nonce, ciphertext, tag, aes_key)
     return plaintext
+
+# ========== PAQUETE HÍBRIDO POR STREAMING ==========
+# Formato: [len_enc_key (4)][enc_key][nonce (12)][tag (16)][ciphertext]
+
+@instrumented(rest="compute")
+def encrypt_stream_hybrid(fin, fout, rsa_pub_pem: bytes, chunk_size: int = CHUNK_SIZE, progress=None):
+    """
+    Cifra un flujo con el esquema híbrido sin cargarlo entero en memoria.
+    
+    Primero se escribe la cabecera con la clave AES envuelta con RSA y luego
+    el cuerpo AES-GCM por bloques. El tag se rellena al final en su hueco,
+    por eso `fout` debe admitir seek().
+    
+    Args:
+        fin: Objeto archivo de entrada (modo binario)
+        fout: Objeto archivo de salida (modo binario, con seek)
+        rsa_pub_pem: Clave pública RSA del destinatario (PEM)
+        chunk_size: Tamaño de bloque de lectura
+        progress: Callback opcional progress(bytes_procesados)
+    
+    Returns:
+        tuple: (enc_key, nonce, tag)
+    """
+    if not fout.seekable():
+        raise ValueError("La salida debe admitir seek() para escribir el tag")
+    
+    aes_key = generate_aes_key(256)
+    enc_key = rsa_encrypt(aes_key, load_public_key(rsa_pub_pem))
+    nonce = get_random_bytes(GCM_NONCE_SIZE)
+    cipher = AES.new(aes_key, AES.MODE_GCM, nonce=nonce)
+    
+    fout.write(len(enc_key).to_bytes(4, 'big'))
+    fout.write(enc_key)
+    fout.write(nonce)
+    tag_offset = fout.tell()
+    fout.write(bytes(GCM_TAG_SIZE))
+    transform_stream(cipher.encrypt, fin, fout, chunk_size, progress=progress)
+    
+    tag = cipher.digest()
+    end = fout.tell()
+    fout.seek(tag_offset)
+    fout.write(tag)
+    fout.seek(end)
+    return enc_key, nonce, tag
+
+@instrumented(rest="compute")
+def decrypt_stream_hybrid(fin, fout, rsa_priv_pem: bytes, chunk_size: int = CHUNK_SIZE,
+                          progress=None) -> int:
+    """
+    Descifra un flujo producido por `encrypt_stream_hybrid`.
+    
+    El texto plano se escribe en `fout` antes de verificar el tag: si se
+    lanza la excepción, quien llama debe descartarlo (ver `decrypt_path_hybrid`).
+    `progress(bytes_procesados)`, si se indica, se llama tras cada bloque.
+    
+    Raises:
+        ValueError: Si el paquete está dañado, la clave no corresponde o la
+            autenticación falla
+    
+    Returns:
+        int: Bytes de texto plano escritos
+    """
+    enc_key_len = int.from_bytes(fin.read(4), 'big')
+    if not 0 < enc_key_len <= MAX_ENC_KEY_SIZE:
+        raise ValueError("Paquete híbrido inválido")
+    enc_key = fin.read(enc_key_len)
+    nonce = fin.read(GCM_NONCE_SIZE)
+    tag = fin.read(GCM_TAG_SIZE)
+    if len(enc_key) != enc_key_len or len(nonce) != GCM_NONCE_SIZE or len(tag) != GCM_TAG_SIZE:
+        raise ValueError("Paquete híbrido truncado")
+    
+    aes_key = rsa_decrypt(enc_key, load_private_key(rsa_priv_pem))
+    cipher = AES.new(aes_key, AES.MODE_GCM, nonce=nonce)
+    size = transform_stream(cipher.decrypt, fin, fout, chunk_size, progress=progress)
+    cipher.verify(tag)
+    return size
+
+@instrumented
+def encrypt_path_hybrid(input_file: str, output_file: str, rsa_pub_pem: bytes, chunk_size: int = CHUNK_SIZE,
+                        progress=None):
+    """
+    Cifra un archivo con el esquema híbrido por streaming.
+    
+    Args:
+        input_file: Ruta del archivo a cifrar
+        output_file: Ruta del paquete híbrido de salida
+        rsa_pub_pem: Clave pública RSA del destinatario (PEM)
+        progress: Callback opcional progress(bytes_procesados)
+    
+    Returns:
+        tuple: (enc_key, nonce, tag)
+    """
+    with open(input_file, 'rb') as fin, atomic_output(output_file) as fout:
+        return encrypt_stream_hybrid(fin, fout, rsa_pub_pem, chunk_size, progress)
+
+@instrumented
+def decrypt_path_hybrid(input_file: str, output_file: str, rsa_priv_pem: bytes, chunk_size: int = CHUNK_SIZE,
+                        progress=None) -> int:
+    """
+    Descifra un paquete híbrido a un archivo.
+    
+    El resultado se escribe en un temporal que solo se renombra a
+    `output_file` si la autenticación es correcta. `progress` como en
+    `decrypt_stream_hybrid`.
+    
+    Raises:
+        ValueError: Si el paquete está dañado o la clave no corresponde
+    
+    Returns:
+        int: Tamaño del archivo descifrado
+    """
+    with open(input_file, 'rb') as fin, atomic_output(output_file) as fout:
+        return decrypt_stream_hybrid(fin, fout, rsa_priv_pem, chunk_size, progress)
+
+# ========== SOBRE MULTI-DESTINATARIO ==========
+# El cuerpo se cifra una sola vez con AES-GCM; la clave AES se envuelve con
+# RSA una vez por destinatario.
+#
+# Formato:
+#   "HYBM" (4) + versión (1) + número de destinatarios (2)
+#   por destinatario: key_id (32) + len_enc_key (2) + enc_key
+#   nonce (12) + ciphertext + tag (16)
+# La cabecera completa se autentica como AAD del cuerpo.
+
+ENVELOPE_MAGIC = b"HYBM"
+ENVELOPE_VERSION = 1
+KEY_ID_SIZE = 32
+MAX_RECIPIENTS = 0xFFFF
+
+def _build_envelope_header(aes_key: bytes, rsa_pub_pems) -> tuple:
+    """
+    Envuelve `aes_key` para cada destinatario (los repetidos, una sola vez).
+    
+    Returns:
+        tuple: (cabecera en bytes, lista de key_id de los destinatarios en orden)
+    """
+    entries = {}
+    for pem in rsa_pub_pems:
+        pub = load_public_key(pem)
+        key_id = key_fingerprint(pub)
+        if key_id not in entries:
+            entries[key_id] = rsa_encrypt(aes_key, pub)
+    if not entries:
+        raise ValueError("Se necesita al menos un destinatario")
+    if len(entries) > MAX_RECIPIENTS:
+        raise ValueError(f"Máximo {MAX_RECIPIENTS} destinatarios por sobre")
+    
+    parts = [ENVELOPE_MAGIC, struct.pack(">BH", ENVELOPE_VERSION, len(entries))]
+    for key_id, enc_key in entries.items():
+        parts.append(key_id)
+        parts.append(struct.pack(">H", len(enc_key)))
+        parts.append(enc_key)
+    return b"".join(parts), list(entries)
+
+def read_envelope_header(fin):
+    """
+    Lee la cabecera de un sobre multi-destinatario sin usar RSA.
+    
+    Returns:
+        tuple: (cabecera en bytes, {key_id: enc_key})
+    
+    Raises:
+        ValueError: Si el flujo no es un sobre válido
+    """
+    fixed = fin.read(7)
+    if len(fixed) != 7 or fixed[:4] != ENVELOPE_MAGIC:
+        raise ValueError("El archivo no es un sobre híbrido multi-destinatario")
+    version, count = struct.unpack(">BH", fixed[4:])
+    if version != ENVELOPE_VERSION:
+        raise ValueError(f"Versión de sobre no soportada: {version}")
+    
+    parts = [fixed]
+    entries = {}
+    for _ in range(count):
+        entry_head = fin.read(KEY_ID_SIZE + 2)
+        if len(entry_head) != KEY_ID_SIZE + 2:
+            raise ValueError("Sobre híbrido truncado")
+        key_id = entry_head[:KEY_ID_SIZE]
+        (enc_key_len,) = struct.unpack(">H", entry_head[KEY_ID_SIZE:])
+        enc_key = fin.read(enc_key_len)
+        if len(enc_key) != enc_key_len:
+            raise ValueError("Sobre híbrido truncado")
+        parts.append(entry_head)
+        parts.append(enc_key)
+        entries[key_id] = enc_key
+    return b"".join(parts), entries
+
+@instrumented(rest="compute")
+def encrypt_stream_hybrid_multi(fin, fout, rsa_pub_pems, chunk_size: int = CHUNK_SIZE):
+    """
+    Cifra un flujo para varios destinatarios con una sola pasada de AES.
+    
+    El coste crece con el número de destinatarios (un RSA por clave) y no con
+    destinatarios × tamaño del archivo. No necesita seek en la salida.
+    
+    Args:
+        fin: Objeto archivo de entrada (modo binario)
+        fout: Objeto archivo de salida (modo binario)
+        rsa_pub_pems: Lista de claves públicas RSA (PEM) de los destinatarios
+        chunk_size: Tamaño de bloque de lectura
+    
+    Returns:
+        list: key_id de cada destinatario incluido
+    """
+    aes_key = generate_aes_key(256)
+    header, key_ids = _build_envelope_header(aes_key, rsa_pub_pems)
+    fout.write(header)
+    encrypt_stream_gcm(fin, fout, aes_key, chunk_size, associated_data=header)
+    return key_ids
+
+@instrumented(rest="compute")
+def decrypt_stream_hybrid_multi(fin, fout, rsa_priv_pem: bytes, chunk_size: int = CHUNK_SIZE) -> None:
+    """
+    Descifra un sobre multi-destinatario con la clave privada de uno de ellos.
+    
+    La entrada se localiza por key_id, así que solo se hace un descifrado RSA.
+    
+    Raises:
+        ValueError: Si la clave no es destinataria o la autenticación falla
+    """
+    header, entries = read_envelope_header(fin)
+    priv = load_private_key(rsa_priv_pem)
+    enc_key = entries.get(key_fingerprint(priv))
+    if enc_key is None:
+        raise ValueError("La clave privada no figura entre los destinatarios del sobre")
+    aes_key = rsa_decrypt(enc_key, priv)
+    decrypt_stream_gcm(fin, fout, aes_key, chunk_size, associated_data=header)
+
+@instrumented
+def encrypt_path_hybrid_multi(input_file: str, output_file: str, rsa_pub_pems, chunk_size: int = CHUNK_SIZE):
+    """
+    Cifra un archivo para varios destinatarios.
+    
+    Returns:
+        list: key_id de cada destinatario incluido
+    """
+    with open(input_file, 'rb') as fin, atomic_output(output_file) as fout:
+        return encrypt_stream_hybrid_multi(fin, fout, rsa_pub_pems, chunk_size)
+
+@instrumented
+def decrypt_path_hybrid_multi(input_file: str, output_file: str, rsa_priv_pem: bytes, chunk_size: int = CHUNK_SIZE):
+    """
+    Descifra un sobre multi-destinatario a un archivo (temporal + renombrado).
+    
+    Raises:
+        ValueError: Si la clave no es destinataria o la autenticación falla
+    """
+    with open(input_file, 'rb') as fin, atomic_output(output_file) as fout:
+        decrypt_stream_hybrid_multi(fin, fout, rsa_priv_pem, chunk_size)
@@ -0,0 +1,291 @@
+# kdf.py
+"""
+Derivación de claves a partir de contraseñas (PBKDF2-HMAC-SHA256 y scrypt).
+
+- Parámetros como dict: {"kdf": "pbkdf2-sha256", "iterations": n} o
+  {"kdf": "scrypt", "n": 2**15, "r": 8, "p": 1}. Se guardan, junto con el
+  salt, en la cabecera de los archivos cifrados con contraseña
+  (`pack_header` / `read_header`), así que cada archivo sabe cómo se derivó
+  su clave aunque cambien los valores por defecto.
+- `calibrate` elige el coste para que una derivación tarde lo indicado en
+  esta máquina.
+- `derive_key` guarda las claves derivadas en una caché LRU con caducidad:
+  descifrar un lote de archivos con la misma contraseña (y salt) paga la
+  derivación una sola vez, también con varios hilos a la vez.
+"""
+import hmac
+import struct
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from Crypto.Hash import SHA256
+from Crypto.Protocol.KDF import PBKDF2, scrypt
+from Crypto.Random import get_random_bytes
+
+from metrics import instrumented
+
+KDF_PBKDF2 = "pbkdf2-sha256"
+KDF_SCRYPT = "scrypt"
+
+SALT_SIZE = 16
+KEY_SIZE = 32
+
+DEFAULT_PBKDF2_ITERATIONS = 600_000
+DEFAULT_SCRYPT = {"n": 2 ** 15, "r": 8, "p": 1}
+
+# Límites al leer cabeceras: un archivo manipulado no puede pedir un coste absurdo
+MAX_PBKDF2_ITERATIONS = 50_000_000
+MAX_SCRYPT_MEMORY = 1024 ** 3
+
+# ========== PARÁMETROS ==========
+
+def default_params(kdf: str = KDF_PBKDF2) -> dict:
+    if kdf == KDF_PBKDF2:
+        return {"kdf": KDF_PBKDF2, "iterations": DEFAULT_PBKDF2_ITERATIONS}
+    if kdf == KDF_SCRYPT:
+        return {"kdf": KDF_SCRYPT, **DEFAULT_SCRYPT}
+    raise ValueError(f"KDF desconocida: {kdf}")
+
+def validate_params(params: dict) -> dict:
+    """
+    Comprueba que los parámetros son coherentes y están dentro de los límites.
+
+    Raises:
+        ValueError: Si la KDF es desconocida, falta algún parámetro, no es
+            entero o el coste está fuera de rango
+    """
+    kdf = params.get("kdf")
+    required = {KDF_PBKDF2: ("iterations",), KDF_SCRYPT: ("n", "r", "p")}.get(kdf, ())
+    missing = [name for name in required if name not in params]
+    if missing:
+        raise ValueError(f"Faltan parámetros de {kdf}: {', '.join(missing)}")
+    try:
+        # Se convierte antes de comparar: un valor no entero ("1000", None, 1.5)
+        # es un parámetro inválido, no un TypeError a mitad de la comprobación
+        values = {name: int(params[name]) for name in required}
+        if any(values[name] != params[name] for name in required):
+            raise ValueError
+    except (TypeError, ValueError):
+        raise ValueError(f"Parámetros de {kdf} no enteros: "
+                         f"{', '.join(f'{name}={params[name]!r}' for name in required)}") from None
+    if kdf == KDF_PBKDF2:
+        if not 1 <= values["iterations"] <= MAX_PBKDF2_ITERATIONS:
+            raise ValueError("Número de iteraciones PBKDF2 fuera de rango")
+        return {"kdf": kdf, **values}
+    if kdf == KDF_SCRYPT:
+        n, r, p = values["n"], values["r"], values["p"]
+        if n < 2 or n & (n - 1) or r < 1 or p < 1:
+            raise ValueError("Parámetros scrypt inválidos (n debe ser potencia de 2)")
+        if 128 * r * n > MAX_SCRYPT_MEMORY or p > 16:
+            raise ValueError("Parámetros scrypt fuera de rango")
+        return {"kdf": kdf, **values}
+    raise ValueError(f"KDF desconocida: {kdf}")
+
+def _params_key(params: dict) -> tuple:
+    return tuple(sorted(params.items()))
+
+def _normalize_password(password) -> bytes:
+    # NFC: la misma contraseña tecleada en sistemas distintos da los mismos bytes
+    if isinstance(password, str):
+        return unicodedata.normalize("NFC", password).encode("utf-8")
+    return bytes(password)
+
+def _derive(password: bytes, salt: bytes, params: dict, key_size: int) -> bytes:
+    if params["kdf"] == KDF_PBKDF2:
+        return PBKDF2(password, salt, dkLen=key_size, count=params["iterations"], hmac_hash_module=SHA256)
+    return scrypt(password, salt, key_len=key_size, N=params["n"], r=params["r"], p=params["p"])
+
+# ========== CACHÉ DE CLAVES DERIVADAS ==========
+# Índice: (HMAC(secreto del proceso, contraseña), salt, parámetros, tamaño).
+# El secreto es aleatorio y solo vive en memoria, así que la caché no
+# contiene nada que permita probar contraseñas más rápido que con la KDF.
+# Las entradas caducan a los `ttl` segundos; con tamaño 0 queda desactivada.
+KDF_CACHE_SIZE = 64
+KDF_CACHE_TTL = 300.0
+
+_process_secret = get_random_bytes(32)
+_kdf_cache = OrderedDict()
+_kdf_cache_lock = threading.Lock()
+_kdf_cache_max = KDF_CACHE_SIZE
+_kdf_cache_ttl = KDF_CACHE_TTL
+_kdf_in_flight = {}
+_kdf_cache_hits = 0
+_kdf_cache_misses = 0
+
+def _cache_lookup(cache_key, now: float):
+    entry = _kdf_cache.get(cache_key)
+    if entry is None:
+        return None
+    key, expires = entry
+    if expires <= now:
+        del _kdf_cache[cache_key]
+        return None
+    _kdf_cache.move_to_end(cache_key)
+    return key
+
+@instrumented(rest="compute")
+def derive_key(password, salt: bytes, params: dict, key_size: int = KEY_SIZE) -> bytes:
+    """
+    Deriva una clave de `password` (str o bytes) con la caché de claves derivadas.
+
+    Si otro hilo ya está derivando la misma clave, se espera a su resultado
+    en lugar de repetir el cálculo.
+    """
+    global _kdf_cache_hits, _kdf_cache_misses
+    params = validate_params(params)
+    password = _normalize_password(password)
+    cache_key = (hmac.new(_process_secret, password, "sha256").digest(), bytes(salt),
+                 _params_key(params), key_size)
+
+    while True:
+        with _kdf_cache_lock:
+            key = _cache_lookup(cache_key, time.monotonic())
+            if key is not None:
+                _kdf_cache_hits += 1
+                return key
+            pending = _kdf_in_flight.get(cache_key)
+            if pending is None:
+                _kdf_cache_misses += 1
+                pending = _kdf_in_flight[cache_key] = threading.Event()
+                break
+        pending.wait()
+        if _kdf_cache_max == 0:
+            break  # sin caché no hay resultado que recoger: se deriva aquí
+
+    try:
+        key = _derive(password, salt, params, key_size)
+        with _kdf_cache_lock:
+            if _kdf_cache_max > 0:
+                _kdf_cache[cache_key] = (key, time.monotonic() + _kdf_cache_ttl)
+                while len(_kdf_cache) > _kdf_cache_max:
+                    _kdf_cache.popitem(last=False)
+        return key
+    finally:
+        with _kdf_cache_lock:
+            if _kdf_in_flight.get(cache_key) is pending:
+                del _kdf_in_flight[cache_key]
+        pending.set()
+
+def kdf_cache_info() -> dict:
+    """Estadísticas de la caché de claves derivadas: hits, misses, size, maxsize, ttl."""
+    with _kdf_cache_lock:
+        return {
+            "hits": _kdf_cache_hits,
+            "misses": _kdf_cache_misses,
+            "size": len(_kdf_cache),
+            "maxsize": _kdf_cache_max,
+            "ttl": _kdf_cache_ttl
+        }
+
+def set_kdf_cache(maxsize: int = None, ttl: float = None):
+    """Cambia el tamaño máximo (0 la desactiva) y/o la caducidad en segundos."""
+    global _kdf_cache_max, _kdf_cache_ttl
+    if (maxsize is not None and maxsize < 0) or (ttl is not None and ttl <= 0):
+        raise ValueError("maxsize debe ser >= 0 y ttl > 0")
+    with _kdf_cache_lock:
+        if maxsize is not None:
+            _kdf_cache_max = maxsize
+            while len(_kdf_cache) > maxsize:
+                _kdf_cache.popitem(last=False)
+        if ttl is not None:
+            _kdf_cache_ttl = ttl
+
+def clear_kdf_cache():
+    """Vacía la caché (las claves derivadas dejan de estar en memoria) y reinicia los contadores."""
+    global _kdf_cache_hits, _kdf_cache_misses
+    with _kdf_cache_lock:
+        _kdf_cache.clear()
+        _kdf_cache_hits = 0
+        _kdf_cache_misses = 0
+
+# ========== CALIBRACIÓN ==========
+
+def calibrate(target_seconds: float = 0.5, kdf: str = KDF_PBKDF2, max_scrypt_memory: int = 256 * 1024 ** 2) -> dict:
+    """
+    Elige el coste para que una derivación tarde unos `target_seconds` aquí.
+
+    PBKDF2: se mide una ronda de prueba y se escala linealmente (nunca por
+    debajo de 100 000 iteraciones). scrypt: se dobla N (r=8, p=1) hasta
+    alcanzar el objetivo o el límite de memoria (128·r·N bytes).
+
+    Returns:
+        dict: Parámetros listos para `derive_key` / cifrado con contraseña
+    """
+    salt = get_random_bytes(SALT_SIZE)
+    if kdf == KDF_PBKDF2:
+        probe = 20_000
+        start = time.perf_counter()
+        _derive(b"calibracion", salt, {"kdf": KDF_PBKDF2, "iterations": probe}, KEY_SIZE)
+        elapsed = max(time.perf_counter() - start, 1e-6)
+        iterations = int(probe * target_seconds / elapsed)
+        iterations = min(max(iterations, 100_000), MAX_PBKDF2_ITERATIONS)
+        return {"kdf": KDF_PBKDF2, "iterations": iterations // 1000 * 1000}
+    if kdf == KDF_SCRYPT:
+        params = {"kdf": KDF_SCRYPT, "n": 2 ** 14, "r": 8, "p": 1}
+        while True:
+            start = time.perf_counter()
+            _derive(b"calibracion", salt, params, KEY_SIZE)
+            elapsed = time.perf_counter() - start
+            # Con N doble el tiempo se dobla: parar si el siguiente se pasaría más que este se queda corto
+            if elapsed * 2 > target_seconds * 1.5 or 128 * 8 * params["n"] * 2 > max_scrypt_memory:
+                return params
+            params["n"] *= 2
+    raise ValueError(f"KDF desconocida: {kdf}")
+
+# ========== CABECERA DE ARCHIVOS CON CONTRASEÑA ==========
+# MAGIC (4) | versión (1) | kdf (1) | len salt (1) | salt | parámetros
+#   pbkdf2-sha256: iteraciones (uint32)
+#   scrypt:        log2(N) (uint8), r (uint16), p (uint8)
+
+HEADER_MAGIC = b"CPWD"
+HEADER_VERSION = 1
+_KDF_IDS = {KDF_PBKDF2: 1, KDF_SCRYPT: 2}
+
+def new_salt() -> bytes:
+    return get_random_bytes(SALT_SIZE)
+
+def pack_header(params: dict, salt: bytes) -> bytes:
+    params = validate_params(params)
+    if not SALT_SIZE <= len(salt) <= 255:
+        raise ValueError(f"El salt debe tener entre {SALT_SIZE} y 255 bytes")
+    head = HEADER_MAGIC + bytes([HEADER_VERSION, _KDF_IDS[params["kdf"]], len(salt)]) + salt
+    if params["kdf"] == KDF_PBKDF2:
+        return head + struct.pack(">I", params["iterations"])
+    return head + struct.pack(">BHB", params["n"].bit_length() - 1, params["r"], params["p"])
+
+def read_header(fin):
+    """
+    Lee la cabecera de un flujo cifrado con contraseña.
+
+    Raises:
+        ValueError: Si no es un archivo cifrado con contraseña o la cabecera está dañada
+
+    Returns:
+        tuple: (cabecera en bytes, parámetros, salt)
+    """
+    head = fin.read(7)
+    if len(head) != 7 or head[:4] != HEADER_MAGIC:
+        raise ValueError("No es un archivo cifrado con contraseña")
+    if head[4] != HEADER_VERSION:
+        raise ValueError(f"Versión de cabecera no soportada: {head[4]}")
+    if head[6] < SALT_SIZE:
+        raise ValueError(f"Salt demasiado corto en la cabecera ({head[6]} bytes)")
+    salt = fin.read(head[6])
+    if head[5] == _KDF_IDS[KDF_PBKDF2]:
+        raw = fin.read(4)
+        if len(salt) != head[6] or len(raw) != 4:
+            raise ValueError("Cabecera truncada")
+        params = {"kdf": KDF_PBKDF2, "iterations": struct.unpack(">I", raw)[0]}
+    elif head[5] == _KDF_IDS[KDF_SCRYPT]:
+        raw = fin.read(4)
+        if len(salt) != head[6] or len(raw) != 4:
+            raise ValueError("Cabecera truncada")
+        log_n, r, p = struct.unpack(">BHB", raw)
+        if log_n >= 32:
+            raise ValueError("Parámetros scrypt fuera de rango")
+        params = {"kdf": KDF_SCRYPT, "n": 1 << log_n, "r": r, "p": p}
+    else:
+        raise ValueError("KDF desconocida en la cabecera")
+    return head + salt + raw, validate_params(params), salt
@@ -0,0 +1,204 @@
+# keypool.py
+"""
+Pool de pares de claves RSA pregenerados en segundo plano.
+
+RSA.generate tarda de cientos de ms a segundos para 2048 bits. El pool
+mantiene `target_depth` pares listos, generados en procesos aparte, y los
+entrega al instante. Opcionalmente los persiste cifrados (AES-GCM) en un
+directorio de spool para sobrevivir a reinicios.
+
+Uso:
+    with RSAKeyPool(bits=2048, target_depth=4) as pool:
+        priv_pem, pub_pem = pool.get_keypair()
+"""
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+import os
+import threading
+import time
+import uuid
+
+from aescipher import encrypt_gcm, decrypt_gcm, atomic_output, GCM_NONCE_SIZE, GCM_TAG_SIZE
+from rsautils import generate_rsa_keypair, load_private_key
+
+SPOOL_SUFFIX = ".key"
+RATE_WINDOW = 32
+
+class RSAKeyPool:
+    """
+    Pool de claves RSA con reposición automática.
+
+    Args:
+        bits: Tamaño de las claves
+        target_depth: Número de pares que se intenta tener listos
+        workers: Procesos dedicados a generar claves
+        spool_dir: Directorio donde persistir las claves (opcional)
+        spool_key: Clave AES para cifrar el spool (obligatoria con spool_dir)
+    """
+
+    def __init__(self, bits: int = 2048, target_depth: int = 4, workers: int = 2,
+                 spool_dir: str = None, spool_key: bytes = None):
+        if target_depth < 1:
+            raise ValueError("target_depth debe ser >= 1")
+        if spool_dir and not spool_key:
+            raise ValueError("Se necesita spool_key para cifrar el spool de claves")
+
+        self.bits = bits
+        self.target_depth = target_depth
+        self.workers = workers
+        self.spool_dir = spool_dir
+        self._spool_key = spool_key
+
+        self._keys = deque()  # (private_pem, public_pem, ruta en el spool o None)
+        self._cond = threading.Condition()
+        self._executor = None
+        self._pending = 0
+        self._closed = False
+
+        self._generated = 0
+        self._served = 0
+        self._misses = 0
+        self._completed_at = deque(maxlen=RATE_WINDOW)
+
+        if spool_dir:
+            os.makedirs(spool_dir, exist_ok=True)
+            self._load_spool()
+
+    # --- Ciclo de vida ---
+    def start(self):
+        """Arranca los procesos generadores y rellena el pool hasta target_depth."""
+        with self._cond:
+            if self._executor is None:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            self._closed = False
+        self._refill()
+        return self
+
+    def close(self):
+        """Detiene la generación. Las claves del spool se conservan para la próxima vez."""
+        with self._cond:
+            self._closed = True
+            executor, self._executor = self._executor, None
+            self._cond.notify_all()
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- Entrega de claves ---
+    def get_keypair(self, timeout: float = 0):
+        """
+        Entrega un par de claves del pool.
+
+        Args:
+            timeout: Segundos a esperar si el pool está vacío. Si vence (o es 0)
+                se genera un par de forma síncrona.
+
+        Returns:
+            tuple: (private_pem, public_pem)
+        """
+        keypair = None
+        with self._cond:
+            if not self._keys and timeout and self._executor is not None:
+                self._cond.wait_for(lambda: self._keys or self._closed, timeout)
+            while keypair is None and self._keys:
+                priv_pem, pub_pem, spool_path = self._keys.popleft()
+                if spool_path:
+                    # Se borra antes de entregarla: una clave nunca sale dos veces.
+                    # Si ya no está, otro proceso que comparte el spool se la llevó
+                    try:
+                        os.remove(spool_path)
+                    except FileNotFoundError:
+                        continue
+                keypair = (priv_pem, pub_pem)
+            if keypair is None:
+                self._misses += 1
+            else:
+                self._served += 1
+
+        if keypair is None:
+            keypair = generate_rsa_keypair(self.bits)
+
+        self._refill()
+        return keypair
+
+    def stats(self) -> dict:
+        """
+        Métricas del pool.
+
+        Returns:
+            dict: depth, target_depth, pending, generated, served, misses,
+                refill_rate (pares/s en la ventana reciente)
+        """
+        with self._cond:
+            times = list(self._completed_at)
+            return {
+                "depth": len(self._keys),
+                "target_depth": self.target_depth,
+                "pending": self._pending,
+                "generated": self._generated,
+                "served": self._served,
+                "misses": self._misses,
+                "refill_rate": (len(times) - 1) / (times[-1] - times[0])
+                if len(times) > 1 and times[-1] > times[0] else 0.0
+            }
+
+    # --- Reposición ---
+    def _refill(self):
+        with self._cond:
+            if self._executor is None or self._closed:
+                return
+            while len(self._keys) + self._pending < self.target_depth:
+                future = self._executor.submit(generate_rsa_keypair, self.bits)
+                self._pending += 1
+                future.add_done_callback(self._on_generated)
+
+    def _on_generated(self, future):
+        with self._cond:
+            self._pending -= 1
+        if future.cancelled() or future.exception() is not None:
+            return
+
+        priv_pem, pub_pem = future.result()
+        spool_path = self._spool_write(priv_pem) if self.spool_dir else None
+        with self._cond:
+            self._keys.append((priv_pem, pub_pem, spool_path))
+            self._generated += 1
+            self._completed_at.append(time.monotonic())
+            self._cond.notify_all()
+        self._refill()
+
+    # --- Spool cifrado ---
+    def _spool_write(self, priv_pem: bytes) -> str:
+        path = os.path.join(self.spool_dir, uuid.uuid4().hex + SPOOL_SUFFIX)
+        nonce, ciphertext, tag = encrypt_gcm(priv_pem, self._spool_key)
+        with atomic_output(path) as f:
+            f.write(nonce + tag + ciphertext)
+        return path
+
+    def _load_spool(self):
+        for entry in os.scandir(self.spool_dir):
+            if not entry.name.endswith(SPOOL_SUFFIX) or not entry.is_file():
+                continue
+            try:
+                with open(entry.path, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                # Otro proceso con el mismo spool la consumió entre scandir y open
+                continue
+            nonce = data[:GCM_NONCE_SIZE]
+            tag = data[GCM_NONCE_SIZE:GCM_NONCE_SIZE + GCM_TAG_SIZE]
+            ciphertext = data[GCM_NONCE_SIZE + GCM_TAG_SIZE:]
+            try:
+                priv_pem = decrypt_gcm(nonce, ciphertext, tag, self._spool_key)
+                key = load_private_key(priv_pem)
+            except ValueError:
+                print(f"Aviso: clave del spool ilegible, se ignora: {entry.path}")
+                continue
+            if key.size_in_bits() != self.bits:
+                continue
+            self._keys.append((priv_pem, key.publickey().export_key(), entry.path))
@@ -0,0 +1,294 @@
+# metrics.py
+"""
+Instrumentación opcional de las operaciones criptográficas.
+
+Las funciones públicas de aescipher, rsautils, hashutils e hybrid llevan el
+decorador `instrumented`. Con las métricas desactivadas (por defecto) el
+único coste es comprobar un booleano por llamada. Activadas, cada operación
+registra:
+
+- llamadas, errores (excepciones, o devolver False en las funciones que
+  capturan el fallo) y bytes procesados
+- histograma de latencias
+- tiempo por fase: io_read, compute, io_write. Los bucles de streaming
+  (transform_stream, hash_file) miden cada bloque por separado; el tiempo
+  que no se atribuye a ninguna fase (abrir archivos, renombrar...) aparece
+  como "other"
+
+Si una operación instrumentada llama a otra, la interior se cuenta por su
+cuenta y además suma sus fases a la exterior. Lo que se ejecuta en
+otros hilos o procesos (hojas Merkle, lotes de firmas) no se atribuye a la
+operación que los lanzó.
+
+Uso:
+    import metrics
+    metrics.enable()              # o variable de entorno CRYPTO_METRICS=1
+    encrypt_file_gcm("a.bin", "a.enc", key)
+    print(metrics.to_prometheus())
+"""
+import contextvars
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+PHASES = ("io_read", "compute", "io_write")
+
+# Límites superiores (segundos) de los cubos del histograma de latencias
+LATENCY_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 60.0)
+
+_enabled = os.environ.get("CRYPTO_METRICS", "") not in ("", "0")
+_lock = threading.Lock()
+_stats = {}
+_current = contextvars.ContextVar("crypto_metrics_operation", default=None)
+
+def enabled() -> bool:
+    return _enabled
+
+def enable():
+    global _enabled
+    _enabled = True
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def reset():
+    """Borra todo lo acumulado."""
+    with _lock:
+        _stats.clear()
+
+# ========== OPERACIÓN EN CURSO ==========
+
+class Operation:
+    """Medición de una llamada en curso (la obtienen los bucles con `current()`)."""
+    __slots__ = ("name", "bytes", "phases")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.bytes = 0
+        self.phases = dict.fromkeys(PHASES, 0)
+
+    def add_bytes(self, n: int):
+        self.bytes += n
+
+    def add_phase(self, phase: str, ns: int):
+        self.phases[phase] += ns
+
+def current():
+    """Operación instrumentada en curso en este hilo, o None (también si están desactivadas)."""
+    return _current.get() if _enabled else None
+
+def add_bytes(n: int):
+    op = current()
+    if op is not None:
+        op.add_bytes(n)
+
+@contextmanager
+def _timed_phase(op: Operation, name: str):
+    start = time.perf_counter_ns()
+    try:
+        yield
+    finally:
+        op.add_phase(name, time.perf_counter_ns() - start)
+
+@contextmanager
+def _no_phase():
+    yield
+
+def phase(name: str):
+    """
+    Context manager que suma el tiempo del bloque a la fase `name` de la
+    operación en curso. Sin operación en curso no mide nada.
+    """
+    op = current()
+    return _no_phase() if op is None else _timed_phase(op, name)
+
+class _TimedFile:
+    """Envoltorio que mide read()/write() como fases de E/S (y cuenta los bytes leídos)."""
+
+    def __init__(self, f, op: Operation):
+        self._f = f
+        self._op = op
+
+    def read(self, size: int = -1) -> bytes:
+        start = time.perf_counter_ns()
+        data = self._f.read(size)
+        self._op.add_phase("io_read", time.perf_counter_ns() - start)
+        self._op.add_bytes(len(data))
+        return data
+
+    def write(self, data) -> int:
+        start = time.perf_counter_ns()
+        n = self._f.write(data)
+        self._op.add_phase("io_write", time.perf_counter_ns() - start)
+        return n
+
+    def __getattr__(self, name):
+        return getattr(self._f, name)
+
+def timed_io(*files):
+    """
+    Para bucles propios (que no pasan por transform_stream): devuelve los
+    archivos envueltos para medir su E/S, o los mismos si no hay operación en curso.
+    """
+    op = current()
+    if op is None:
+        return files if len(files) > 1 else files[0]
+    wrapped = tuple(_TimedFile(f, op) for f in files)
+    return wrapped if len(wrapped) > 1 else wrapped[0]
+
+# ========== ACUMULADO POR OPERACIÓN ==========
+
+class _OperationStats:
+    __slots__ = ("count", "errors", "bytes", "ns", "phases", "buckets")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.bytes = 0
+        self.ns = 0
+        self.phases = dict.fromkeys(PHASES + ("other",), 0)
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)  # el último es +Inf
+
+def _record(op: Operation, elapsed_ns: int, failed: bool, rest_phase: str):
+    measured = sum(op.phases.values())
+    rest = max(elapsed_ns - measured, 0)
+    seconds = elapsed_ns / 1e9
+    bucket = next((i for i, limit in enumerate(LATENCY_BUCKETS) if seconds <= limit), len(LATENCY_BUCKETS))
+    with _lock:
+        stats = _stats.get(op.name)
+        if stats is None:
+            stats = _stats[op.name] = _OperationStats()
+        stats.count += 1
+        stats.errors += failed
+        stats.bytes += op.bytes
+        stats.ns += elapsed_ns
+        stats.buckets[bucket] += 1
+        for name, ns in op.phases.items():
+            stats.phases[name] += ns
+        stats.phases[rest_phase or "other"] += rest
+    if rest_phase:
+        op.phases[rest_phase] += rest
+
+def instrumented(func=None, *, name: str = None, bytes_arg: str = None, rest: str = None,
+                 failure_on_false: bool = False):
+    """
+    Decorador que mide cada llamada a `func` cuando las métricas están activadas.
+
+    Args:
+        name: Nombre de la operación (por defecto "<módulo>.<función>" o "<módulo>.<Clase>.<método>")
+        bytes_arg: Parámetro cuyo len() son los bytes procesados (funciones
+            en memoria; las de streaming los cuentan en sus bucles)
+        rest: Fase a la que se atribuye el tiempo no medido por fases (p. ej.
+            "compute" en funciones sin E/S); por defecto "other"
+        failure_on_false: Contar como error una llamada que devuelve False
+            (funciones que capturan el fallo, p. ej. decrypt_file_gcm)
+    """
+    if func is None:
+        return functools.partial(instrumented, name=name, bytes_arg=bytes_arg, rest=rest,
+                                 failure_on_false=failure_on_false)
+
+    op_name = name or f"{Path(func.__code__.co_filename).stem}.{func.__qualname__}"
+    position = list(inspect.signature(func).parameters).index(bytes_arg) if bytes_arg else None
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        if not _enabled:
+            return func(*args, **kwargs)
+        op = Operation(op_name)
+        if bytes_arg:
+            data = args[position] if len(args) > position else kwargs.get(bytes_arg)
+            if data is not None:
+                op.bytes = len(data)
+        parent = _current.get()
+        token = _current.set(op)
+        failed = True
+        start = time.perf_counter_ns()
+        try:
+            result = func(*args, **kwargs)
+            failed = failure_on_false and result is False
+            return result
+        finally:
+            elapsed = time.perf_counter_ns() - start
+            _current.reset(token)
+            _record(op, elapsed, failed, rest)
+            if parent is not None:
+                # Varias pasadas internas suelen ser sobre los mismos datos (cifrar + HMAC):
+                # los bytes de la exterior son el máximo, no la suma
+                parent.bytes = max(parent.bytes, op.bytes)
+                for phase_name in PHASES:
+                    parent.phases[phase_name] += op.phases[phase_name]
+    return wrapper
+
+# ========== EXPORTACIÓN ==========
+
+def snapshot() -> dict:
+    """
+    Copia de lo acumulado, por operación:
+    {count, errors, bytes, seconds, mb_per_s, phases: {fase: segundos},
+     histogram: {límite: llamadas acumuladas, ..., "+Inf": count}}
+    """
+    with _lock:
+        items = [(name, stats, list(stats.buckets), dict(stats.phases)) for name, stats in _stats.items()]
+    result = {}
+    for name, stats, buckets, phases in sorted(items, key=lambda item: item[0]):
+        seconds = stats.ns / 1e9
+        cumulative, histogram = 0, {}
+        for limit, count in zip(LATENCY_BUCKETS + ("+Inf",), buckets):
+            cumulative += count
+            histogram[str(limit)] = cumulative
+        result[name] = {
+            "count": stats.count,
+            "errors": stats.errors,
+            "bytes": stats.bytes,
+            "seconds": round(seconds, 9),
+            "mb_per_s": round(stats.bytes / (1024 * 1024) / seconds, 2) if seconds and stats.bytes else None,
+            "phases": {phase_name: round(ns / 1e9, 9) for phase_name, ns in phases.items()},
+            "histogram": histogram
+        }
+    return result
+
+def to_json(indent: int = 2) -> str:
+    return json.dumps(snapshot(), indent=indent)
+
+def to_prometheus(prefix: str = "crypto") -> str:
+    """Instantánea en el formato de texto de Prometheus (counters + histograma)."""
+    data = snapshot()
+    lines = []
+
+    def family(metric, kind, help_text):
+        lines.append(f"# HELP {prefix}_{metric} {help_text}")
+        lines.append(f"# TYPE {prefix}_{metric} {kind}")
+
+    family("operations_total", "counter", "Llamadas por operación")
+    for op, s in data.items():
+        lines.append(f'{prefix}_operations_total{{op="{op}"}} {s["count"]}')
+    family("operation_errors_total", "counter", "Llamadas que terminaron con excepción o devolución de False")
+    for op, s in data.items():
+        lines.append(f'{prefix}_operation_errors_total{{op="{op}"}} {s["errors"]}')
+    family("bytes_total", "counter", "Bytes procesados")
+    for op, s in data.items():
+        lines.append(f'{prefix}_bytes_total{{op="{op}"}} {s["bytes"]}')
+    family("phase_seconds_total", "counter", "Tiempo por fase (io_read, compute, io_write, other)")
+    for op, s in data.items():
+        for phase_name, seconds in s["phases"].items():
+            lines.append(f'{prefix}_phase_seconds_total{{op="{op}",phase="{phase_name}"}} {seconds}')
+    family("operation_duration_seconds", "histogram", "Latencia por llamada")
+    for op, s in data.items():
+        for limit, count in s["histogram"].items():
+            lines.append(f'{prefix}_operation_duration_seconds_bucket{{op="{op}",le="{limit}"}} {count}')
+        lines.append(f'{prefix}_operation_duration_seconds_sum{{op="{op}"}} {s["seconds"]}')
+        lines.append(f'{prefix}_operation_duration_seconds_count{{op="{op}"}} {s["count"]}')
+    return "\n".join(lines) + "\n"
+
+def dump(path: str):
+    """Guarda la instantánea: formato Prometheus si la extensión es .prom, JSON en otro caso."""
+    from aescipher import atomic_output
+    text = to_prometheus() if path.endswith(".prom") else to_json()
+    with atomic_output(path) as f:
+        f.write(text.encode())
@@ -4,36 +4,116 @@ from Crypto.Cipher import PKCS1_OAEP
 from Crypto.Signature import pss
 from Crypto.Hash import SHA256
 from Crypto.Random import get_random_bytes
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+import os
+import threading
+
+from hashutils import hash_file
+import metrics
+from metrics import instrumented
 
 # Generar par de claves RSA
+@instrumented(rest="compute")
 def generate_rsa_keypair(bits=2048):
     key = RSA.generate(bits)
     private_pem = key.export_key()
     public_pem = key.publickey().export_key()
     return private_pem, public_pem
 
+# --- Caché LRU de claves ya parseadas ---
+# RSA.import_key (PEM + ASN.1) es caro; las mismas claves se cargan una y otra
+# vez (GUI, descifrado híbrido masivo). La caché se indexa por el SHA-256 del
+# PEM, así que no guarda el PEM en sí. Con tamaño 0 queda desactivada.
+KEY_CACHE_SIZE = 32
+
+_key_cache = OrderedDict()
+_key_cache_lock = threading.Lock()
+_key_cache_max = KEY_CACHE_SIZE
+_key_cache_hits = 0
+_key_cache_misses = 0
+
+def _import_key_cached(pem_bytes):
+    global _key_cache_hits, _key_cache_misses
+    if isinstance(pem_bytes, RSA.RsaKey):
+        return pem_bytes
+    data = pem_bytes.encode() if isinstance(pem_bytes, str) else bytes(pem_bytes)
+    fingerprint = SHA256.new(data).digest()
+    
+    with _key_cache_lock:
+        key = _key_cache.get(fingerprint)
+        if key is not None:
+            _key_cache.move_to_end(fingerprint)
+            _key_cache_hits += 1
+            return key
+        _key_cache_misses += 1
+    
+    key = RSA.import_key(data)
+    with _key_cache_lock:
+        if _key_cache_max > 0:
+            _key_cache[fingerprint] = key
+            while len(_key_cache) > _key_cache_max:
+                _key_cache.popitem(last=False)
+    return key
+
+def key_cache_info() -> dict:
+    """Estadísticas de la caché de claves: hits, misses, size, maxsize."""
+    with _key_cache_lock:
+        return {
+            "hits": _key_cache_hits,
+            "misses": _key_cache_misses,
+            "size": len(_key_cache),
+            "maxsize": _key_cache_max
+        }
+
+def set_key_cache_size(maxsize: int):
+    """Cambia el tamaño máximo de la caché (0 la desactiva)."""
+    global _key_cache_max
+    if maxsize < 0:
+        raise ValueError("maxsize debe ser >= 0")
+    with _key_cache_lock:
+        _key_cache_max = maxsize
+        while len(_key_cache) > maxsize:
+            _key_cache.popitem(last=False)
+
+def clear_key_cache():
+    """Vacía la caché de claves y reinicia los contadores."""
+    global _key_cache_hits, _key_cache_misses
+    with _key_cache_lock:
+        _key_cache.clear()
+        _key_cache_hits = 0
+        _key_cache_misses = 0
+
 def load_private_key(pem_bytes):
-    return RSA.import_key(pem_bytes)
+    return _import_key_cached(pem_bytes)
 
 def load_public_key(pem_bytes):
-    return RSA.import_key(pem_bytes)
+    return _import_key_cached(pem_bytes)
+
+def key_fingerprint(key) -> bytes:
+    """Identificador de clave: SHA-256 de la clave pública en DER (sirve con la privada)."""
+    return SHA256.new(key.publickey().export_key(format='DER')).digest()
 
 # Cifrado con OAEP (solo para mensajes cortos -> usar esquema híbrido para archivos)
+@instrumented(bytes_arg="message", rest="compute")
 def rsa_encrypt(message: bytes, public_key):
     cipher = PKCS1_OAEP.new(public_key, hashAlgo=SHA256)
     return cipher.encrypt(message)
 
+@instrumented(bytes_arg="ciphertext", rest="compute")
 def rsa_decrypt(ciphertext: bytes, private_key):
     cipher = PKCS1_OAEP.new(private_key, hashAlgo=SHA256)
     return cipher.decrypt(ciphertext)
 
 # Firma con PSS
+@instrumented(bytes_arg="message", rest="compute")
 def sign_message(message: bytes, private_key):
     h = SHA256.new(message)
     signer = pss.new(private_key)
     signature = signer.sign(h)
     return signature
 
+@instrumented(bytes_arg="message", rest="compute")
 def verify_signature(message: bytes, signature: bytes, public_key):
     h = SHA256.new(message)
     verifier = pss.new(public_key)
@@ -42,3 +122,262 @@ def verify_signature(message: bytes, signature: bytes, public_key):
         return True
     except (ValueError, TypeError):
         return False
+
+# ========== FIRMA DE ARCHIVOS GRANDES ==========
+
+def _sha256_file(path, use_mmap: bool = False):
+    """SHA-256 de un archivo con memoria constante (readinto sobre un buffer o desde un mmap)."""
+    return hash_file(path, SHA256.new(), use_mmap=use_mmap)
+
+@instrumented(rest="compute")
+def sign_file(path: str, private_key, use_mmap: bool = False) -> bytes:
+    """
+    Firma un archivo con RSA-PSS sin cargarlo en memoria.
+    
+    La firma es la misma que daría sign_message con el contenido completo,
+    así que se puede verificar con cualquiera de las dos funciones.
+    
+    Args:
+        path: Ruta del archivo a firmar
+        private_key: Clave privada (RsaKey o PEM)
+        use_mmap: Hashear desde un mmap en lugar de leer por bloques
+    
+    Returns:
+        bytes: Firma
+    """
+    h = _sha256_file(path, use_mmap)
+    return pss.new(_import_key_cached(private_key)).sign(h)
+
+@instrumented(rest="compute")
+def verify_file(path: str, signature: bytes, public_key, use_mmap: bool = False) -> bool:
+    """
+    Verifica la firma RSA-PSS de un archivo leyéndolo por bloques.
+    
+    Args:
+        path: Ruta del archivo firmado
+        signature: Firma a verificar
+        public_key: Clave pública (RsaKey o PEM)
+        use_mmap: Hashear desde un mmap en lugar de leer por bloques
+    
+    Returns:
+        bool: True si la firma es válida
+    """
+    h = _sha256_file(path, use_mmap)
+    verifier = pss.new(_import_key_cached(public_key))
+    try:
+        verifier.verify(h, signature)
+        return True
+    except (ValueError, TypeError):
+        return False
+
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+def _sha256_stream(fin):
+    fin = metrics.timed_io(fin)
+    h = SHA256.new()
+    while chunk := fin.read(STREAM_CHUNK_SIZE):
+        h.update(chunk)
+    return h
+
+@instrumented(rest="compute")
+def sign_stream(fin, private_key) -> bytes:
+    """Como sign_file, pero leyendo de un objeto archivo (p. ej. stdin) hasta EOF."""
+    return pss.new(_import_key_cached(private_key)).sign(_sha256_stream(fin))
+
+@instrumented(rest="compute")
+def verify_stream(fin, signature: bytes, public_key) -> bool:
+    """Como verify_file, pero leyendo de un objeto archivo hasta EOF."""
+    h = _sha256_stream(fin)
+    try:
+        pss.new(_import_key_cached(public_key)).verify(h, signature)
+        return True
+    except (ValueError, TypeError):
+        return False
+
+# ========== VERIFICACIÓN DE FIRMAS POR LOTES ==========
+
+VERIFY_BATCH_CHUNK = 256
+
+def _sha256_source(message):
+    """SHA-256 de un mensaje en memoria o, si es una ruta, del archivo leído por bloques."""
+    if isinstance(message, (str, os.PathLike)):
+        return _sha256_file(message)
+    return SHA256.new(message)
+
+def _verify_chunk(items) -> list:
+    """Verifica una lista de (mensaje, firma, pem, error). Devuelve None o el motivo del fallo."""
+    reasons = []
+    for message, signature, pem, error in items:
+        if error:
+            reasons.append(error)
+            continue
+        try:
+            key = _import_key_cached(pem)
+        except (ValueError, IndexError, TypeError):
+            reasons.append("Clave pública inválida")
+            continue
+        try:
+            h = _sha256_source(message)
+        except OSError as e:
+            reasons.append(f"No se pudo leer el mensaje: {e.strerror or e}")
+            continue
+        except TypeError:
+            reasons.append("Elemento inválido: el mensaje debe ser bytes o una ruta")
+            continue
+        try:
+            pss.new(key).verify(h, signature)
+            reasons.append(None)
+        except (ValueError, TypeError):
+            reasons.append("Firma inválida")
+    return reasons
+
+def _as_pem(key):
+    if key is None or isinstance(key, (bytes, str)):
+        return key
+    return key.export_key()
+
+@instrumented
+def verify_signatures_batch(items, public_keys=None, workers: int = None,
+                            chunk_size: int = VERIFY_BATCH_CHUNK) -> dict:
+    """
+    Verifica muchas firmas PSS repartiendo el trabajo entre procesos.
+    
+    Args:
+        items: Iterable de (mensaje, firma) o (mensaje, firma, clave). El
+            mensaje puede ser bytes o una ruta de archivo (se hashea por
+            bloques). La clave del elemento puede ser RsaKey, PEM o un
+            key_id de `public_keys`.
+        public_keys: Clave común (RsaKey o PEM) o dict {key_id: clave}
+        workers: Procesos a usar (por defecto, núcleos disponibles; 1 = sin pool)
+        chunk_size: Elementos por tarea enviada a cada proceso
+    
+    Returns:
+        dict: {
+            "valid": bytearray con 1/0 por elemento,
+            "errors": {índice: motivo} de los elementos no válidos,
+            "total": int,
+            "valid_count": int
+        }
+    """
+    key_map = public_keys if isinstance(public_keys, dict) else None
+    pem_by_id = {}
+    if key_map is None:
+        default_pem = _as_pem(public_keys)
+    
+    def normalize(item):
+        # Cualquier problema de un elemento se queda en su motivo: el lote sigue
+        if not isinstance(item, (tuple, list)) or len(item) not in (2, 3):
+            return None, None, None, "Elemento inválido: se espera (mensaje, firma[, clave])"
+        if len(item) == 2:
+            message, signature = item
+            if key_map is None and default_pem is not None:
+                return message, signature, default_pem, None
+            return message, signature, None, "Falta la clave pública"
+        message, signature, key = item
+        try:
+            if key_map is None:
+                return message, signature, _as_pem(key), None
+            if key not in key_map:
+                return message, signature, None, "Clave desconocida"
+            if key not in pem_by_id:
+                pem_by_id[key] = _as_pem(key_map[key])
+            return message, signature, pem_by_id[key], None
+        except (TypeError, AttributeError, ValueError):
+            return message, signature, None, "Clave pública inválida"
+    
+    normalized = [normalize(item) for item in items]
+    
+    chunks = [normalized[i:i + chunk_size] for i in range(0, len(normalized), chunk_size)]
+    workers = workers or os.cpu_count() or 1
+    if workers <= 1 or len(chunks) <= 1:
+        results = map(_verify_chunk, chunks)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(chunks))) as pool:
+            results = list(pool.map(_verify_chunk, chunks))
+    
+    valid = bytearray(len(normalized))
+    errors = {}
+    index = 0
+    for reasons in results:
+        for reason in reasons:
+            if reason is None:
+                valid[index] = 1
+            else:
+                errors[index] = reason
+            index += 1
+    
+    return {
+        "valid": valid,
+        "errors": errors,
+        "total": len(normalized),
+        "valid_count": len(normalized) - len(errors)
+    }
+
+# ========== CONTEXTO REUTILIZABLE POR CLAVE ==========
+
+class RsaKeyContext:
+    """
+    Agrupa una clave RSA con sus objetos OAEP y PSS, creados una sola vez.
+    
+    Evita reconstruir PKCS1_OAEP/pss en cada llamada cuando se envuelven o
+    firman muchos mensajes con la misma clave. Las operaciones privadas
+    (decrypt, sign) requieren una clave privada.
+    
+    Args:
+        key: RsaKey o PEM (se carga mediante la caché de claves)
+    """
+    
+    def __init__(self, key):
+        self.key = _import_key_cached(key)
+        self._oaep = None
+        self._pss = None
+    
+    @property
+    def fingerprint(self) -> bytes:
+        return key_fingerprint(self.key)
+    
+    def _get_oaep(self):
+        if self._oaep is None:
+            self._oaep = PKCS1_OAEP.new(self.key, hashAlgo=SHA256)
+        return self._oaep
+    
+    def _get_pss(self):
+        if self._pss is None:
+            self._pss = pss.new(self.key)
+        return self._pss
+    
+    @instrumented(bytes_arg="message", rest="compute")
+    def encrypt(self, message: bytes) -> bytes:
+        return self._get_oaep().encrypt(message)
+    
+    @instrumented(bytes_arg="ciphertext", rest="compute")
+    def decrypt(self, ciphertext: bytes) -> bytes:
+        return self._get_oaep().decrypt(ciphertext)
+    
+    @instrumented(bytes_arg="message", rest="compute")
+    def sign(self, message: bytes) -> bytes:
+        return self._get_pss().sign(SHA256.new(message))
+    
+    @instrumented(bytes_arg="message", rest="compute")
+    def verify(self, message: bytes, signature: bytes) -> bool:
+        try:
+            self._get_pss().verify(SHA256.new(message), signature)
+            return True
+        except (ValueError, TypeError):
+            return False
+    
+    # --- Variantes por lotes ---
+    def encrypt_batch(self, messages) -> list:
+        oaep = self._get_oaep()
+        return [oaep.encrypt(m) for m in messages]
+    
+    def decrypt_batch(self, ciphertexts) -> list:
+        oaep = self._get_oaep()
+        return [oaep.decrypt(c) for c in ciphertexts]
+    
+    def sign_batch(self, messages) -> list:
+        signer = self._get_pss()
+        return [signer.sign(SHA256.new(m)) for m in messages]
+    
+    def verify_batch(self, messages, signatures) -> list:
+        return [self.verify(m, s) for m, s in zip(messages, signatures)]
@@ -0,0 +1,408 @@
+# segmented.py
+"""
+Contenedor AES-GCM segmentado con acceso aleatorio.
+
+El texto plano se divide en segmentos de tamaño fijo y cada uno se sella con
+AES-GCM de forma independiente, así que leer un rango solo exige descifrar
+y autenticar los segmentos que lo cubren.
+
+Formato:
+    cabecera (16) = magic "AESS" (4) + versión (1) + segment_size (4) + prefijo de nonce (7)
+    segmento i    = ciphertext (segment_size, el último puede ser menor) + tag (16)
+
+Nonce del segmento i: prefijo (7) + i (4, big endian) + flag de último segmento (1).
+La cabecera se autentica como AAD en todos los segmentos. El flag de último
+segmento impide truncar el archivo en una frontera de segmento sin que se note.
+
+Como todos los segmentos (salvo el último) miden lo mismo, el índice de
+segmentos es aritmético: la posición del segmento i se calcula sin leer nada
+más que la cabecera y el tamaño del archivo.
+"""
+from Crypto.Cipher import AES
+from Crypto.Random import get_random_bytes
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import os
+import struct
+
+from aescipher import atomic_output, GCM_TAG_SIZE
+
+MAGIC = b"AESS"
+VERSION = 1
+DEFAULT_SEGMENT_SIZE = 64 * 1024
+NONCE_PREFIX_SIZE = 7
+MAX_SEGMENTS = 2 ** 32
+
+_HEADER = struct.Struct(">4sBI7s")
+HEADER_SIZE = _HEADER.size
+
+# ========== CABECERA Y SEGMENTOS ==========
+
+def build_header(segment_size: int = DEFAULT_SEGMENT_SIZE, nonce_prefix: bytes = None) -> bytes:
+    """
+    Construye la cabecera del contenedor.
+
+    Args:
+        segment_size: Bytes de texto plano por segmento
+        nonce_prefix: Prefijo de nonce (7 bytes). Se genera al azar si no se indica
+
+    Returns:
+        bytes: Cabecera de HEADER_SIZE bytes
+    """
+    if not 0 < segment_size < 2 ** 32:
+        raise ValueError("segment_size fuera de rango")
+    if nonce_prefix is None:
+        nonce_prefix = get_random_bytes(NONCE_PREFIX_SIZE)
+    if len(nonce_prefix) != NONCE_PREFIX_SIZE:
+        raise ValueError(f"nonce_prefix debe tener {NONCE_PREFIX_SIZE} bytes")
+    return _HEADER.pack(MAGIC, VERSION, segment_size, nonce_prefix)
+
+def parse_header(header: bytes) -> int:
+    """
+    Valida la cabecera y devuelve el tamaño de segmento.
+
+    Raises:
+        ValueError: Si la cabecera no corresponde a este formato
+    """
+    if len(header) != HEADER_SIZE:
+        raise ValueError("Contenedor segmentado truncado")
+    magic, version, segment_size, _ = _HEADER.unpack(header)
+    if magic != MAGIC:
+        raise ValueError("El archivo no es un contenedor segmentado")
+    if version != VERSION:
+        raise ValueError(f"Versión de contenedor no soportada: {version}")
+    if segment_size == 0:
+        raise ValueError("segment_size inválido en la cabecera")
+    return segment_size
+
+def segment_layout(body_size: int, segment_size: int):
+    """
+    Calcula el índice de segmentos a partir del tamaño del cuerpo cifrado.
+
+    Args:
+        body_size: Tamaño del archivo menos la cabecera
+        segment_size: Tamaño de segmento de la cabecera
+
+    Returns:
+        tuple: (número de segmentos, tamaño del texto plano)
+    """
+    full = segment_size + GCM_TAG_SIZE
+    if body_size < GCM_TAG_SIZE:
+        raise ValueError("Contenedor segmentado truncado")
+    count = (body_size + full - 1) // full
+    if body_size - (count - 1) * full < GCM_TAG_SIZE:
+        raise ValueError("Contenedor segmentado truncado")
+    return count, body_size - count * GCM_TAG_SIZE
+
+def _segment_nonce(header: bytes, index: int, last: bool) -> bytes:
+    if index >= MAX_SEGMENTS:
+        raise ValueError("Demasiados segmentos para un solo contenedor")
+    return header[-NONCE_PREFIX_SIZE:] + struct.pack(">IB", index, 1 if last else 0)
+
+def seal_segment(key: bytes, header: bytes, index: int, last: bool, plaintext: bytes) -> bytes:
+    """Cifra un segmento y devuelve ciphertext + tag."""
+    cipher = AES.new(key, AES.MODE_GCM, nonce=_segment_nonce(header, index, last))
+    cipher.update(header)
+    ciphertext, tag = cipher.encrypt_and_digest(plaintext)
+    return ciphertext + tag
+
+def open_segment(key: bytes, header: bytes, index: int, last: bool, segment: bytes) -> bytes:
+    """
+    Verifica y descifra un segmento (ciphertext + tag).
+
+    Raises:
+        ValueError: Si la autenticación del segmento falla
+    """
+    if len(segment) < GCM_TAG_SIZE:
+        raise ValueError("Segmento truncado")
+    cipher = AES.new(key, AES.MODE_GCM, nonce=_segment_nonce(header, index, last))
+    cipher.update(header)
+    data = memoryview(segment)
+    return cipher.decrypt_and_verify(data[:-GCM_TAG_SIZE], data[-GCM_TAG_SIZE:])
+
+def read_full(f, size: int) -> bytes:
+    """Lee hasta `size` bytes aunque el flujo devuelva lecturas parciales (pipes)."""
+    data = f.read(size)
+    if not data or len(data) == size:
+        return data
+    parts = [data]
+    remaining = size - len(data)
+    while remaining:
+        more = f.read(remaining)
+        if not more:
+            break
+        parts.append(more)
+        remaining -= len(more)
+    return b"".join(parts)
+
+# ========== CIFRADO/DESCIFRADO SECUENCIAL ==========
+
+def encrypt_stream_segmented(fin, fout, key: bytes, segment_size: int = DEFAULT_SEGMENT_SIZE,
+                             nonce_prefix: bytes = None) -> int:
+    """
+    Cifra un flujo en formato segmentado.
+
+    Returns:
+        int: Número de segmentos escritos
+    """
+    header = build_header(segment_size, nonce_prefix)
+    fout.write(header)
+
+    index = 0
+    current = read_full(fin, segment_size)
+    while True:
+        # Se lee un segmento por adelantado para saber si el actual es el último
+        following = read_full(fin, segment_size) if len(current) == segment_size else b""
+        last = not following
+        fout.write(seal_segment(key, header, index, last, current))
+        if last:
+            return index + 1
+        current = following
+        index += 1
+
+def decrypt_stream_segmented(fin, fout, key: bytes) -> int:
+    """
+    Descifra un flujo en formato segmentado, verificando segmento a segmento.
+
+    Raises:
+        ValueError: Si algún segmento no se autentica o el flujo está truncado
+
+    Returns:
+        int: Bytes de texto plano escritos
+    """
+    header = read_full(fin, HEADER_SIZE)
+    segment_size = parse_header(header)
+    full = segment_size + GCM_TAG_SIZE
+
+    written = 0
+    index = 0
+    current = read_full(fin, full)
+    while True:
+        following = read_full(fin, full) if len(current) == full else b""
+        last = not following
+        plaintext = open_segment(key, header, index, last, current)
+        fout.write(plaintext)
+        written += len(plaintext)
+        if last:
+            return written
+        current = following
+        index += 1
+
+def encrypt_file_segmented(input_file: str, output_file: str, key: bytes,
+                           segment_size: int = DEFAULT_SEGMENT_SIZE) -> int:
+    """
+    Cifra un archivo en formato segmentado con acceso aleatorio.
+
+    Args:
+        input_file: Ruta del archivo a cifrar
+        output_file: Ruta del contenedor de salida
+        key: Clave AES (16, 24 o 32 bytes)
+        segment_size: Bytes de texto plano por segmento
+
+    Returns:
+        int: Número de segmentos escritos
+    """
+    with open(input_file, 'rb') as fin, atomic_output(output_file) as fout:
+        return encrypt_stream_segmented(fin, fout, key, segment_size)
+
+def decrypt_file_segmented(input_file: str, output_file: str, key: bytes) -> bool:
+    """
+    Descifra un contenedor segmentado completo.
+
+    Returns:
+        bool: True si todos los segmentos se autenticaron
+    """
+    try:
+        with open(input_file, 'rb') as fin, atomic_output(output_file) as fout:
+            decrypt_stream_segmented(fin, fout, key)
+        return True
+    except ValueError as e:
+        print(f"Error: Autenticación fallida ({e}). El archivo fue modificado o la clave es incorrecta.")
+        return False
+
+# ========== CIFRADO/DESCIFRADO PARALELO ==========
+# Los segmentos son independientes: se leen en orden en el hilo principal,
+# se sellan/abren en un pool de hilos (el núcleo C de pycryptodome libera el
+# GIL) y se escriben en orden. Como mucho hay `workers * SEGMENTS_PER_WORKER`
+# segmentos en vuelo, así que la memoria sigue acotada.
+
+SEGMENTS_PER_WORKER = 4
+
+def _default_workers(workers):
+    return workers or os.cpu_count() or 1
+
+def _run_ordered(pool, tasks, fout, window: int) -> int:
+    """Ejecuta `tasks` (callables sin argumentos) en el pool y escribe los resultados en orden."""
+    pending = deque()
+    written = 0
+    for task in tasks:
+        pending.append(pool.submit(task))
+        if len(pending) >= window:
+            data = pending.popleft().result()
+            fout.write(data)
+            written += len(data)
+    while pending:
+        data = pending.popleft().result()
+        fout.write(data)
+        written += len(data)
+    return written
+
+def encrypt_file_segmented_parallel(input_file: str, output_file: str, key: bytes,
+                                    segment_size: int = DEFAULT_SEGMENT_SIZE,
+                                    workers: int = None, nonce_prefix: bytes = None) -> int:
+    """
+    Cifra un archivo en formato segmentado usando varios núcleos.
+
+    Con el mismo `nonce_prefix` la salida es idéntica byte a byte a la de
+    `encrypt_stream_segmented`.
+
+    Args:
+        input_file: Ruta del archivo a cifrar
+        output_file: Ruta del contenedor de salida
+        key: Clave AES (16, 24 o 32 bytes)
+        segment_size: Bytes de texto plano por segmento
+        workers: Número de hilos (por defecto, núcleos disponibles)
+        nonce_prefix: Prefijo de nonce (7 bytes, aleatorio si no se indica)
+
+    Returns:
+        int: Número de segmentos escritos
+    """
+    header = build_header(segment_size, nonce_prefix)
+    workers = _default_workers(workers)
+    count = max(1, -(-os.path.getsize(input_file) // segment_size))
+
+    with open(input_file, 'rb') as fin, atomic_output(output_file) as fout, \
+            ThreadPoolExecutor(max_workers=workers) as pool:
+        fout.write(header)
+
+        def tasks():
+            for index in range(count):
+                last = index == count - 1
+                data = read_full(fin, segment_size)
+                if (len(data) != segment_size and not last) or (last and fin.read(1)):
+                    raise ValueError("El archivo cambió de tamaño durante el cifrado")
+                yield lambda index=index, last=last, data=data: seal_segment(key, header, index, last, data)
+
+        _run_ordered(pool, tasks(), fout, workers * SEGMENTS_PER_WORKER)
+    return count
+
+def decrypt_file_segmented_parallel(input_file: str, output_file: str, key: bytes,
+                                    workers: int = None) -> bool:
+    """
+    Descifra un contenedor segmentado usando varios núcleos.
+
+    Returns:
+        bool: True si todos los segmentos se autenticaron
+    """
+    workers = _default_workers(workers)
+    try:
+        with open(input_file, 'rb') as fin, atomic_output(output_file) as fout, \
+                ThreadPoolExecutor(max_workers=workers) as pool:
+            header = read_full(fin, HEADER_SIZE)
+            segment_size = parse_header(header)
+            body_size = os.fstat(fin.fileno()).st_size - HEADER_SIZE
+            count, _ = segment_layout(body_size, segment_size)
+            full = segment_size + GCM_TAG_SIZE
+
+            def tasks():
+                for index in range(count):
+                    last = index == count - 1
+                    segment = read_full(fin, full)
+                    yield lambda index=index, last=last, segment=segment: open_segment(key, header, index, last, segment)
+
+            _run_ordered(pool, tasks(), fout, workers * SEGMENTS_PER_WORKER)
+        return True
+    except ValueError as e:
+        print(f"Error: Autenticación fallida ({e}). El archivo fue modificado o la clave es incorrecta.")
+        return False
+
+# ========== ACCESO ALEATORIO ==========
+
+class SegmentedReader:
+    """
+    Lector de rangos sobre un contenedor segmentado.
+
+    Solo descifra y verifica los segmentos que cubren el rango pedido.
+    No es seguro compartir una instancia entre hilos.
+    """
+
+    def __init__(self, path: str, key: bytes):
+        self._file = open(path, 'rb')
+        try:
+            self.header = read_full(self._file, HEADER_SIZE)
+            self.segment_size = parse_header(self.header)
+            body_size = os.fstat(self._file.fileno()).st_size - HEADER_SIZE
+            self.segment_count, self.plaintext_size = segment_layout(body_size, self.segment_size)
+        except Exception:
+            self._file.close()
+            raise
+        self._key = key
+
+    def segment_span(self, index: int):
+        """Devuelve (offset en el archivo, longitud) del segmento `index`."""
+        if not 0 <= index < self.segment_count:
+            raise IndexError(f"Segmento fuera de rango: {index}")
+        full = self.segment_size + GCM_TAG_SIZE
+        if index == self.segment_count - 1:
+            length = self.plaintext_size - index * self.segment_size + GCM_TAG_SIZE
+        else:
+            length = full
+        return HEADER_SIZE + index * full, length
+
+    def read_segment(self, index: int) -> bytes:
+        """Descifra y verifica un único segmento."""
+        offset, length = self.segment_span(index)
+        self._file.seek(offset)
+        segment = read_full(self._file, length)
+        return open_segment(self._key, self.header, index,
+                            index == self.segment_count - 1, segment)
+
+    def read_range(self, offset: int, length: int) -> bytes:
+        """
+        Lee `length` bytes de texto plano a partir de `offset`.
+
+        Raises:
+            ValueError: Si alguno de los segmentos tocados no se autentica
+
+        Returns:
+            bytes: Texto plano (más corto si el rango pasa del final)
+        """
+        if offset < 0 or length < 0:
+            raise ValueError("offset y length deben ser no negativos")
+        end = min(offset + length, self.plaintext_size)
+        if offset >= end:
+            return b""
+
+        first = offset // self.segment_size
+        last = (end - 1) // self.segment_size
+        parts = []
+        for index in range(first, last + 1):
+            plaintext = self.read_segment(index)
+            start = index * self.segment_size
+            parts.append(plaintext[max(offset - start, 0):end - start])
+        return b"".join(parts)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def read_range(input_file: str, key: bytes, offset: int, length: int) -> bytes:
+    """
+    Lee un rango de texto plano de un contenedor segmentado.
+
+    Args:
+        input_file: Ruta del contenedor
+        key: Clave AES
+        offset: Posición inicial en el texto plano
+        length: Número de bytes a leer
+
+    Returns:
+        bytes: Texto plano del rango
+    """
+    with SegmentedReader(input_file, key) as reader:
+        return reader.read_range(offset, length)
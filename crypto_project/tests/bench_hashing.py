@@ -0,0 +1,71 @@
+# ========================
+# MICROBENCHMARK DE HASHEO DE ARCHIVOS
+# Compara la lectura original (f.read(8192)) con el motor nuevo
+# (readinto sobre buffer reutilizado y mmap)
+#
+# Uso: python tests/bench_hashing.py [tamaño_MB] [repeticiones]
+# ========================
+
+import sys
+from pathlib import Path
+import os
+import tempfile
+import time
+
+# Agregar el directorio padre al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from Crypto.Hash import SHA256
+from hashutils import hash_file, block_size_for
+
+def hash_legacy(filepath):
+    """Implementación original de calculate_file_hash."""
+    sha256 = SHA256.new()
+    with open(filepath, 'rb') as f:
+        while chunk := f.read(8192):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+def best_of(func, repeats):
+    best = float("inf")
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    size_mb = int(sys.argv[1]) if len(sys.argv) > 1 else 256
+    repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    size = size_mb * 1024 * 1024
+
+    fd, path = tempfile.mkstemp(suffix=".bin")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            for _ in range(size_mb):
+                f.write(os.urandom(1024 * 1024))
+
+        variants = [
+            ("read(8192) original", lambda: hash_legacy(path)),
+            (f"readinto {block_size_for(size) // 1024} KiB",
+             lambda: hash_file(path, use_mmap=False).hexdigest()),
+            ("mmap", lambda: hash_file(path, use_mmap=True).hexdigest()),
+        ]
+
+        print(f"Archivo: {size_mb} MB, mejor de {repeats} (caché de páginas caliente)")
+        print("-" * 60)
+        baseline = None
+        reference = None
+        for name, func in variants:
+            seconds, digest = best_of(func, repeats)
+            reference = reference or digest
+            baseline = baseline or seconds
+            gbps = size / seconds / 1e9
+            print(f"  {name:<24} {gbps:6.2f} GB/s  x{baseline / seconds:4.2f}"
+                  f"  {'✓' if digest == reference else '✗ HASH DISTINTO'}")
+    finally:
+        os.remove(path)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,287 @@
+# ========================
+# SUITE DE BENCHMARKS
+# Mide cifrado (GCM, CBC+HMAC, híbrido), firma RSA y hasheo de archivos
+# para varios tamaños, con calentamiento, repeticiones y estadísticas
+# (mediana, p95). Los resultados se guardan en JSON y se pueden comparar
+# con una ejecución anterior para detectar regresiones.
+#
+# Uso:
+#   python tests/benchmark_suite.py                        # tamaños por defecto
+#   python tests/benchmark_suite.py --sizes 1K,1M,4G --save base.json
+#   python tests/benchmark_suite.py --ops gcm-encrypt,hash-sha256 --compare base.json
+#   python tests/benchmark_suite.py --diff base.json nuevo.json --threshold 0.05
+#
+# Los archivos de prueba se crean en un directorio temporal (--dir) y se
+# miden con la caché de páginas caliente: es rendimiento de CPU, no de disco.
+# Para 4G hace falta espacio para la entrada y la salida (unos 8 GB).
+# Código de salida 1 si la comparación encuentra alguna regresión.
+# ========================
+
+import sys
+from pathlib import Path
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+from datetime import datetime
+
+# Agregar el directorio padre al path
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+import Crypto
+from aescipher import (
+    generate_aes_key, encrypt_file_gcm, decrypt_file_gcm, encrypt_file_cbc, decrypt_file_cbc
+)
+from rsautils import generate_rsa_keypair, sign_file, verify_file
+from hybrid import encrypt_path_hybrid, decrypt_path_hybrid
+from hashutils import calculate_file_hash, HASH_ALGORITHMS
+
+DEFAULT_SIZES = "1K,64K,1M,16M,256M"
+SIZE_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+FILL_BLOCK = 1024 * 1024
+
+def parse_size(text: str) -> int:
+    """'64K' → 65536, '4G' → 4294967296, '1000' → 1000."""
+    text = text.strip().upper()
+    if text[-1:] in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[text[-1]])
+    return int(text)
+
+def format_size(size: int) -> str:
+    for unit, factor in sorted(SIZE_UNITS.items(), key=lambda u: -u[1]):
+        if size >= factor and size % factor == 0:
+            return f"{size // factor}{unit}"
+    return str(size)
+
+def percentile(samples: list, fraction: float) -> float:
+    """Percentil por interpolación lineal entre muestras ordenadas."""
+    ordered = sorted(samples)
+    position = (len(ordered) - 1) * fraction
+    low = int(position)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (position - low)
+
+def make_input(directory: str, size: int) -> str:
+    """Archivo de `size` bytes aleatorios (un bloque de 1 MB repetido, para no tardar con 4G)."""
+    path = os.path.join(directory, f"input_{format_size(size)}.bin")
+    block = os.urandom(min(size, FILL_BLOCK))
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining:
+            n = min(remaining, len(block))
+            f.write(block[:n])
+            remaining -= n
+    return path
+
+# ========== OPERACIONES ==========
+
+class Context:
+    """Claves compartidas por todas las operaciones (se generan una sola vez)."""
+
+    def __init__(self):
+        self.aes_key = generate_aes_key(256)
+        self.mac_key = os.urandom(32)
+        self.priv, self.pub = generate_rsa_keypair(2048)
+
+def build_operations(ctx: Context) -> dict:
+    """
+    Cada operación es (setup, run): setup(entrada, dir) prepara lo
+    que no se mide (p. ej. el archivo cifrado para descifrar) y devuelve el
+    estado que recibe run(estado).
+    """
+    def output_path(directory, name):
+        return os.path.join(directory, name)
+
+    def plain(src, directory):
+        return src, output_path(directory, "out.bin")
+
+    def gcm_encrypted(src, directory):
+        enc = output_path(directory, "in.gcm")
+        encrypt_file_gcm(src, enc, ctx.aes_key)
+        return enc, output_path(directory, "out.bin")
+
+    def cbc_encrypted(src, directory):
+        enc = output_path(directory, "in.cbc")
+        encrypt_file_cbc(src, enc, ctx.aes_key, ctx.mac_key)
+        return enc, output_path(directory, "out.bin")
+
+    def hybrid_encrypted(src, directory):
+        enc = output_path(directory, "in.hybrid")
+        encrypt_path_hybrid(src, enc, ctx.pub)
+        return enc, output_path(directory, "out.bin")
+
+    def signed(src, directory):
+        return src, sign_file(src, ctx.priv)
+
+    def expect(ok):
+        if not ok:
+            raise RuntimeError("La operación devolvió un resultado inválido")
+
+    operations = {
+        "gcm-encrypt": (plain, lambda s: encrypt_file_gcm(s[0], s[1], ctx.aes_key)),
+        "gcm-decrypt": (gcm_encrypted, lambda s: expect(decrypt_file_gcm(s[0], s[1], ctx.aes_key))),
+        "cbc-encrypt": (plain, lambda s: encrypt_file_cbc(s[0], s[1], ctx.aes_key, ctx.mac_key)),
+        "cbc-decrypt": (cbc_encrypted, lambda s: expect(decrypt_file_cbc(s[0], s[1], ctx.aes_key, ctx.mac_key))),
+        "hybrid-encrypt": (plain, lambda s: encrypt_path_hybrid(s[0], s[1], ctx.pub)),
+        "hybrid-decrypt": (hybrid_encrypted, lambda s: decrypt_path_hybrid(s[0], s[1], ctx.priv)),
+        "rsa-sign": (plain, lambda s: sign_file(s[0], ctx.priv)),
+        "rsa-verify": (signed, lambda s: expect(verify_file(s[0], s[1], ctx.pub))),
+    }
+    for algorithm in HASH_ALGORITHMS:
+        operations[f"hash-{algorithm}"] = (
+            plain, lambda s, alg=algorithm: calculate_file_hash(s[0], alg))
+    return operations
+
+# ========== MEDICIÓN ==========
+
+def measure(run, state, warmup: int, repeats: int, max_seconds: float) -> list:
+    """
+    Ejecuta `warmup` vueltas sin medir y luego hasta `repeats` medidas con
+    perf_counter_ns. Si se agota `max_seconds` se para antes, pero siempre
+    con al menos 3 muestras (o `repeats` si es menor).
+    """
+    for _ in range(warmup):
+        run(state)
+    samples = []
+    deadline = time.perf_counter() + max_seconds
+    while len(samples) < repeats:
+        start = time.perf_counter_ns()
+        run(state)
+        samples.append(time.perf_counter_ns() - start)
+        if len(samples) >= min(3, repeats) and time.perf_counter() > deadline:
+            break
+    return samples
+
+def summarize(op: str, size: int, samples: list) -> dict:
+    median_ns = statistics.median(samples)
+    return {
+        "op": op,
+        "size": size,
+        "runs": len(samples),
+        "median_ns": int(median_ns),
+        "p95_ns": int(percentile(samples, 0.95)),
+        "min_ns": min(samples),
+        "max_ns": max(samples),
+        "mb_per_s": round(size / (1024 * 1024) / (median_ns / 1e9), 2) if median_ns else None
+    }
+
+def environment() -> dict:
+    return {
+        "date": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "implementation": platform.python_implementation(),
+        "platform": platform.platform(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "pycryptodome": Crypto.__version__
+    }
+
+def run_suite(ops, sizes: list, warmup: int, repeats: int, max_seconds: float,
+              directory: str = None) -> dict:
+    ctx = Context()
+    operations = build_operations(ctx)
+    ops = ops or list(operations)
+    unknown = [op for op in ops if op not in operations]
+    if unknown:
+        raise SystemExit(f"Operaciones desconocidas: {', '.join(unknown)} "
+                         f"(disponibles: {', '.join(operations)})")
+
+    results = []
+    workdir = tempfile.mkdtemp(prefix="bench_", dir=directory)
+    try:
+        for size in sizes:
+            src = make_input(workdir, size)
+            for op in ops:
+                setup, run = operations[op]
+                state = setup(src, workdir)
+                summary = summarize(op, size, measure(run, state, warmup, repeats, max_seconds))
+                results.append(summary)
+                print(f"  {op:<16} {format_size(size):>6}  mediana {summary['median_ns'] / 1e6:10.3f} ms"
+                      f"  p95 {summary['p95_ns'] / 1e6:10.3f} ms  {summary['mb_per_s'] or 0:9.1f} MB/s"
+                      f"  ({summary['runs']} vueltas)")
+            os.remove(src)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    return {"environment": environment(), "results": results}
+
+# ========== COMPARACIÓN ==========
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    """
+    Compara medianas por (operación, tamaño). Una regresión es una mediana
+    que crece más de `threshold` (0.10 = 10 %) respecto a la base.
+
+    Returns:
+        list: Regresiones encontradas, como dicts con op, size, base, actual y cambio
+    """
+    base = {(r["op"], r["size"]): r for r in baseline["results"]}
+    regressions = []
+    print(f"\n{'operación':<16} {'tamaño':>6} {'base ms':>12} {'actual ms':>12} {'cambio':>8}")
+    print("-" * 60)
+    for r in current["results"]:
+        old = base.get((r["op"], r["size"]))
+        if old is None:
+            continue
+        change = r["median_ns"] / old["median_ns"] - 1
+        regression = change > threshold
+        mark = "  ✗ REGRESIÓN" if regression else ("  ✓ mejora" if change < -threshold else "")
+        print(f"{r['op']:<16} {format_size(r['size']):>6} {old['median_ns'] / 1e6:12.3f} "
+              f"{r['median_ns'] / 1e6:12.3f} {change:+8.1%}{mark}")
+        if regression:
+            regressions.append({"op": r["op"], "size": r["size"], "base_ns": old["median_ns"],
+                                "current_ns": r["median_ns"], "change": change})
+    if baseline.get("environment", {}).get("platform") != current.get("environment", {}).get("platform"):
+        print("\n⚠️  Las ejecuciones son de plataformas distintas: la comparación es orientativa")
+    return regressions
+
+def load_results(path: str) -> dict:
+    with open(path, "r") as f:
+        return json.load(f)
+
+def main():
+    parser = argparse.ArgumentParser(description="Suite de benchmarks del proyecto")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help=f"Tamaños (por defecto {DEFAULT_SIZES})")
+    parser.add_argument("--ops", help="Operaciones separadas por comas (por defecto todas)")
+    parser.add_argument("--warmup", type=int, default=1, help="Vueltas de calentamiento sin medir")
+    parser.add_argument("--repeats", type=int, default=15, help="Máximo de vueltas medidas")
+    parser.add_argument("--max-seconds", type=float, default=5.0,
+                        help="Tiempo máximo por caso (mínimo 3 vueltas)")
+    parser.add_argument("--dir", help="Directorio para los archivos temporales")
+    parser.add_argument("--save", help="Guardar los resultados en este JSON")
+    parser.add_argument("--compare", help="JSON de una ejecución anterior con la que comparar")
+    parser.add_argument("--diff", nargs=2, metavar=("BASE", "ACTUAL"),
+                        help="Comparar dos JSON guardados sin ejecutar nada")
+    parser.add_argument("--threshold", type=float, default=0.10,
+                        help="Crecimiento de la mediana que cuenta como regresión (0.10 = 10%%)")
+    args = parser.parse_args()
+
+    if args.diff:
+        regressions = compare(load_results(args.diff[0]), load_results(args.diff[1]), args.threshold)
+        sys.exit(1 if regressions else 0)
+
+    sizes = [parse_size(s) for s in args.sizes.split(",")]
+    ops = args.ops.split(",") if args.ops else None
+
+    print(f"Benchmarks: {len(ops) if ops else 'todas las'} operaciones × {len(sizes)} tamaños, "
+          f"calentamiento {args.warmup}, hasta {args.repeats} vueltas")
+    print("-" * 90)
+    current = run_suite(ops, sizes, args.warmup, args.repeats, args.max_seconds, args.dir)
+
+    if args.save:
+        with open(args.save, "w") as f:
+            json.dump(current, f, indent=2)
+        print(f"\nResultados guardados en {args.save}")
+
+    if args.compare:
+        regressions = compare(load_results(args.compare), current, args.threshold)
+        if regressions:
+            print(f"\n✗ {len(regressions)} regresiones por encima del {args.threshold:.0%}")
+            sys.exit(1)
+        print(f"\n✓ Sin regresiones por encima del {args.threshold:.0%}")
+
+if __name__ == "__main__":
+    main()
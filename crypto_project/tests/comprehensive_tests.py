@@ -13,17 +13,35 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from aescipher import (
     generate_aes_key, encrypt_file_gcm, decrypt_file_gcm,
-    encrypt_file_cbc, decrypt_file_cbc, encrypt_gcm, decrypt_gcm
+    encrypt_file_cbc, decrypt_file_cbc, encrypt_gcm, decrypt_gcm, compute_hmac,
+    encrypt_file_gcm_stream, decrypt_file_gcm_stream,
+    encrypt_file_password, decrypt_file_password
+)
+from kdf import (
+    derive_key, kdf_cache_info, clear_kdf_cache, set_kdf_cache, calibrate,
+    new_salt, pack_header, read_header, KDF_PBKDF2, KDF_SCRYPT
 )
 from rsautils import (
     generate_rsa_keypair, load_private_key, load_public_key,
-    sign_message, verify_signature, rsa_encrypt, rsa_decrypt
+    sign_message, verify_signature, rsa_encrypt, rsa_decrypt,
+    key_cache_info, clear_key_cache, RsaKeyContext, verify_signatures_batch,
+    sign_file, verify_file
 )
 from hashutils import (
     calculate_file_hash, register_file, verify_file_integrity,
-    verify_all_files, compare_files, sha256_hex
+    verify_all_files, compare_files, sha256_hex, register_files,
+    iter_verify_files, hash_file, HASH_ALGORITHMS, hash_hex, find_duplicates
+)
+from hashdb import open_hash_database, migrate_json_to_sqlite
+from hybrid import (
+    encrypt_file_hybrid, decrypt_file_hybrid, encrypt_path_hybrid, decrypt_path_hybrid,
+    encrypt_path_hybrid_multi, decrypt_path_hybrid_multi
+)
+from segmented import (
+    encrypt_file_segmented, decrypt_file_segmented, SegmentedReader,
+    encrypt_file_segmented_parallel, decrypt_file_segmented_parallel,
+    encrypt_stream_segmented
 )
-from hybrid import encrypt_file_hybrid, decrypt_file_hybrid
 
 print("=" * 70)
 print("PRUEBAS COMPREHENSIVAS - PROYECTO DE CRIPTOGRAFÍA")
@@ -51,17 +69,17 @@ print("\n[1.2] Cifrado con AES-GCM (modo recomendado)")
 print("-" * 70)
 key_256 = generate_aes_key(256)
 
-start = time.time()
+start = time.perf_counter()
 encrypt_file_gcm("tests/documento_secreto.txt", "tests/documento_secreto.enc", key_256)
-time_gcm = time.time() - start
+time_gcm = time.perf_counter() - start
 
 print(f"  ✓ Archivo cifrado con AES-256-GCM en {time_gcm*1000:.2f} ms")
 print(f"  ✓ Archivo original: {os.path.getsize('tests/documento_secreto.txt')} bytes")
 print(f"  ✓ Archivo cifrado: {os.path.getsize('tests/documento_secreto.enc')} bytes")
 
-start = time.time()
+start = time.perf_counter()
 success = decrypt_file_gcm("tests/documento_secreto.enc", "tests/documento_recuperado.txt", key_256)
-time_gcm_dec = time.time() - start
+time_gcm_dec = time.perf_counter() - start
 
 with open("tests/documento_recuperado.txt", "rb") as f:
     recovered = f.read()
@@ -73,17 +91,17 @@ print("\n[1.3] Cifrado con AES-CBC + HMAC")
 print("-" * 70)
 key_cbc = generate_aes_key(256)
 
-start = time.time()
+start = time.perf_counter()
 iv, mac, mac_key = encrypt_file_cbc("tests/documento_secreto.txt", "tests/documento_cbc.enc", key_cbc)
-time_cbc = time.time() - start
+time_cbc = time.perf_counter() - start
 
 print(f"  ✓ Archivo cifrado con AES-256-CBC en {time_cbc*1000:.2f} ms")
 print(f"  ✓ IV generado: {iv.hex()[:32]}...")
 print(f"  ✓ HMAC calculado para integridad")
 
-start = time.time()
+start = time.perf_counter()
 success = decrypt_file_cbc("tests/documento_cbc.enc", "tests/documento_cbc_recuperado.txt", key_cbc, mac_key)
-time_cbc_dec = time.time() - start
+time_cbc_dec = time.perf_counter() - start
 
 print(f"  ✓ Archivo descifrado en {time_cbc_dec*1000:.2f} ms")
 print(f"  ✓ Descifrado exitoso: {success}")
@@ -94,6 +112,7 @@ print(f"  • GCM - Cifrado: {time_gcm*1000:.2f} ms | Descifrado: {time_gcm_dec*
 print(f"  • CBC - Cifrado: {time_cbc*1000:.2f} ms | Descifrado: {time_cbc_dec*1000:.2f} ms")
 print(f"  • GCM incluye autenticación integrada (AEAD)")
 print(f"  • CBC requiere HMAC adicional para integridad")
+print(f"  ℹ️  Una sola ejecución: para cifras fiables usar tests/benchmark_suite.py")
 
 print("\n[1.5] Importancia del IV - Demostración")
 print("-" * 70)
@@ -111,6 +130,157 @@ print(f"    - Nonce 1: {nonce1.hex()}")
 print(f"    - Nonce 2: {nonce2.hex()}")
 print(f"    - Ciphertexts diferentes: {ct1 != ct2}")
 
+print("\n[1.6] Cifrado por bloques (streaming) con tag al final")
+print("-" * 70)
+datos_grandes = os.urandom(300_000)
+with open("tests/archivo_grande.bin", "wb") as f:
+    f.write(datos_grandes)
+
+key_stream = generate_aes_key(256)
+encrypt_file_gcm_stream("tests/archivo_grande.bin", "tests/archivo_grande.enc", key_stream, chunk_size=4096)
+ok_stream = decrypt_file_gcm_stream("tests/archivo_grande.enc", "tests/archivo_grande_rec.bin", key_stream, chunk_size=1000)
+
+with open("tests/archivo_grande_rec.bin", "rb") as f:
+    print(f"  ✓ Descifrado por bloques correcto: {ok_stream and f.read() == datos_grandes}")
+
+# Alterar un byte del ciphertext: no debe quedar archivo de salida
+with open("tests/archivo_grande.enc", "r+b") as f:
+    f.seek(100)
+    byte = f.read(1)
+    f.seek(100)
+    f.write(bytes([byte[0] ^ 1]))
+
+os.remove("tests/archivo_grande_rec.bin")
+ok_tampered = decrypt_file_gcm_stream("tests/archivo_grande.enc", "tests/archivo_grande_rec.bin", key_stream)
+print(f"  ✓ Alteración detectada: {not ok_tampered}")
+print(f"  ✓ Sin texto plano no autenticado en disco: {not os.path.exists('tests/archivo_grande_rec.bin')}")
+
+# Un cifrado que falla tampoco deja un archivo a medias
+try:
+    encrypt_file_gcm_stream("tests/archivo_grande.bin", "tests/archivo_fallido.enc", b"clave corta")
+except ValueError:
+    pass
+print(f"  ✓ Cifrado fallido sin dejar salida: {not os.path.exists('tests/archivo_fallido.enc')}")
+
+print("\n[1.7] Contenedor segmentado con lectura de rangos")
+print("-" * 70)
+num_segmentos = encrypt_file_segmented("tests/archivo_grande.bin", "tests/archivo_grande.seg",
+                                       key_stream, segment_size=16 * 1024)
+print(f"  ✓ Contenedor con {num_segmentos} segmentos de 16 KB")
+
+with SegmentedReader("tests/archivo_grande.seg", key_stream) as reader:
+    rango = reader.read_range(100_000, 50_000)
+    print(f"  ✓ Rango [100000, 150000) correcto: {rango == datos_grandes[100_000:150_000]}")
+    print(f"  ✓ Rango al final del archivo correcto: {reader.read_range(299_990, 100) == datos_grandes[299_990:]}")
+
+ok_seg = decrypt_file_segmented("tests/archivo_grande.seg", "tests/archivo_grande_seg.bin", key_stream)
+with open("tests/archivo_grande_seg.bin", "rb") as f:
+    print(f"  ✓ Descifrado completo correcto: {ok_seg and f.read() == datos_grandes}")
+
+print("\n[1.8] Cifrado segmentado en paralelo (varios núcleos)")
+print("-" * 70)
+prefijo = os.urandom(7)
+encrypt_file_segmented_parallel("tests/archivo_grande.bin", "tests/archivo_grande_par.seg",
+                                key_stream, segment_size=16 * 1024, workers=4, nonce_prefix=prefijo)
+with open("tests/archivo_grande.bin", "rb") as fin, open("tests/archivo_grande_sec.seg", "wb") as fout:
+    encrypt_stream_segmented(fin, fout, key_stream, segment_size=16 * 1024, nonce_prefix=prefijo)
+
+with open("tests/archivo_grande_par.seg", "rb") as f1, open("tests/archivo_grande_sec.seg", "rb") as f2:
+    print(f"  ✓ Salida paralela idéntica a la secuencial: {f1.read() == f2.read()}")
+
+ok_par = decrypt_file_segmented_parallel("tests/archivo_grande_par.seg", "tests/archivo_grande_par.bin", key_stream, workers=4)
+with open("tests/archivo_grande_par.bin", "rb") as f:
+    print(f"  ✓ Descifrado paralelo correcto: {ok_par and f.read() == datos_grandes}")
+
+print("\n[1.9] AES-CBC + HMAC por streaming (memoria constante)")
+print("-" * 70)
+iv_cbc, mac_cbc, mac_key_cbc = encrypt_file_cbc("tests/archivo_grande.bin", "tests/archivo_grande.cbc", key_cbc)
+with open("tests/archivo_grande.cbc", "rb") as f:
+    contenido_cbc = f.read()
+print(f"  ✓ Mismo formato que antes (iv + HMAC(iv + ct) + ct): "
+      f"{contenido_cbc[16:48] == compute_hmac(contenido_cbc[:16] + contenido_cbc[48:], mac_key_cbc)}")
+ok_cbc = decrypt_file_cbc("tests/archivo_grande.cbc", "tests/archivo_grande_cbc.bin", key_cbc, mac_key_cbc)
+with open("tests/archivo_grande_cbc.bin", "rb") as f:
+    print(f"  ✓ Descifrado por bloques correcto: {ok_cbc and f.read() == datos_grandes}")
+
+with open("tests/archivo_grande.cbc", "r+b") as f:
+    f.seek(-1, os.SEEK_END)
+    byte = f.read(1)
+    f.seek(-1, os.SEEK_END)
+    f.write(bytes([byte[0] ^ 1]))
+os.remove("tests/archivo_grande_cbc.bin")
+ok_cbc = decrypt_file_cbc("tests/archivo_grande.cbc", "tests/archivo_grande_cbc.bin", key_cbc, mac_key_cbc)
+print(f"  ✓ Alteración detectada sin dejar salida: {not ok_cbc and not os.path.exists('tests/archivo_grande_cbc.bin')}")
+
+print("\n[1.10] Cifrado con contraseña (PBKDF2 / scrypt) y caché de claves derivadas")
+print("-" * 70)
+# Costes bajos para que la prueba sea rápida; los reales los da calibrate()
+params_pbkdf2 = {"kdf": "pbkdf2-sha256", "iterations": 20_000}
+params_scrypt = {"kdf": KDF_SCRYPT, "n": 2 ** 10, "r": 8, "p": 1}
+for params in (params_pbkdf2, params_scrypt):
+    encrypt_file_password("tests/documento_secreto.txt", "tests/documento.pwd", "contraseña segura", params)
+    ok_pwd = decrypt_file_password("tests/documento.pwd", "tests/documento_pwd.txt", "contraseña segura")
+    with open("tests/documento_pwd.txt", "rb") as f:
+        print(f"  ✓ Ida y vuelta con {params['kdf']}: {ok_pwd and f.read() == test_content}")
+with open("tests/documento.pwd", "rb") as f:
+    _, params_leidos, _ = read_header(f)
+print(f"  ✓ Parámetros guardados en la cabecera: {params_leidos == params_scrypt}")
+
+os.remove("tests/documento_pwd.txt")
+ok_pwd = decrypt_file_password("tests/documento.pwd", "tests/documento_pwd.txt", "contraseña errónea")
+print(f"  ✓ Contraseña incorrecta rechazada sin dejar salida: "
+      f"{not ok_pwd and not os.path.exists('tests/documento_pwd.txt')}")
+
+# Un lote con el mismo salt: la clave se deriva una vez al descifrar todo el lote
+salt_lote = new_salt()
+for i in range(5):
+    encrypt_file_password("tests/documento_secreto.txt", f"tests/lote_{i}.pwd", "clave del lote", params_pbkdf2, salt_lote)
+clear_kdf_cache()
+ok_lote = all(decrypt_file_password(f"tests/lote_{i}.pwd", f"tests/lote_{i}.txt", "clave del lote")
+              for i in range(5))
+info_kdf = kdf_cache_info()
+print(f"  ✓ Lote de 5 archivos descifrado: {ok_lote} "
+      f"(derivaciones: {info_kdf['misses']}, aciertos de caché: {info_kdf['hits']})")
+
+clear_kdf_cache()
+set_kdf_cache(ttl=0.05)
+derive_key("clave del lote", salt_lote, params_pbkdf2)
+time.sleep(0.1)
+derive_key("clave del lote", salt_lote, params_pbkdf2)
+print(f"  ✓ Entradas caducadas se vuelven a derivar: {kdf_cache_info()['misses'] == 2}")
+set_kdf_cache(ttl=300)
+
+# Cabecera manipulada para pedir un coste desorbitado: se rechaza antes de derivar
+cabecera = bytearray(pack_header(params_pbkdf2, salt_lote))
+cabecera[-4:] = (2 ** 32 - 1).to_bytes(4, "big")
+with open("tests/documento_abusivo.pwd", "wb") as f:
+    f.write(bytes(cabecera) + os.urandom(64))
+start = time.perf_counter()
+ok_pwd = decrypt_file_password("tests/documento_abusivo.pwd", "tests/documento_abusivo.txt", "clave del lote")
+print(f"  ✓ Cabecera con coste excesivo rechazada: {not ok_pwd} ({time.perf_counter() - start:.3f} s)")
+
+# Cabecera con salt vacío y parámetros incompletos: ValueError, no KeyError
+cabecera = bytearray(pack_header(params_pbkdf2, salt_lote))
+cabecera_sin_salt = bytes(cabecera[:6]) + b"\x00" + bytes(cabecera[7 + len(salt_lote):])
+with open("tests/documento_sin_salt.pwd", "wb") as f:
+    f.write(cabecera_sin_salt + os.urandom(64))
+ok_pwd = decrypt_file_password("tests/documento_sin_salt.pwd", "tests/documento_sin_salt.txt", "clave del lote")
+try:
+    derive_key("clave", salt_lote, {"kdf": KDF_SCRYPT, "n": 2 ** 10, "p": 1})
+    error_parametros = None
+except ValueError as e:
+    error_parametros = e
+print(f"  ✓ Salt vacío rechazado: {not ok_pwd} | parámetros incompletos como ValueError: {error_parametros is not None}")
+try:
+    derive_key("clave", salt_lote, {"kdf": KDF_PBKDF2, "iterations": "1000"})
+    error_parametros = None
+except ValueError as e:
+    error_parametros = e
+print(f"  ✓ Parámetros no enteros como ValueError: {error_parametros is not None}")
+
+params_calibrados = calibrate(0.05)
+print(f"  ✓ Calibración PBKDF2 para 50 ms: {params_calibrados['iterations']} iteraciones")
+
 # ========================
 # PARTE 2: CIFRADO ASIMÉTRICO RSA
 # ========================
@@ -121,9 +291,9 @@ print("=" * 70)
 print("\n[2.1] Generación de pares de claves RSA")
 print("-" * 70)
 
-start = time.time()
+start = time.perf_counter()
 priv_pem, pub_pem = generate_rsa_keypair(2048)
-time_keygen = time.time() - start
+time_keygen = time.perf_counter() - start
 
 with open("tests/alice_private.pem", "wb") as f:
     f.write(priv_pem)
@@ -149,9 +319,9 @@ mensaje_alice = b"Hola Bob, esta es Alice. Mensaje secreto!"
 
 # Alice cifra con la clave pública de Bob
 pub_key_bob = load_public_key(pub_bob)
-start = time.time()
+start = time.perf_counter()
 mensaje_cifrado = rsa_encrypt(mensaje_alice, pub_key_bob)
-time_rsa_enc = time.time() - start
+time_rsa_enc = time.perf_counter() - start
 
 print(f"  ✓ Alice cifra mensaje con clave pública de Bob")
 print(f"  ✓ Tiempo de cifrado RSA: {time_rsa_enc*1000:.2f} ms")
@@ -159,9 +329,9 @@ print(f"  ✓ Mensaje cifrado ({len(mensaje_cifrado)} bytes): {mensaje_cifrado[:
 
 # Bob descifra con su clave privada
 priv_key_bob = load_private_key(priv_bob)
-start = time.time()
+start = time.perf_counter()
 mensaje_descifrado = rsa_decrypt(mensaje_cifrado, priv_key_bob)
-time_rsa_dec = time.time() - start
+time_rsa_dec = time.perf_counter() - start
 
 print(f"  ✓ Bob descifra con su clave privada")
 print(f"  ✓ Tiempo de descifrado RSA: {time_rsa_dec*1000:.2f} ms")
@@ -174,9 +344,9 @@ test_data = b"Datos de prueba para comparar rendimiento" * 10
 
 # AES
 key_compare = generate_aes_key(256)
-start = time.time()
+start = time.perf_counter()
 _, _, _ = encrypt_gcm(test_data, key_compare)
-time_aes = time.time() - start
+time_aes = time.perf_counter() - start
 
 print(f"  • AES-256: {time_aes*1000:.4f} ms")
 print(f"  • RSA-2048: {time_rsa_enc*1000:.4f} ms")
@@ -191,21 +361,112 @@ print("      - AES: Cifra el contenido del archivo (rápido)")
 
 archivo_grande = b"Contenido de archivo grande..." * 1000
 
-start = time.time()
+start = time.perf_counter()
 enc_key, nonce, tag, ciphertext = encrypt_file_hybrid(archivo_grande, pub_bob)
-time_hybrid = time.time() - start
+time_hybrid = time.perf_counter() - start
 
 print(f"  ✓ Archivo cifrado con esquema híbrido en {time_hybrid*1000:.2f} ms")
 print(f"  ✓ Tamaño original: {len(archivo_grande)} bytes")
 print(f"  ✓ Clave AES cifrada con RSA: {len(enc_key)} bytes")
 
-start = time.time()
+start = time.perf_counter()
 recuperado_hybrid = decrypt_file_hybrid(enc_key, nonce, tag, ciphertext, priv_bob)
-time_hybrid_dec = time.time() - start
+time_hybrid_dec = time.perf_counter() - start
 
 print(f"  ✓ Archivo descifrado en {time_hybrid_dec*1000:.2f} ms")
 print(f"  ✓ Contenido recuperado correctamente: {archivo_grande == recuperado_hybrid}")
 
+print("\n[2.5] Esquema híbrido por streaming (archivos)")
+print("-" * 70)
+encrypt_path_hybrid("tests/archivo_grande.bin", "tests/archivo_grande.hybrid", pub_bob, chunk_size=8192)
+tam_rec = decrypt_path_hybrid("tests/archivo_grande.hybrid", "tests/archivo_grande_hyb.bin", priv_bob)
+with open("tests/archivo_grande_hyb.bin", "rb") as f:
+    print(f"  ✓ Archivo de {tam_rec} bytes recuperado correctamente: {f.read() == datos_grandes}")
+
+# Los paquetes escritos a mano con el formato anterior siguen siendo legibles
+with open("tests/paquete_antiguo.hybrid", "wb") as f:
+    f.write(len(enc_key).to_bytes(4, 'big'))
+    f.write(enc_key)
+    f.write(nonce)
+    f.write(tag)
+    f.write(ciphertext)
+decrypt_path_hybrid("tests/paquete_antiguo.hybrid", "tests/paquete_antiguo.bin", priv_bob)
+with open("tests/paquete_antiguo.bin", "rb") as f:
+    print(f"  ✓ Compatible con paquetes del formato anterior: {f.read() == archivo_grande}")
+
+print("\n[2.6] Sobre híbrido para varios destinatarios")
+print("-" * 70)
+destinatarios = encrypt_path_hybrid_multi("tests/archivo_grande.bin", "tests/archivo_grande.env", [pub_pem, pub_bob])
+print(f"  ✓ Cuerpo cifrado una vez, clave envuelta para {len(destinatarios)} destinatarios")
+for nombre, priv in (("Alice", priv_pem), ("Bob", priv_bob)):
+    decrypt_path_hybrid_multi("tests/archivo_grande.env", f"tests/archivo_grande_{nombre}.bin", priv)
+    with open(f"tests/archivo_grande_{nombre}.bin", "rb") as f:
+        print(f"  ✓ {nombre} descifra el sobre: {f.read() == datos_grandes}")
+
+print("\n[2.7] Caché de claves RSA ya parseadas")
+print("-" * 70)
+clear_key_cache()
+start = time.perf_counter()
+load_private_key(priv_bob)
+time_import = time.perf_counter() - start
+start = time.perf_counter()
+clave_cacheada = load_private_key(priv_bob)
+time_cached = time.perf_counter() - start
+info = key_cache_info()
+print(f"  ✓ Primera carga (PEM + ASN.1): {time_import*1000:.3f} ms")
+print(f"  ✓ Segunda carga (caché): {time_cached*1000:.3f} ms")
+print(f"  ✓ Hits: {info['hits']} | Misses: {info['misses']} | Misma clave: {clave_cacheada is load_private_key(priv_bob)}")
+
+print("\n[2.8] Pool de claves RSA pregeneradas (reposición y spool)")
+print("-" * 70)
+import shutil
+from keypool import RSAKeyPool
+shutil.rmtree("tests/spool_claves", ignore_errors=True)
+clave_spool = generate_aes_key(256)
+with RSAKeyPool(bits=1024, target_depth=2, workers=2,
+                spool_dir="tests/spool_claves", spool_key=clave_spool) as pool:
+    limite = time.monotonic() + 60
+    while pool.stats()["depth"] < 2 and time.monotonic() < limite:
+        time.sleep(0.05)
+    priv_pool, pub_pool = pool.get_keypair()
+    print(f"  ✓ Par entregado desde el pool: {load_private_key(priv_pool).publickey().export_key() == pub_pool}")
+    while pool.stats()["depth"] < 2 and time.monotonic() < limite:
+        time.sleep(0.05)
+    stats_pool = pool.stats()
+    print(f"  ✓ Pool repuesto hasta target_depth: {stats_pool['depth'] == 2} "
+          f"(generados: {stats_pool['generated']}, servidos: {stats_pool['served']})")
+archivos_spool = sorted(os.listdir("tests/spool_claves"))
+print(f"  ✓ Claves restantes persistidas en el spool: {len(archivos_spool) == 2}")
+
+# Dos pools (como dos procesos) cargan el mismo spool: cada clave sale una sola vez
+pool_a = RSAKeyPool(bits=1024, spool_dir="tests/spool_claves", spool_key=clave_spool)
+pool_b = RSAKeyPool(bits=1024, spool_dir="tests/spool_claves", spool_key=clave_spool)
+entregadas_a = {pool_a.get_keypair()[0] for _ in range(2)}
+priv_b, _ = pool_b.get_keypair()
+print(f"  ✓ Claves del spool recuperadas tras reiniciar: {pool_a.stats()['served'] == 2}")
+print(f"  ✓ Ninguna clave entregada dos veces: {priv_b not in entregadas_a and priv_pool not in entregadas_a} "
+      f"(el segundo pool generó una nueva: {pool_b.stats()['misses'] == 1})")
+print(f"  ✓ Spool vacío tras entregarlas: {os.listdir('tests/spool_claves') == []}")
+
+# Una clave que otro proceso consume entre scandir y open se salta sin error
+from keypool import SPOOL_SUFFIX
+with open(os.path.join("tests/spool_claves", "consumida" + SPOOL_SUFFIX), "wb") as f:
+    f.write(os.urandom(64))
+scandir_original = os.scandir
+def scandir_con_carrera(path):
+    entradas = list(scandir_original(path))
+    for entrada in entradas:
+        os.remove(entrada.path)
+    return iter(entradas)
+os.scandir = scandir_con_carrera
+try:
+    pool_c = RSAKeyPool(bits=1024, spool_dir="tests/spool_claves", spool_key=clave_spool)
+    print(f"  ✓ Clave desaparecida del spool ignorada al cargar: {pool_c.stats()['depth'] == 0}")
+except FileNotFoundError:
+    print("  ✗ FileNotFoundError al cargar el spool")
+finally:
+    os.scandir = scandir_original
+
 # ========================
 # PARTE 3: FIRMA DIGITAL
 # ========================
@@ -220,9 +481,9 @@ documento = b"Contrato de compra-venta: Alice vende a Bob su casa por $100,000"
 priv_alice = load_private_key(priv_pem)
 pub_alice = load_public_key(pub_pem)
 
-start = time.time()
+start = time.perf_counter()
 firma = sign_message(documento, priv_alice)
-time_sign = time.time() - start
+time_sign = time.perf_counter() - start
 
 print(f"  ✓ Documento: '{documento.decode()}'")
 print(f"  ✓ Firma generada en {time_sign*1000:.2f} ms")
@@ -230,9 +491,9 @@ print(f"  ✓ Firma ({len(firma)} bytes): {firma[:32].hex()}...")
 
 print("\n[3.2] Verificación de firma válida")
 print("-" * 70)
-start = time.time()
+start = time.perf_counter()
 es_valida = verify_signature(documento, firma, pub_alice)
-time_verify = time.time() - start
+time_verify = time.perf_counter() - start
 
 print(f"  ✓ Verificación completada en {time_verify*1000:.2f} ms")
 print(f"  ✓ Firma válida: {es_valida}")
@@ -255,6 +516,44 @@ print("  ✓ Integridad: Detecta cualquier modificación")
 print("  ✓ No repudio: El firmante no puede negar haberlo firmado")
 print("  ✓ Uso en PKI: Certificados digitales, SSL/TLS, emails firmados")
 
+print("\n[3.5] Contexto reutilizable por clave y operaciones por lotes")
+print("-" * 70)
+ctx_alice = RsaKeyContext(priv_pem)
+ctx_alice_pub = RsaKeyContext(pub_pem)
+lote = [f"Registro {i}".encode() for i in range(20)]
+
+start = time.perf_counter()
+firmas_lote = ctx_alice.sign_batch(lote)
+time_batch = time.perf_counter() - start
+print(f"  ✓ {len(lote)} firmas en lote: {time_batch*1000:.2f} ms")
+print(f"  ✓ Todas verifican: {all(ctx_alice_pub.verify_batch(lote, firmas_lote))}")
+
+claves_sesion = [generate_aes_key(256) for _ in range(20)]
+envueltas = ctx_alice_pub.encrypt_batch(claves_sesion)
+print(f"  ✓ {len(envueltas)} claves de sesión envueltas y recuperadas: {ctx_alice.decrypt_batch(envueltas) == claves_sesion}")
+
+print("\n[3.6] Verificación de firmas por lotes")
+print("-" * 70)
+registros = [(m, f, "alice") for m, f in zip(lote, firmas_lote)]
+registros[3] = (b"Registro alterado", firmas_lote[3], "alice")
+registros.append((b"Firmado por Bob", sign_message(b"Firmado por Bob", load_private_key(priv_bob)), "bob"))
+registros.append((b"Clave desconocida", firmas_lote[0], "eve"))
+# Elementos mal formados: cada uno da su motivo sin abortar el lote
+registros += [(b"Sin firma",), None, (12345, firmas_lote[0], "alice"), (lote[0], firmas_lote[0], ["alice"])]
+# workers=1: este script no tiene guarda __main__ (necesaria para procesos en Windows)
+resultado = verify_signatures_batch(registros, {"alice": pub_pem, "bob": pub_bob}, workers=1)
+print(f"  ✓ Verificadas: {resultado['total']} | Válidas: {resultado['valid_count']}")
+print(f"  ✓ Fallos detectados sin excepciones: {resultado['errors']}")
+print(f"  ✓ Elementos inválidos con su motivo: "
+      f"{all(i in resultado['errors'] for i in range(len(registros) - 4, len(registros)))}")
+
+print("\n[3.7] Firma de archivos grandes por streaming")
+print("-" * 70)
+firma_archivo = sign_file("tests/archivo_grande.bin", priv_alice)
+print(f"  ✓ Firma del archivo válida: {verify_file('tests/archivo_grande.bin', firma_archivo, pub_alice)}")
+print(f"  ✓ Verificable también con mmap: {verify_file('tests/archivo_grande.bin', firma_archivo, pub_alice, use_mmap=True)}")
+print(f"  ✓ Equivale a firmar el contenido completo: {verify_signature(datos_grandes, firma_archivo, pub_alice)}")
+
 # ========================
 # PARTE 4: FUNCIONES HASH Y VERIFICACIÓN DE INTEGRIDAD
 # ========================
@@ -268,6 +567,13 @@ print("-" * 70)
 hash_original = calculate_file_hash("tests/documento_secreto.txt")
 print(f"  ✓ Hash del documento original:")
 print(f"    {hash_original}")
+tipos_error = []
+for argumentos in (("tests/no_existe.txt",), ("tests/documento_secreto.txt", "md5")):
+    try:
+        calculate_file_hash(*argumentos)
+    except Exception as e:
+        tipos_error.append(type(e).__name__)
+print(f"  ✓ Errores distinguibles (archivo / algoritmo): {tipos_error == ['FileNotFoundError', 'ValueError']}")
 
 print("\n[4.2] Registro de archivos en base de datos de integridad")
 print("-" * 70)
@@ -354,6 +660,318 @@ print(f"  • '{msg1.decode()}' → {hash1}")
 print(f"  • '{msg2.decode()}' → {hash2}")
 print(f"  • Hashes completamente diferentes con cambio mínimo")
 
+print("\n[4.8] Verificación incremental (stat) y modo paranoico")
+print("-" * 70)
+incrementales = verify_all_files("tests/integrity_db.json", incremental=True)
+saltados = sum(1 for res in incrementales if res["skipped"])
+print(f"  ✓ Archivos sin rehashear por stat idéntico: {saltados} de {len(incrementales)}")
+paranoicos = verify_all_files("tests/integrity_db.json", incremental=True, paranoid=True)
+print(f"  ✓ Modo paranoico rehashea todo: {not any(res['skipped'] for res in paranoicos)}")
+
+print("\n[4.9] Base de datos de hashes en SQLite (migración desde JSON)")
+print("-" * 70)
+if os.path.exists("tests/integrity_db.sqlite"):
+    os.remove("tests/integrity_db.sqlite")
+migradas = migrate_json_to_sqlite("tests/integrity_db.json", "tests/integrity_db.sqlite")
+print(f"  ✓ Entradas migradas: {migradas}")
+register_file("tests/documento_copia.txt", "tests/integrity_db.sqlite")
+res_sqlite = verify_file_integrity("tests/documento_copia.txt", "tests/integrity_db.sqlite")
+print(f"  ✓ Registro y verificación sobre SQLite: {res_sqlite['valid']}")
+with open_hash_database("tests/integrity_db.sqlite") as db:
+    print(f"  ✓ Entradas en SQLite: {len(db)}")
+print(f"  ✓ verify_all_files sobre SQLite: {all(r['valid'] for r in verify_all_files('tests/integrity_db.sqlite'))}")
+
+from hashdb import HashDatabase
+class BackendIncompleto(HashDatabase):
+    def get(self, filepath):
+        return None
+try:
+    BackendIncompleto()
+    rechazado = False
+except TypeError:
+    rechazado = True
+print(f"  ✓ Backend incompleto rechazado al crearlo: {rechazado}")
+if os.name == "posix":
+    os.chmod("tests/integrity_db.json", 0o644)
+    register_file("tests/documento_copia.txt", "tests/integrity_db.json")
+    print(f"  ✓ Reescritura atómica conserva los permisos (0644): "
+          f"{os.stat('tests/integrity_db.json').st_mode & 0o777 == 0o644}")
+
+print("\n[4.10] Registro masivo en paralelo (una sola escritura)")
+print("-" * 70)
+os.makedirs("tests/lote_integridad/sub", exist_ok=True)
+for i in range(25):
+    with open(f"tests/lote_integridad/{'sub/' if i % 2 else ''}archivo_{i}.bin", "wb") as f:
+        f.write(os.urandom(1000 * (i + 1)))
+resumen = register_files("tests/lote_integridad", "tests/integrity_lote.sqlite", workers=4)
+print(f"  ✓ Registrados: {resumen['files']} archivos ({resumen['bytes']} bytes)")
+print(f"  ✓ Rendimiento: {resumen['files_per_s']:.0f} archivos/s, {resumen['mb_per_s']:.1f} MB/s")
+print(f"  ✓ Todos verifican: {all(r['valid'] for r in verify_all_files('tests/integrity_lote.sqlite'))}")
+
+print("\n[4.11] Verificación en paralelo con resultados en streaming")
+print("-" * 70)
+with open("tests/lote_integridad/archivo_0.bin", "ab") as f:
+    f.write(b"alterado")
+resultados = list(iter_verify_files("tests/integrity_lote.sqlite", workers=4,
+                                    max_inflight_bytes=20000))
+print(f"  ✓ Resultados recibidos: {len(resultados)} de {resumen['files']}")
+print(f"  ✓ Modificados detectados: {[os.path.basename(r['filepath']) for r in resultados if not r['valid']]}")
+ordenados = [r["filepath"] for r in verify_all_files("tests/integrity_lote.sqlite", workers=4)]
+print(f"  ✓ verify_all_files mantiene el orden de la base: {ordenados == sorted(ordenados)}")
+
+print("\n[4.12] Motor de hasheo (readinto / mmap)")
+print("-" * 70)
+with open("tests/archivo_grande.bin", "wb") as f:
+    f.write(datos_grandes)
+hash_referencia = sha256_hex(datos_grandes)
+print(f"  ✓ readinto == SHA-256 en memoria: {hash_file('tests/archivo_grande.bin', use_mmap=False).hexdigest() == hash_referencia}")
+print(f"  ✓ mmap == SHA-256 en memoria: {hash_file('tests/archivo_grande.bin', use_mmap=True).hexdigest() == hash_referencia}")
+print(f"  ✓ Bloque pequeño (4 KiB): {hash_file('tests/archivo_grande.bin', block_size=4096).hexdigest() == hash_referencia}")
+
+print("\n[4.13] Algoritmos de hash y modo árbol (Merkle)")
+print("-" * 70)
+for algoritmo in sorted(HASH_ALGORITHMS):
+    inicio = time.perf_counter()
+    coincide = calculate_file_hash("tests/archivo_grande.bin", algoritmo) == hash_hex(datos_grandes, algoritmo)
+    print(f"  ✓ {algoritmo:<9} {(time.perf_counter() - inicio) * 1000:6.2f} ms  coincide: {coincide}")
+register_file("tests/archivo_grande.bin", "tests/integrity_merkle.json",
+              algorithm="blake2b", merkle=True, leaf_size=32 * 1024)
+with open("tests/archivo_grande.bin", "r+b") as f:
+    f.seek(100_000)
+    f.write(b"cambio")
+res_merkle = verify_file_integrity("tests/archivo_grande.bin", "tests/integrity_merkle.json")
+print(f"  ✓ Modificación detectada: {not res_merkle['valid']}")
+print(f"  ✓ Rangos modificados: {res_merkle['changed_ranges']}")
+from hashutils import merkle_leaves
+print(f"  ✓ Hojas leídas con pread == hojas desde mmap: "
+      f"{merkle_leaves('tests/archivo_grande.bin', leaf_size=32 * 1024) == merkle_leaves('tests/archivo_grande.bin', leaf_size=32 * 1024, use_mmap=True)}")
+with open("tests/archivo_grande.bin", "wb") as f:
+    f.write(datos_grandes)
+
+print("\n[4.14] Búsqueda de duplicados (tamaño → hash parcial → hash completo)")
+print("-" * 70)
+os.makedirs("tests/duplicados/sub", exist_ok=True)
+for ruta in ("tests/duplicados/a.bin", "tests/duplicados/sub/b.bin"):
+    with open(ruta, "wb") as f:
+        f.write(datos_grandes)
+casi_igual = bytearray(datos_grandes)
+casi_igual[len(casi_igual) // 2] ^= 1  # misma cabecera y cola, distinto en medio
+with open("tests/duplicados/casi_igual.bin", "wb") as f:
+    f.write(casi_igual)
+with open("tests/duplicados/unico.txt", "w") as f:
+    f.write("sin pareja")
+grupos = find_duplicates("tests/duplicados")
+print(f"  ✓ Grupos encontrados: {[[os.path.basename(p) for p in g] for g in grupos]}")
+with open_hash_database("tests/integrity_lote.sqlite") as db:
+    print(f"  ✓ Índice inverso (hash → rutas): {len(db.find_by_hash(resultados[1]['original_hash']))} ruta(s)")
+
+print("\n[4.15] Monitorización continua (watcher)")
+print("-" * 70)
+from watcher import IntegrityMonitor, inotify_available
+
+def recoger_eventos(monitor, espera=2.0):
+    eventos = []
+    limite = time.time() + espera
+    while time.time() < limite:
+        try:
+            eventos.append(monitor.events.get(timeout=0.2))
+        except Exception:
+            if eventos:
+                break
+    return eventos
+
+backends = ["polling"] + (["inotify"] if inotify_available() else [])
+for backend in backends:
+    register_files("tests/lote_integridad", "tests/integrity_watch.sqlite")
+    with IntegrityMonitor("tests/integrity_watch.sqlite", debounce=0.1, backend=backend) as monitor:
+        time.sleep(0.2)
+        with open("tests/lote_integridad/archivo_2.bin", "ab") as f:
+            f.write(b"cambio")
+        os.remove("tests/lote_integridad/archivo_4.bin")
+        eventos = recoger_eventos(monitor)
+    print(f"  ✓ {backend}: {sorted((e['event'], os.path.basename(e['path'])) for e in eventos)}")
+    with open("tests/lote_integridad/archivo_4.bin", "wb") as f:
+        f.write(os.urandom(5000))
+
+# Sin fichas para rehashear, el bucle espera a la siguiente en vez de girar con timeout 0
+limitado = IntegrityMonitor("tests/integrity_watch.sqlite", max_rehash_per_s=2)
+limitado._pending["tests/lote_integridad/archivo_1.bin"] = (time.monotonic() - 1, None)
+limitado._tokens = 0.0
+limitado._last_refill = time.monotonic()
+print(f"  ✓ Espera con el límite de rehasheos agotado: {0.3 < limitado._next_timeout() <= 0.5}")
+try:
+    IntegrityMonitor("tests/integrity_watch.sqlite", max_rehash_per_s=0)
+    print("  ✗ Se aceptó un límite de 0 rehasheos por segundo")
+except ValueError:
+    print("  ✓ Límite de 0 rehasheos por segundo rechazado")
+
+print("\n[4.16] Fachada asyncio (executor, cancelación, contrapresión)")
+print("-" * 70)
+import asyncio
+import threading
+from asynccrypto import AsyncCrypto
+
+class EscritorMemoria:
+    def __init__(self):
+        self.datos = bytearray()
+    def write(self, datos):
+        self.datos += datos
+    async def drain(self):
+        pass
+
+async def prueba_async():
+    crypto = AsyncCrypto(limits={"hash": 2}, chunk_size=32 * 1024)
+    hashes = await asyncio.gather(*(crypto.calculate_file_hash("tests/archivo_grande.bin") for _ in range(4)))
+    print(f"  ✓ 4 hashes concurrentes correctos: {set(hashes) == {sha256_hex(datos_grandes)}}")
+    await crypto.encrypt_file_gcm("tests/archivo_grande.bin", "tests/archivo_async.enc", key_stream)
+    print(f"  ✓ Compatible con decrypt_file_gcm: "
+          f"{decrypt_file_gcm('tests/archivo_async.enc', 'tests/archivo_async.dec', key_stream)}")
+    # Entrada por una FIFO que no llega a EOF hasta después de cancelar: el
+    # hilo de trabajo está a mitad del archivo cuando recibe el aviso
+    os.mkfifo("tests/entrada_fifo")
+    seguir = threading.Event()
+    def alimentar():
+        with open("tests/entrada_fifo", "wb") as fifo:
+            fifo.write(datos_grandes[:64 * 1024])
+            fifo.flush()
+            seguir.wait()
+            try:
+                fifo.write(datos_grandes[64 * 1024:])
+            except BrokenPipeError:
+                pass  # el hilo de trabajo ya abandonó la lectura
+    alimentador = threading.Thread(target=alimentar)
+    alimentador.start()
+    tarea = asyncio.create_task(crypto.encrypt_file_gcm("tests/entrada_fifo", "tests/archivo_cancelado.enc", key_stream))
+    await asyncio.sleep(0.05)
+    tarea.cancel()
+    seguir.set()
+    try:
+        await tarea
+        cancelada = False
+    except asyncio.CancelledError:
+        cancelada = True
+    alimentador.join()
+    os.remove("tests/entrada_fifo")
+    print(f"  ✓ Cancelada sin dejar salida: {cancelada and not os.path.exists('tests/archivo_cancelado.enc')}")
+    # Cancelación que llega cuando el trabajo ya terminó: se devuelve el resultado
+    tarea = asyncio.create_task(crypto.encrypt_file_gcm("tests/documento_secreto.txt", "tests/archivo_tardio.enc", key_stream))
+    await asyncio.sleep(0)
+    while not os.path.exists("tests/archivo_tardio.enc"):
+        time.sleep(0.01)  # bloquea el bucle: la tarea no se entera de que terminó
+    tarea.cancel()
+    try:
+        resultado = await tarea
+    except asyncio.CancelledError:
+        resultado = None
+    ok_tardio = resultado is not None and decrypt_file_gcm("tests/archivo_tardio.enc", "tests/archivo_tardio.txt", key_stream)
+    print(f"  ✓ Cancelación tardía devuelve el resultado: {ok_tardio}")
+    lector = asyncio.StreamReader()
+    lector.feed_data(datos_grandes)
+    lector.feed_eof()
+    cifrado = EscritorMemoria()
+    await crypto.encrypt_stream_gcm(lector, cifrado, key_stream)
+    lector = asyncio.StreamReader()
+    lector.feed_data(bytes(cifrado.datos))
+    lector.feed_eof()
+    descifrado = EscritorMemoria()
+    await crypto.decrypt_stream_gcm(lector, descifrado, key_stream)
+    print(f"  ✓ Flujo asyncio cifrado/descifrado: {bytes(descifrado.datos) == datos_grandes}")
+
+asyncio.run(prueba_async())
+
+print("\n[4.17] Callbacks de progreso e interrupción")
+print("-" * 70)
+avances = []
+encrypt_file_gcm("tests/archivo_grande.bin", "tests/archivo_progreso.enc", key_stream, progress=avances.append)
+print(f"  ✓ Avisos de progreso: {len(avances)} (último = tamaño: {avances[-1] == len(datos_grandes)})")
+
+def interrumpir(hechos):
+    if hechos > 100_000:
+        raise KeyboardInterrupt
+try:
+    decrypt_file_gcm("tests/archivo_progreso.enc", "tests/archivo_interrumpido.bin", key_stream, progress=interrumpir)
+except KeyboardInterrupt:
+    pass
+print(f"  ✓ Interrumpido sin dejar salida: {not os.path.exists('tests/archivo_interrumpido.bin')}")
+
+print("\n[4.18] Línea de comandos (lotes y JSON)")
+print("-" * 70)
+import io
+import json
+from contextlib import redirect_stdout
+from cli import main as cli_main
+
+with open("tests/cli_clave.hex", "w") as f:
+    f.write(key_stream.hex())
+salida = io.StringIO()
+with redirect_stdout(salida):
+    codigo = cli_main(["aes", "encrypt", "tests/archivo_grande.bin", "tests/documento_copia.txt",
+                       "--key", "tests/cli_clave.hex", "--output-dir", "tests/cli_out",
+                       "--workers", "2", "--json"])
+resultado = json.loads(salida.getvalue())
+print(f"  ✓ Lote cifrado: código {codigo}, {resultado['count']} archivos, ok={resultado['ok']}")
+
+with redirect_stdout(io.StringIO()):
+    codigo = cli_main(["aes", "decrypt", "tests/cli_out/archivo_grande.bin.enc",
+                       "--key", "tests/cli_clave.hex", "-o", "tests/cli_out/archivo_grande.bin"])
+with open("tests/cli_out/archivo_grande.bin", "rb") as f:
+    print(f"  ✓ Descifrado por CLI idéntico: {codigo == 0 and f.read() == datos_grandes}")
+
+with redirect_stdout(io.StringIO()):
+    cli_main(["sign", "tests/documento_copia.txt", "--private", "tests/bob_private.pem"])
+    codigo = cli_main(["verify-sig", "tests/documento_copia.txt", "--public", "tests/alice_public.pem"])
+print(f"  ✓ Firma con otra clave rechazada (código 1): {codigo == 1}")
+
+# hashutils.main delega en cli: una sola interfaz (también con --db delante, como antes)
+from hashutils import main as hashutils_main
+with open("tests/cli_out/copia_doc.txt", "wb") as f, open("tests/documento_copia.txt", "rb") as g:
+    f.write(g.read())
+salida = io.StringIO()
+with redirect_stdout(salida):
+    hashutils_main(["--db", "tests/cli_integridad.json", "register", "tests/cli_out"])
+    cli_main(["migrate", "tests/cli_integridad.json", "tests/cli_integridad.sqlite"])
+    codigo = cli_main(["verify", "--db", "tests/cli_integridad.sqlite", "--incremental", "--sample", "1"])
+    salida = io.StringIO()
+    with redirect_stdout(salida):
+        cli_main(["duplicates", "tests/cli_out/copia_doc.txt", "tests/documento_copia.txt", "--json"])
+grupos = [r["duplicates"] for r in json.loads(salida.getvalue())["results"]]
+print(f"  ✓ register/migrate/verify --sample/duplicates por la misma CLI: {codigo == 0 and len(grupos) == 1}")
+from cli import build_parser, cmd_watch
+from contextlib import redirect_stderr
+from watcher import main as watcher_main
+opciones = build_parser().parse_args(["watch", "--db", "tests/integrity_watch.sqlite", "--rate", "5"])
+print(f"  ✓ watch en la CLI: {opciones.func is cmd_watch and opciones.rate == 5.0}")
+try:
+    with redirect_stderr(io.StringIO()):
+        watcher_main(["--db", "tests/integrity_watch.sqlite", "--rate", "0"])
+    print("  ✗ watcher.py aceptó --rate 0")
+except SystemExit as e:
+    print(f"  ✓ watcher.py delega en la CLI y rechaza --rate 0: {e.code == 2}")
+
+print("\n[4.19] Métricas por operación y fase")
+print("-" * 70)
+import metrics
+metrics.reset()
+metrics.enable()
+encrypt_file_gcm("tests/archivo_grande.bin", "tests/archivo_metricas.enc", key_stream)
+sign_file("tests/archivo_grande.bin", priv_bob)
+try:
+    decrypt_path_hybrid("tests/archivo_grande.bin", "tests/archivo_metricas.bin", priv_bob)
+except ValueError:
+    pass
+# decrypt_file_gcm captura el fallo de autenticación y devuelve False: también cuenta
+decrypt_file_gcm("tests/archivo_metricas.enc", "tests/archivo_metricas.bin", key_256)
+metrics.disable()
+instantanea = metrics.snapshot()
+gcm = instantanea["aescipher.encrypt_file_gcm"]
+print(f"  ✓ Bytes contados: {gcm['bytes'] == len(datos_grandes)}")
+print(f"  ✓ Fases separadas: {gcm['phases']['io_read'] > 0 and gcm['phases']['compute'] > 0}")
+print(f"  ✓ Firma contada con su hash: {instantanea['rsautils.sign_file']['bytes'] == len(datos_grandes)}")
+print(f"  ✓ Fallo registrado: {instantanea['hybrid.decrypt_path_hybrid']['errors'] == 1}")
+print(f"  ✓ Descifrado que devuelve False registrado como fallo: "
+      f"{instantanea['aescipher.decrypt_file_gcm']['errors'] == 1}")
+print(f"  ✓ Exportación Prometheus: {'crypto_operations_total' in metrics.to_prometheus()}")
+
 # ========================
 # RESUMEN FINAL
 # ========================
@@ -0,0 +1,393 @@
+# watcher.py
+"""
+Monitorización continua de integridad.
+
+Vigila los archivos registrados en la base de datos de hashes y rehashea
+solo los que cambian. Emite eventos:
+
+    {"event": "changed", "path": ruta, "result": resultado de verify_entry}
+    {"event": "deleted", "path": ruta}
+    {"event": "moved",   "path": origen, "dest": destino, "result": ...}
+    {"event": "overflow"}   (el kernel perdió eventos; se revisa todo por stat)
+
+Backends:
+- InotifyWatcher (Linux, vía ctypes): un watch por directorio, no por
+  archivo, así que 100k archivos en unos pocos miles de directorios caben en
+  el límite por defecto de inotify. No hay barridos periódicos.
+- PollingWatcher (cualquier sistema): comprueba el stat de `batch` archivos
+  por ciclo en turno rotatorio; nunca rehashea sin un cambio de stat. No
+  detecta movimientos (los informa como borrados).
+
+Uso:
+    with IntegrityMonitor("hash_database.db", on_event=print):
+        ...
+
+o desde la línea de comandos: python -m crypto_project watch --db hash_database.db
+"""
+import ctypes
+import ctypes.util
+import errno
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+import time
+
+from hashdb import open_hash_database
+from hashutils import verify_entry
+
+DEBOUNCE_SECONDS = 0.5
+MAX_REHASH_PER_SECOND = 50.0
+
+# ========== BACKEND INOTIFY ==========
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+
+_EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+def inotify_available() -> bool:
+    return sys.platform.startswith("linux") and ctypes.util.find_library("c") is not None
+
+class InotifyWatcher:
+    """
+    Fuente de eventos basada en inotify.
+
+    Args:
+        paths: Rutas de archivos a vigilar
+    """
+
+    def __init__(self, paths):
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        self._add_watch = libc.inotify_add_watch
+        self._add_watch.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 falló")
+
+        self._dirs = {}   # wd -> directorio
+        self._files = {}  # directorio -> nombres vigilados
+        for path in paths:
+            directory, name = os.path.split(os.path.abspath(path))
+            self._files.setdefault(directory, set()).add(name)
+        self._abs = {os.path.abspath(p): p for p in paths}
+        for directory in self._files:
+            wd = self._add_watch(self._fd, os.fsencode(directory), WATCH_MASK)
+            if wd < 0:
+                err = ctypes.get_errno()
+                if err == errno.ENOSPC:
+                    os.close(self._fd)
+                    raise OSError(err, "Límite de watches de inotify alcanzado "
+                                       "(fs.inotify.max_user_watches)")
+                continue  # directorio ya inexistente: sus archivos se darán por borrados
+            self._dirs[wd] = directory
+
+    def missing(self) -> list:
+        """Archivos cuyo directorio no se pudo vigilar."""
+        watched = set(self._dirs.values())
+        return [self._abs[os.path.join(d, n)] for d, names in self._files.items()
+                if d not in watched for n in names]
+
+    def read(self, timeout: float) -> list:
+        """
+        Espera eventos hasta `timeout` segundos.
+
+        Returns:
+            list: Tuplas (tipo, ruta, destino) con tipo en
+                "modified", "deleted", "moved", "overflow"
+        """
+        ready, _, _ = select.select([self._fd], [], [], timeout)
+        if not ready:
+            return []
+        try:
+            data = os.read(self._fd, 64 * 1024)
+        except BlockingIOError:
+            return []
+
+        events = []
+        moved_from = {}  # cookie -> ruta de origen
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+            offset += length
+
+            if mask & IN_Q_OVERFLOW:
+                events.append(("overflow", None, None))
+                continue
+            directory = self._dirs.get(wd)
+            if directory is None:
+                continue
+            if mask & (IN_DELETE_SELF | IN_MOVE_SELF | IN_IGNORED):
+                # Desaparece el directorio entero
+                for file_name in self._files.get(directory, ()):
+                    events.append(("deleted", self._abs[os.path.join(directory, file_name)], None))
+                if mask & IN_IGNORED:
+                    del self._dirs[wd]
+                continue
+
+            full = os.path.join(directory, name)
+            path = self._abs.get(full)
+            if mask & IN_MOVED_FROM:
+                if path is not None:
+                    moved_from[cookie] = path
+            elif mask & IN_MOVED_TO:
+                source = moved_from.pop(cookie, None)
+                if source is not None:
+                    events.append(("moved", source, full))
+                if path is not None:
+                    # Guardado atómico (temporal + renombrado) sobre un archivo vigilado
+                    events.append(("modified", path, None))
+            elif mask & IN_DELETE:
+                if path is not None:
+                    events.append(("deleted", path, None))
+            elif path is not None:
+                events.append(("modified", path, None))
+
+        # Movidos fuera de los directorios vigilados: para nosotros, borrados
+        for source in moved_from.values():
+            events.append(("deleted", source, None))
+        return events
+
+    def close(self):
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+# ========== BACKEND POR SONDEO ==========
+
+class PollingWatcher:
+    """
+    Fuente de eventos por sondeo de stat, sin dependencias del sistema.
+
+    Args:
+        paths: Rutas de archivos a vigilar
+        baseline: {ruta: entrada} con los campos de stat registrados (opcional)
+        batch: Archivos comprobados por llamada a read()
+    """
+
+    def __init__(self, paths, baseline: dict = None, batch: int = 1000):
+        self._paths = list(paths)
+        self._batch = max(1, batch)
+        self._cursor = 0
+        self._known = {}
+        baseline = baseline or {}
+        for path in self._paths:
+            entry = baseline.get(path, {})
+            if "mtime_ns" in entry:
+                # Partiendo del stat registrado, lo que cambió con el monitor parado también se detecta
+                self._known[path] = (entry["size"], entry["mtime_ns"], entry["inode"])
+            else:
+                self._known[path] = self._stat(path)
+
+    @staticmethod
+    def _stat(path):
+        try:
+            st = os.stat(path)
+        except OSError:
+            return None
+        return (st.st_size, st.st_mtime_ns, st.st_ino)
+
+    def missing(self) -> list:
+        return []  # los ausentes se detectan en el primer ciclo
+
+    def read(self, timeout: float) -> list:
+        events = []
+        count = min(self._batch, len(self._paths))
+        for _ in range(count):
+            path = self._paths[self._cursor]
+            self._cursor = (self._cursor + 1) % len(self._paths)
+            current = self._stat(path)
+            if current == self._known[path]:
+                continue
+            self._known[path] = current
+            events.append(("deleted" if current is None else "modified", path, None))
+        if not events:
+            time.sleep(timeout)
+        return events
+
+    def close(self):
+        pass
+
+# ========== MONITOR ==========
+
+class IntegrityMonitor:
+    """
+    Demonio de verificación continua sobre una base de datos de hashes.
+
+    Args:
+        db_file: Base de datos de integridad (JSON o SQLite)
+        on_event: Callback on_event(evento). Si se omite, los eventos se
+            encolan en `self.events` (queue.Queue)
+        debounce: Segundos sin actividad antes de rehashear un archivo
+        max_rehash_per_s: Límite de rehasheos por segundo (cubo de fichas);
+            debe ser positivo
+        backend: "auto", "inotify" o "polling"
+        poll_batch: Archivos por ciclo en el backend de sondeo
+    """
+
+    def __init__(self, db_file: str, on_event=None, debounce: float = DEBOUNCE_SECONDS,
+                 max_rehash_per_s: float = MAX_REHASH_PER_SECOND, backend: str = "auto",
+                 poll_batch: int = 1000):
+        if backend not in ("auto", "inotify", "polling"):
+            raise ValueError(f"Backend no soportado: {backend}")
+        if not max_rehash_per_s > 0:
+            # Con 0 las fichas nunca se reponen y los cambios pendientes no se procesarían
+            raise ValueError(f"max_rehash_per_s debe ser positivo: {max_rehash_per_s}")
+        self.db_file = db_file
+        self.events = queue.Queue()
+        self._emit = on_event or self.events.put
+        self.debounce = debounce
+        self.max_rehash_per_s = max_rehash_per_s
+        self.backend = backend
+        self.poll_batch = poll_batch
+
+        self._db = None
+        self._watcher = None
+        self._thread = None
+        self._stop = threading.Event()
+        self._pending = {}  # ruta -> (instante a partir del cual procesar, destino si es un movimiento)
+        self._tokens = max(1.0, max_rehash_per_s)
+        self._last_refill = time.monotonic()
+
+    # --- Ciclo de vida ---
+    def start(self):
+        """Abre la base de datos, instala los watches y arranca el hilo del monitor."""
+        self._db = open_hash_database(self.db_file)
+        if self.backend == "inotify" or (self.backend == "auto" and inotify_available()):
+            self._watcher = InotifyWatcher([path for path, _ in self._db.items()])
+        else:
+            baseline = dict(self._db.items())
+            self._watcher = PollingWatcher(list(baseline), baseline, self.poll_batch)
+        for path in self._watcher.missing():
+            self._schedule(path, None, time.monotonic())
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="integrity-monitor", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if self._watcher is not None:
+            self._watcher.close()
+            self._watcher = None
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def run_forever(self):
+        """Arranca y bloquea hasta Ctrl+C."""
+        self.start()
+        try:
+            while self._thread.is_alive():
+                self._thread.join(0.5)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    # --- Bucle principal ---
+    def _run(self):
+        while not self._stop.is_set():
+            timeout = self._next_timeout()
+            for kind, path, dest in self._watcher.read(timeout):
+                if kind == "overflow":
+                    self._emit({"event": "overflow"})
+                    # Se perdieron eventos: todo a revisión (por stat, sin rehashear lo intacto)
+                    now = time.monotonic()
+                    for known_path, _ in self._db.items():
+                        self._schedule(known_path, None, now)
+                else:
+                    self._schedule(path, dest if kind == "moved" else None,
+                                   time.monotonic() + self.debounce)
+            self._process_due()
+
+    def _schedule(self, path, dest, when):
+        previous = self._pending.get(path)
+        # Un evento nuevo reinicia la espera; un movimiento no se olvida por un evento posterior
+        self._pending[path] = (when, dest or (previous[1] if previous else None))
+
+    def _next_timeout(self) -> float:
+        if not self._pending:
+            return 0.5
+        soonest = min(when for when, _ in self._pending.values())
+        wait = soonest - time.monotonic()
+        if wait <= 0:
+            self._refill_tokens()
+            if self._tokens < 1:
+                # Hay trabajo vencido pero sin fichas: esperar a la siguiente, no girar en vacío
+                return min(0.5, (1 - self._tokens) / self.max_rehash_per_s)
+        return min(0.5, max(0.0, wait))
+
+    def _refill_tokens(self):
+        now = time.monotonic()
+        burst = max(1.0, self.max_rehash_per_s)
+        self._tokens = min(burst, self._tokens + (now - self._last_refill) * self.max_rehash_per_s)
+        self._last_refill = now
+
+    def _process_due(self):
+        now = time.monotonic()
+        due = sorted((when, path) for path, (when, _) in self._pending.items() if when <= now)
+        for _, path in due:
+            self._refill_tokens()
+            if self._tokens < 1:
+                break  # el resto espera al siguiente ciclo
+            _, dest = self._pending.pop(path)
+            entry = self._db.get(path)
+            if entry is None:
+                continue
+            if dest is not None:
+                self._tokens -= 1
+                self._emit({"event": "moved", "path": path, "dest": dest,
+                            "result": verify_entry(dest, entry)})
+            elif not os.path.exists(path):
+                self._emit({"event": "deleted", "path": path})
+            else:
+                result = verify_entry(path, entry, incremental=True)
+                if not result["skipped"]:
+                    self._tokens -= 1
+                    self._emit({"event": "changed", "path": path, "result": result})
+
+# ========== LÍNEA DE COMANDOS ==========
+
+def main(argv=None):
+    """
+    Monitorización desde la línea de comandos. Delega en el subcomando watch
+    de cli, la única interfaz de línea de comandos:
+    `python watcher.py --db base.db` equivale a
+    `python -m crypto_project watch --db base.db`.
+    """
+    from cli import main as cli_main
+    argv = list(sys.argv[1:] if argv is None else argv)
+    return cli_main(["watch"] + argv)
+
+if __name__ == "__main__":
+    raise SystemExit(main())